@@ -3,12 +3,19 @@ from app import db
 
 class Comment(db.Model):
     __tablename__ = 'comments'
+    __table_args__ = (
+        # Keyset pagination of a thread: WHERE post_id = ? AND id > ? ORDER BY id
+        db.Index('ix_comments_post_id_id', 'post_id', 'id'),
+        # Profile pages: WHERE author = ? GROUP BY post_id ORDER BY post_id DESC
+        db.Index('ix_comments_author_post_id', 'author', 'post_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     post_id = db.Column(db.Integer, db.ForeignKey('posts.id'), nullable=False) # Links to posts.id
     author = db.Column(db.Text, nullable=False, index=True)
-    comment_date = db.Column(db.Text)
+    comment_date = db.Column(db.Text) # Source strings as scraped
     comment_time = db.Column(db.Text)
+    commented_at = db.Column(db.DateTime(timezone=True), index=True) # Parsed by backfill_timestamps.py
     comment_number = db.Column(db.Text)
     content = db.Column(db.Text, nullable=False)
 
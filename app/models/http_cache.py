@@ -0,0 +1,46 @@
+# app/models/http_cache.py
+import hashlib
+from functools import wraps
+
+from flask import current_app, request, session, make_response, get_flashed_messages
+
+from archive_version import read_archive_version
+
+def archive_etag():
+    """Strong ETag for the current URL at the current archive version."""
+    stamp = read_archive_version()
+    key = f"{stamp['version']}:{request.full_path}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def _set_validators(response, etag, stamp):
+    response.set_etag(etag)
+    if stamp['updated_at']:
+        response.last_modified = stamp['updated_at']
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config['HTTP_CACHE_MAX_AGE']
+    return response
+
+def conditional(view):
+    """Answers 304 Not Modified for pages the client already has at this archive version.
+
+    The check runs before the view, so revalidation never touches the database.
+    Pages showing flash messages are neither answered with 304 nor given validators.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if '_flashes' in session:
+            return view(*args, **kwargs)
+
+        stamp = read_archive_version()
+        etag = archive_etag()
+        not_modified = etag in request.if_none_match if request.if_none_match else (
+            stamp['updated_at'] is not None and request.if_modified_since is not None
+            and request.if_modified_since >= stamp['updated_at'])
+        if not_modified:
+            return _set_validators(make_response('', 304), etag, stamp)
+
+        response = make_response(view(*args, **kwargs))
+        if response.status_code == 200 and not get_flashed_messages():
+            _set_validators(response, etag, stamp)
+        return response
+    return wrapper
@@ -1,5 +1,6 @@
 # app/views/main.py
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, jsonify
+from datetime import date, datetime, time, timedelta
 from sqlalchemy import func, desc # Import desc for ordering
 from sqlalchemy import or_ # Import 'or_' for case-insensitive search if needed, though ILIKE handles it
 
@@ -9,7 +10,13 @@ from sqlalchemy import or_ # Import 'or_' for case-insensitive search if needed,
 from app.models.user_stats import UserStats
 from app.models.post import Post
 from app.models.comment import Comment
+from app.models.thread_leaderboard import ThreadLeaderboard
+from app.models.user_thread import UserThread
+from app.models.search import search_titles, search_comments, highlight_snippet
+from app.models.http_cache import conditional
+from app.models.page_cache import cached_page, get_page_cache
 from app import db # Import the database instance initialized in app/__init__.py
+from turkish_dates import SOURCE_TIMEZONE
 
 # --- Blueprint Definition ---
 # Create a Blueprint instance named 'main'.
@@ -19,9 +26,14 @@ from app import db # Import the database instance initialized in app/__init__.py
 # one level up from the current directory (views/), which is the app/templates/ folder.
 bp = Blueprint('main', __name__, template_folder='../templates')
 
+COMMENT_SEARCH_PAGE_SIZE = 50 # Comments per page on /search/comments
+MAX_YEAR = 9998 # ?year= bound; the whole year plus its next day must be a valid date
+
 # --- Route Definitions ---
 
 @bp.route('/')
+@conditional
+@cached_page
 def index():
     """Renders the homepage with top users and top threads."""
     top_users = []
@@ -37,23 +49,32 @@ def index():
         # top_users remains []
 
     try:
-        # Query top threads based on comment count - LIMIT to 25
+        # Read the top threads from the precomputed leaderboard (rank is its primary key)
         top_threads = db.session.query(
                 Post,
-                func.count(Comment.id).label('comment_count') # Count comments
-            ).join(Comment, Post.id == Comment.post_id)\
-            .group_by(Post.id)\
-            .order_by(desc('comment_count'))\
+                ThreadLeaderboard.comment_count
+            ).join(ThreadLeaderboard, Post.id == ThreadLeaderboard.post_id)\
+            .order_by(ThreadLeaderboard.rank)\
             .limit(LIST_LIMIT)\
-            .all() # Fetch all matching threads
-            # Note: Depending on your SQL dialect and strictness, you might need
-            # to add all non-aggregated Post columns to group_by:
-            # .group_by(Post.id, Post.title, Post.timestamp, Post.wayback_url, Post.original_url)
-
+            .all()
     except Exception as e:
-        print(f"Error fetching top threads: {e}")
-        flash("Could not retrieve most discussed threads at the moment.", "warning")
-        # top_threads remains []
+        print(f"Error reading thread leaderboard: {e}")
+        db.session.rollback() # Clear the failed transaction before falling back
+        top_threads = []
+
+    if not top_threads:
+        # Leaderboard not built yet (run rebuild_thread_leaderboard.py) - use the
+        # denormalized Post.comment_count column instead of aggregating comments
+        print("Thread leaderboard is empty, falling back to Post.comment_count.")
+        try:
+            top_threads = db.session.query(Post, Post.comment_count)\
+                .order_by(Post.comment_count.desc())\
+                .limit(LIST_LIMIT)\
+                .all()
+        except Exception as e:
+            print(f"Error fetching top threads: {e}")
+            flash("Could not retrieve most discussed threads at the moment.", "warning")
+            # top_threads remains []
 
 
     # Render the index.html template, passing the title, users, and threads
@@ -91,25 +112,51 @@ def search():
         return redirect(url_for('main.index'))
 
 @bp.route('/user/<username>')
-def user_profile(username):
-    """Displays the user profile page with their stats and participated threads."""
+@bp.route('/user/<username>/before/<int:before>')
+@conditional
+@cached_page
+def user_profile(username, before=None):
+    """Displays the user profile page with their stats and one page of participated threads.
+
+    Threads are listed newest first by post id; /before/<post_id> (or ?before=) is the
+    keyset cursor for the next page, so page N is the same index range scan as page 1.
+    url_for builds the path form, which the static export can serve as a file.
+    """
+    page_size = current_app.config['PROFILE_PAGE_SIZE']
+    if before is None:
+        before = request.args.get('before', None, type=int)
+
     try:
         # Fetch user statistics or return a 404 error if not found
         user_stats = UserStats.query.get_or_404(username)
 
-        # Query to get:
-        # 1. The Post object
-        # 2. The count of comments made by *this specific user* on that post
-        # It joins Post and Comment tables, filters by the username,
-        # groups by the Post to count comments per post, and orders the results.
-        threads_participated = db.session.query(
-                Post,
-                func.count(Comment.id).label('user_comment_count') # Count comments and label the result
-            ).join(Comment, Post.id == Comment.post_id)\
-            .filter(Comment.author == username)\
-            .group_by(Post.id)\
-            .order_by(desc(Post.timestamp))\
-            .all() # Fetch all matching threads
+        # (post_id, count of comments made by *this specific user* on that post) pairs
+        if current_app.config['USE_USER_THREADS_TABLE']:
+            # Precomputed table: primary key (username, post_id) range scan
+            thread_counts = db.session.query(UserThread.post_id, UserThread.comment_count)\
+                .filter(UserThread.username == username)
+            if before is not None:
+                thread_counts = thread_counts.filter(UserThread.post_id < before)
+            thread_counts = thread_counts.order_by(UserThread.post_id.desc())
+        else:
+            # Live aggregation, served in post_id order by ix_comments_author_post_id
+            thread_counts = db.session.query(Comment.post_id, func.count(Comment.id))\
+                .filter(Comment.author == username)
+            if before is not None:
+                thread_counts = thread_counts.filter(Comment.post_id < before)
+            thread_counts = thread_counts.group_by(Comment.post_id)\
+                .order_by(Comment.post_id.desc())
+        thread_counts = thread_counts.limit(page_size + 1).all()
+
+        next_cursor = thread_counts[page_size - 1][0] if len(thread_counts) > page_size else None
+        thread_counts = thread_counts[:page_size]
+
+        # Load the Post objects for this page only, keeping the page order
+        posts_by_id = {}
+        if thread_counts:
+            posts = Post.query.filter(Post.id.in_([post_id for post_id, _ in thread_counts])).all()
+            posts_by_id = {post.id: post for post in posts}
+        threads_participated = [(posts_by_id[post_id], count) for post_id, count in thread_counts if post_id in posts_by_id]
     except Exception as e:
         print(f"Error fetching profile data for '{username}': {e}")
         flash("An error occurred while retrieving the user profile.", "danger")
@@ -120,33 +167,88 @@ def user_profile(username):
     return render_template('user_profile.html',
                            title=f"{username}'s Profile",
                            user_stats=user_stats,
-                           threads=threads_participated)
+                           threads=threads_participated,
+                           before=before,
+                           next_cursor=next_cursor)
 
 @bp.route('/thread/<int:post_id>')
-def thread_view(post_id):
-    """Displays a specific thread (post and its comments)."""
+@bp.route('/thread/<int:post_id>/after/<int:after>')
+@bp.route('/thread/<int:post_id>/before/<int:before>')
+@conditional
+@cached_page
+def thread_view(post_id, after=None, before=None):
+    """Displays one page of a thread (post and its comments), paginated by comment id.
+
+    /after/<id> shows the comments following that id, /before/<id> the page preceding it
+    (?after= / ?before= are accepted too; url_for builds the path form). Both are keyset
+    cursors on (post_id, id), so deep links stay stable and every page costs the same
+    index range scan. ?highlight_user=<name> without a cursor opens the page starting at
+    that user's first comment.
+    """
+    page_size = current_app.config['THREAD_PAGE_SIZE']
+    if after is None and before is None:
+        after = request.args.get('after', None, type=int)
+        before = request.args.get('before', None, type=int)
+    # Get the username to highlight from the query string (?highlight_user=...)
+    highlight_user = request.args.get('highlight_user', None)
+
     try:
         # Fetch the specific post or return 404 if not found
         post = Post.query.get_or_404(post_id)
+        thread_comments = Comment.query.filter(Comment.post_id == post.id)
 
-        # Fetch all comments associated with this post, ordered by ID (or comment_number if reliable)
-        comments = Comment.query.filter_by(post_id=post.id).order_by(Comment.id).all()
+        if highlight_user and after is None and before is None:
+            # Jump straight to the user's first comment (single index lookup)
+            first_id = db.session.query(func.min(Comment.id))\
+                .filter(Comment.post_id == post.id, Comment.author == highlight_user)\
+                .scalar()
+            if first_id is not None:
+                after = first_id - 1
 
-        # Get the username to highlight from the query string (?highlight_user=...)
-        highlight_user = request.args.get('highlight_user', None) # Get from URL parameter
+        if before is not None:
+            # Previous page: walk backwards from the cursor, then restore display order
+            comments = thread_comments.filter(Comment.id < before)\
+                .order_by(Comment.id.desc()).limit(page_size + 1).all()
+            has_prev = len(comments) > page_size
+            comments = comments[:page_size][::-1]
+            has_next = True
+        else:
+            if after is not None:
+                thread_comments = thread_comments.filter(Comment.id > after)
+            comments = thread_comments.order_by(Comment.id).limit(page_size + 1).all()
+            has_next = len(comments) > page_size
+            comments = comments[:page_size]
+            has_prev = after is not None and db.session.query(Comment.id)\
+                .filter(Comment.post_id == post.id, Comment.id <= after)\
+                .first() is not None
 
     except Exception as e:
         print(f"Error fetching thread data for post ID {post_id}: {e}")
         flash("An error occurred while retrieving the thread.", "danger")
         return redirect(url_for('main.index'))
 
+    # Cursors for the pagination links (None when there is no such page)
+    prev_cursor = comments[0].id if comments and has_prev else None
+    next_cursor = comments[-1].id if comments and has_next else None
+    # The static export only has the pages reached by walking forward from the first one
+    # (export_static.py), so "previous" links to that page's /after/ cursor, or to the
+    # thread itself when the previous page is the first
+    prev_after = None
+    if prev_cursor is not None and current_app.config['STATIC_EXPORT']:
+        prev_after = db.session.query(Comment.id)\
+            .filter(Comment.post_id == post.id, Comment.id < prev_cursor)\
+            .order_by(Comment.id.desc()).offset(page_size).limit(1).scalar()
+
     # --- THIS IS THE REAL RENDER CALL ---
     # Render the thread.html template, passing the necessary data
     return render_template('thread.html',
                            title=post.title, # Set the page title
                            post=post,        # Pass the Post object
-                           comments=comments,  # Pass the list of Comment objects
-                           highlight_user=highlight_user) # Pass the username to highlight
+                           comments=comments,  # Pass the current page of Comment objects
+                           highlight_user=highlight_user, # Pass the username to highlight
+                           prev_cursor=prev_cursor,
+                           prev_after=prev_after,
+                           next_cursor=next_cursor)
 
 @bp.route('/search/threads')
 def thread_search():
@@ -157,18 +259,11 @@ def thread_search():
         flash('Please enter keywords to search for in thread titles.', 'warning')
         return redirect(url_for('main.index')) # Redirect if query is empty
 
-    print(f"Searching for threads with title containing: '{query}'") # For debugging
+    print(f"Searching for threads with title matching: '{query}'") # For debugging
 
     try:
-        # Perform a case-insensitive search using ILIKE
-        search_term = f"%{query}%" # Add wildcards for substring matching
-        # Find posts where the title contains the query term
-        results = Post.query.filter(
-            Post.title.ilike(search_term)
-        ).order_by(
-            desc(Post.timestamp) # Order by timestamp descending (newest first)
-        ).limit(100).all() # Limit results to avoid overwhelming page
-        # Consider adding pagination later if results can be very large
+        # Ranked, index-backed title search (Turkish-aware; see app/models/search.py)
+        results = search_titles(query, limit=100) # Limit results to avoid overwhelming page
 
         result_count = len(results)
         print(f"Found {result_count} matching posts.") # For debugging
@@ -184,4 +279,56 @@ def thread_search():
                            title=f"Search Results for '{query}'",
                            query=query,
                            results=results,
-                           result_count=result_count)
\ No newline at end of file
+                           result_count=result_count)
+
+@bp.route('/search/comments')
+def comment_search():
+    """Searches inside comment content, optionally filtered by author and date range.
+
+    ?since=YYYY-MM-DD and ?until=YYYY-MM-DD (inclusive) filter on the typed
+    Comment.commented_at column; ?year=YYYY is a shortcut for that whole year.
+    """
+    query = request.args.get('q', '').strip()
+    author = request.args.get('author', '').strip() or None
+    year = request.args.get('year', None, type=int)
+    since_date = request.args.get('since', None, type=date.fromisoformat)
+    until_date = request.args.get('until', None, type=date.fromisoformat)
+    before = request.args.get('before', None, type=int) # Keyset cursor: last comment id of the previous page
+
+    if year is not None and not 1 <= year <= MAX_YEAR:
+        flash(f"Ignoring year {year}: it must be between 1 and {MAX_YEAR}.", "warning")
+        year = None
+    if year and not (since_date or until_date):
+        since_date, until_date = date(year, 1, 1), date(year, 12, 31)
+    # Half-open [since, until + 1 day) range in the archive's local time; the last
+    # representable day has no next day, and needs no upper bound anyway
+    since = datetime.combine(since_date, time.min, SOURCE_TIMEZONE) if since_date else None
+    until = datetime.combine(until_date + timedelta(days=1), time.min, SOURCE_TIMEZONE) \
+        if until_date and until_date < date.max else None
+
+    results = []
+    next_cursor = None
+    if query:
+        print(f"Searching comments for: '{query}' (author={author}, since={since_date}, until={until_date}, before={before})") # For debugging
+        try:
+            comments, next_cursor = search_comments(query, author=author, since=since, until=until, before=before,
+                                                    page_size=COMMENT_SEARCH_PAGE_SIZE)
+            results = [(comment, highlight_snippet(comment.content, query)) for comment in comments]
+        except Exception as e:
+            print(f"Error during comment search for '{query}': {e}")
+            flash("An error occurred while searching comments.", "danger")
+
+    return render_template('comment_search_results.html',
+                           title=f"Comment Search for '{query}'" if query else "Search Comments",
+                           query=query,
+                           author=author,
+                           since=since_date,
+                           until=until_date,
+                           before=before,
+                           results=results,
+                           next_cursor=next_cursor)
+
+@bp.route('/cache-stats')
+def cache_stats():
+    """Page cache hit/miss/eviction counters for this worker process."""
+    return jsonify(get_page_cache().snapshot())
\ No newline at end of file
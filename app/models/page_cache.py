@@ -0,0 +1,188 @@
+# app/models/page_cache.py
+import os
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, request, session, make_response, get_flashed_messages
+
+from archive_version import read_archive_version
+
+class PageCache:
+    """Rendered-page cache: a byte-bounded in-process LRU plus an optional shared directory tier.
+
+    Keys are scoped to the archive version, so bumping the version invalidates every
+    page at once. The directory tier lets all gunicorn workers reuse one render; put it
+    on tmpfs (e.g. /dev/shm/bunalti-pages) to keep it in shared memory. It is bounded by
+    shared_max_bytes: file mtimes serve as the LRU clock (a hit touches the file), and
+    after every shared_max_bytes / 8 written a worker sums the directory and unlinks the
+    oldest pages until it fits again.
+    """
+
+    def __init__(self, max_bytes, shared_dir=None, shared_max_bytes=None):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_bytes // 8 # One huge thread must not flush the whole cache
+        self.shared_dir = shared_dir
+        self.shared_max_bytes = shared_max_bytes or 4 * max_bytes
+        self.shared_written = 0 # Bytes this process wrote to the shared tier since its last trim
+        self.entries = OrderedDict() # key -> (body bytes, mimetype), least recently used first
+        self.current_bytes = 0
+        self.version = None
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'shared_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0,
+                      'shared_evictions': 0, 'invalidations': 0}
+
+    def _check_version(self, version):
+        """Drops everything cached for an older archive version. Caller holds the lock."""
+        if version == self.version: return
+        if self.version is not None:
+            self.entries.clear()
+            self.current_bytes = 0
+            self.stats['invalidations'] += 1
+            if self.shared_dir and os.path.isdir(self.shared_dir):
+                for name in os.listdir(self.shared_dir):
+                    if name != str(version):
+                        shutil.rmtree(os.path.join(self.shared_dir, name), ignore_errors=True)
+        self.version = version
+
+    def _shared_path(self, version, key):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.shared_dir, str(version), digest[:2], digest)
+
+    def _remember(self, key, entry):
+        """Inserts into the LRU and evicts from the cold end. Caller holds the lock."""
+        size = len(entry[0])
+        if size > self.max_entry_bytes: return
+        if key in self.entries:
+            self.current_bytes -= len(self.entries.pop(key)[0])
+        self.entries[key] = entry
+        self.current_bytes += size
+        while self.current_bytes > self.max_bytes:
+            _, (body, _) = self.entries.popitem(last=False)
+            self.current_bytes -= len(body)
+            self.stats['evictions'] += 1
+
+    def _trim_shared(self, version):
+        """Unlinks the least recently used shared pages until the directory fits its bound."""
+        files = []
+        total = 0
+        for root, _, names in os.walk(os.path.join(self.shared_dir, str(version))):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    info = os.stat(path)
+                except FileNotFoundError:
+                    continue # Another worker trimmed it
+                files.append((info.st_mtime, info.st_size, path))
+                total += info.st_size
+        if total <= self.shared_max_bytes: return
+        evicted = 0
+        for _, size, path in sorted(files):
+            try:
+                os.remove(path)
+                evicted += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+            if total <= self.shared_max_bytes: break
+        with self.lock:
+            self.stats['shared_evictions'] += evicted
+
+    def get(self, version, key):
+        """Returns (body, mimetype) or None."""
+        with self.lock:
+            self._check_version(version)
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return entry
+
+        if self.shared_dir:
+            path = self._shared_path(version, key)
+            try:
+                with open(path, 'rb') as f:
+                    mimetype, _, body = f.read().partition(b'\n')
+                os.utime(path) # Recently used: trimmed last
+                entry = (body, mimetype.decode('ascii'))
+                with self.lock:
+                    self._remember(key, entry)
+                    self.stats['shared_hits'] += 1
+                return entry
+            except FileNotFoundError:
+                pass
+
+        with self.lock:
+            self.stats['misses'] += 1
+        return None
+
+    def put(self, version, key, body, mimetype):
+        with self.lock:
+            self._check_version(version)
+            self._remember(key, (body, mimetype))
+            self.stats['stores'] += 1
+
+        if self.shared_dir and len(body) <= self.shared_max_bytes // 8:
+            path = self._shared_path(version, key)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # Write-then-rename so other workers never read a partial page
+                temp_path = f"{path}.{os.getpid()}.tmp"
+                with open(temp_path, 'wb') as f:
+                    f.write(mimetype.encode('ascii') + b'\n' + body)
+                os.replace(temp_path, path)
+            except OSError as e:
+                print(f"Warning: could not write shared page cache entry '{path}': {e}")
+                return
+            with self.lock:
+                self.shared_written += len(body)
+                trim = self.shared_written >= self.shared_max_bytes // 8
+                if trim: self.shared_written = 0
+            if trim: self._trim_shared(version)
+
+    def snapshot(self):
+        """Counters plus current size, for the /cache-stats endpoint."""
+        with self.lock:
+            return dict(self.stats, entries=len(self.entries), bytes=self.current_bytes,
+                        max_bytes=self.max_bytes, shared_max_bytes=self.shared_max_bytes if self.shared_dir else None,
+                        version=self.version, pid=os.getpid())
+
+
+_page_cache = None
+_page_cache_lock = threading.Lock()
+
+def get_page_cache():
+    """The per-process cache, created on first use (after gunicorn has forked its workers)."""
+    global _page_cache
+    with _page_cache_lock:
+        if _page_cache is None:
+            _page_cache = PageCache(current_app.config['PAGE_CACHE_MAX_BYTES'],
+                                    current_app.config['PAGE_CACHE_DIR'],
+                                    current_app.config['PAGE_CACHE_DIR_MAX_BYTES'])
+        return _page_cache
+
+def cached_page(view):
+    """Serves the view's rendered HTML from the page cache for the current archive version.
+
+    Pages showing flash messages are neither served from nor stored in the cache.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not current_app.config['PAGE_CACHE_ENABLED'] or '_flashes' in session:
+            return view(*args, **kwargs)
+
+        cache = get_page_cache()
+        version = read_archive_version()['version']
+        key = request.full_path
+        entry = cache.get(version, key)
+        if entry is not None:
+            body, mimetype = entry
+            return current_app.response_class(body, mimetype=mimetype)
+
+        response = make_response(view(*args, **kwargs))
+        if response.status_code == 200 and not response.direct_passthrough and not get_flashed_messages():
+            cache.put(version, key, response.get_data(), response.mimetype)
+        return response
+    return wrapper
@@ -6,10 +6,16 @@ class Post(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.Text, nullable=False)
-    timestamp = db.Column(db.Text, nullable=False)
+    timestamp = db.Column(db.Text, nullable=False) # Source string as scraped
+    posted_at = db.Column(db.DateTime(timezone=True), index=True) # Parsed from 'timestamp' by backfill_timestamps.py
     wayback_url = db.Column(db.Text)
     original_url = db.Column(db.Text)
 
+    # Denormalized comment activity, maintained by backfill_post_activity.py
+    comment_count = db.Column(db.Integer, nullable=False, default=0, server_default='0', index=True)
+    first_comment_at = db.Column(db.DateTime(timezone=True))
+    last_comment_at = db.Column(db.DateTime(timezone=True))
+
     # Define the relationship to Comment
     # Note: We refer to the Class name 'Comment' here
     comments = db.relationship('Comment', backref='post', lazy=True, cascade="all, delete-orphan")
@@ -0,0 +1,295 @@
+# app/models/search.py
+import re
+import threading
+from bisect import bisect_left, insort
+
+from markupsafe import Markup, escape
+
+from sqlalchemy import func, desc, literal_column
+
+from app.models.post import Post
+from app.models.comment import Comment
+from app import db
+from archive_version import read_archive_version
+
+# --- Turkish-aware folding ---
+# Users type "istanbul" for "İstanbul" and "kisi" for "kişi", so both the index and
+# the query are folded the same way: dotted/dotless i collapse to 'i' and the
+# Turkish letters lose their diacritics. Keep in sync with archive_fold() in create_indexes.py.
+FOLD_FROM = 'İIıŞşĞğÜüÖöÇçÂâÎîÛû'
+FOLD_TO = 'iiissgguuooccaaiiuu'
+_FOLD_TABLE = str.maketrans(FOLD_FROM, FOLD_TO)
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+_TAG_RE = re.compile(r'<[^>]*>')
+
+def fold_text(value):
+    """Folds text for matching: Turkish letters to ASCII, then lowercase."""
+    if value is None: return ''
+    return value.translate(_FOLD_TABLE).lower()
+
+def tokenize(value):
+    """Splits folded text into word tokens."""
+    return _TOKEN_RE.findall(fold_text(value))
+
+def like_contains(value):
+    """LIKE pattern matching 'value' anywhere, with its % _ and \\ taken literally (escape='\\')."""
+    escaped = value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+def build_prefix_tsquery(tokens):
+    """Builds a to_tsquery() string that matches every token as a prefix (Turkish suffixes)."""
+    return ' & '.join(f"{token}:*" for token in tokens)
+
+
+class InvertedIndex:
+    """In-process token -> ids index with prefix lookup, used when Postgres is not available.
+
+    Rows can be added or re-indexed one batch at a time, so repaired or newly
+    inserted rows never require a full rebuild: update() replaces the given rows, and
+    refresh() re-indexes only those whose tokens changed.
+    """
+
+    def __init__(self, rows=()):
+        self.tokens = []      # sorted list of distinct tokens, for prefix range lookups
+        self.postings = {}    # token -> set of row ids
+        self.row_tokens = {}  # row id -> tokens it is indexed under (needed to re-index)
+        self.update(rows)
+
+    def update(self, rows):
+        """Indexes (row_id, text) pairs, replacing any previous entry for the same id."""
+        new_tokens = []
+        for row_id, value in rows:
+            for token in self.row_tokens.pop(row_id, ()):
+                self.postings[token].discard(row_id)
+            row_tokens = frozenset(tokenize(value))
+            for token in row_tokens:
+                if token not in self.postings:
+                    self.postings[token] = set()
+                    new_tokens.append(token)
+                self.postings[token].add(row_id)
+            self.row_tokens[row_id] = row_tokens
+        # One sort for bulk loads, sorted inserts for the small incremental batches
+        if len(new_tokens) > 64:
+            self.tokens.extend(new_tokens)
+            self.tokens.sort()
+        else:
+            for token in new_tokens: insort(self.tokens, token)
+
+    def refresh(self, rows):
+        """Re-indexes the (row_id, text) pairs whose tokens differ from the indexed ones; returns how many."""
+        changed = [(row_id, value) for row_id, value in rows
+                   if self.row_tokens.get(row_id) != frozenset(tokenize(value))]
+        if changed: self.update(changed)
+        return len(changed)
+
+    def _prefix_matches(self, prefix):
+        """Returns {id: exact_hit} for every indexed token starting with 'prefix'."""
+        matches = {}
+        position = bisect_left(self.tokens, prefix)
+        while position < len(self.tokens) and self.tokens[position].startswith(prefix):
+            exact = self.tokens[position] == prefix
+            for row_id in self.postings[self.tokens[position]]:
+                matches[row_id] = matches.get(row_id, False) or exact
+            position += 1
+        return matches
+
+    def score(self, query):
+        """Returns {id: score} for ids matching every query token as a prefix."""
+        scores = None
+        for token in tokenize(query):
+            matches = self._prefix_matches(token)
+            if scores is None:
+                scores = {row_id: 1 + exact for row_id, exact in matches.items()}
+            else:
+                scores = {row_id: score + 1 + matches[row_id] for row_id, score in scores.items() if row_id in matches}
+            if not scores: return {}
+        return scores or {}
+
+    def search(self, query, limit=100):
+        """Returns ids matching every query token (as a prefix), best ranked first."""
+        # Exact token hits rank above prefix hits; newer (higher id) rows break ties
+        ranked = sorted(self.score(query).items(), key=lambda item: (-item[1], -item[0]))
+        return [row_id for row_id, _ in ranked[:limit]]
+
+
+def highlight_snippet(content, query, width=200):
+    """Returns an HTML-safe snippet of 'content' around the first hit, hits wrapped in <mark>."""
+    plain = _TAG_RE.sub(' ', content or '')
+    plain = ' '.join(plain.split())
+    prefixes = tokenize(query)
+    hits = [match for match in _TOKEN_RE.finditer(plain)
+            if any(fold_text(match.group()).startswith(prefix) for prefix in prefixes)]
+    start = max(0, hits[0].start() - width // 4) if hits else 0
+    end = min(len(plain), start + width)
+
+    parts = [Markup('&hellip;')] if start > 0 else []
+    position = start
+    for match in hits:
+        if match.start() < start: continue
+        if match.end() > end: break
+        parts.append(escape(plain[position:match.start()]))
+        parts.append(Markup('<mark>%s</mark>') % match.group())
+        position = match.end()
+    parts.append(escape(plain[position:end]))
+    if end < len(plain): parts.append(Markup('&hellip;'))
+    return Markup('').join(parts)
+
+
+# --- Title search ---
+_title_index = None
+_title_index_signature = None
+_index_lock = threading.Lock()
+
+def _get_title_index():
+    """Builds the in-process title index once, rebuilding it if the posts table changed."""
+    global _title_index, _title_index_signature
+    signature = tuple(db.session.query(func.count(Post.id), func.max(Post.id)).one())
+    with _index_lock:
+        if _title_index is None or signature != _title_index_signature:
+            print(f"Building in-process title index for {signature[0]} posts...")
+            _title_index = InvertedIndex(db.session.query(Post.id, Post.title).all())
+            _title_index_signature = signature
+        return _title_index
+
+def _fts_match(column, tokens):
+    """Returns (document, ts_query) expressions matching the ix_*_fts index definitions."""
+    # Must match the index expression exactly for the planner to use the GIN index
+    config = literal_column("'simple'::regconfig")
+    document = func.to_tsvector(config, func.archive_fold(column))
+    return document, func.to_tsquery(config, build_prefix_tsquery(tokens))
+
+def _search_titles_postgres(query, limit):
+    """Ranked full-text + trigram search; both predicates are served by GIN indexes."""
+    tokens = tokenize(query)
+    if not tokens: return []
+    document, ts_query = _fts_match(Post.title, tokens)
+    rank = func.ts_rank(document, ts_query)
+    return Post.query.filter(
+        document.op('@@')(ts_query) | func.archive_fold(Post.title).like(like_contains(fold_text(query)), escape='\\')
+    ).order_by(
+        desc(rank), Post.posted_at.desc().nullslast()
+    ).limit(limit).all()
+
+def _search_titles_in_process(query, limit):
+    """Fallback for SQLite/test databases: look ids up in the in-process index."""
+    post_ids = _get_title_index().search(query, limit)
+    if not post_ids: return []
+    posts_by_id = {post.id: post for post in Post.query.filter(Post.id.in_(post_ids)).all()}
+    return [posts_by_id[post_id] for post_id in post_ids if post_id in posts_by_id]
+
+def search_titles(query, limit=100):
+    """Returns posts whose titles match 'query', best match first."""
+    if db.engine.dialect.name == 'postgresql':
+        try:
+            return _search_titles_postgres(query, limit)
+        except Exception as e:
+            # archive_fold()/indexes missing - run create_indexes.py. Keep search working meanwhile.
+            print(f"Indexed title search failed ({e}), falling back to ILIKE.")
+            db.session.rollback()
+            return search_titles_ilike(query, limit)
+    return _search_titles_in_process(query, limit)
+
+def search_titles_ilike(query, limit=100):
+    """The original unindexed substring search (kept for fallback and benchmarking)."""
+    return Post.query.filter(
+        Post.title.ilike(like_contains(query), escape='\\')
+    ).order_by(
+        Post.posted_at.desc().nullslast()
+    ).limit(limit).all()
+
+
+# --- Comment content search ---
+_comment_index = None
+_comment_index_last_id = 0
+_comment_index_version = None
+REFRESH_CHUNK_SIZE = 5000
+
+def _refresh_indexed_comments():
+    """Re-indexes comments repaired in place (same id, new text). Caller holds the lock."""
+    changed = 0
+    last_id = 0
+    while last_id < _comment_index_last_id:
+        rows = db.session.query(Comment.id, Comment.content)\
+            .filter(Comment.id > last_id, Comment.id <= _comment_index_last_id)\
+            .order_by(Comment.id).limit(REFRESH_CHUNK_SIZE).all()
+        if not rows: break
+        changed += _comment_index.refresh(rows)
+        last_id = rows[-1][0]
+    if changed: print(f"Re-indexed {changed} changed comments in-process.")
+
+def _get_comment_index():
+    """Returns the in-process comment index, brought up to date with the comments table.
+
+    Comments added since the last call are indexed; after an archive version bump (the
+    repair scripts bump it when they rewrite comments) the indexed ones are re-checked
+    and only those whose text changed are re-indexed.
+    """
+    global _comment_index, _comment_index_last_id, _comment_index_version
+    with _index_lock:
+        version = read_archive_version()['version'] # Before the scan, so a bump during it is seen next time
+        if _comment_index is None:
+            _comment_index = InvertedIndex()
+        elif version != _comment_index_version:
+            _refresh_indexed_comments()
+        _comment_index_version = version
+        new_rows = db.session.query(Comment.id, Comment.content)\
+            .filter(Comment.id > _comment_index_last_id)\
+            .order_by(Comment.id).all()
+        if new_rows:
+            print(f"Indexing {len(new_rows)} new comments in-process...")
+            _comment_index.update(new_rows)
+            _comment_index_last_id = new_rows[-1][0]
+        return _comment_index
+
+def reindex_comments(comment_ids):
+    """Re-indexes repaired comments in the in-process index (Postgres' GIN index updates itself)."""
+    if _comment_index is None or not comment_ids: return
+    rows = db.session.query(Comment.id, Comment.content).filter(Comment.id.in_(list(comment_ids))).all()
+    with _index_lock:
+        _comment_index.update(rows)
+
+def _filter_comments(comment_query, author=None, since=None, until=None, before=None):
+    """Applies the optional author / [since, until) date range / keyset-cursor filters."""
+    if author:
+        comment_query = comment_query.filter(Comment.author == author)
+    if since:
+        comment_query = comment_query.filter(Comment.commented_at >= since)
+    if until:
+        comment_query = comment_query.filter(Comment.commented_at < until)
+    if before:
+        comment_query = comment_query.filter(Comment.id < before)
+    return comment_query
+
+def _search_comments_postgres(tokens, author, since, until, before, page_size):
+    """Full-text match served by the ix_comments_content_fts GIN index, newest first."""
+    document, ts_query = _fts_match(Comment.content, tokens)
+    comment_query = _filter_comments(Comment.query.filter(document.op('@@')(ts_query)), author, since, until, before)
+    return comment_query.order_by(Comment.id.desc()).limit(page_size + 1).all()
+
+def _search_comments_in_process(query, author, since, until, before, page_size, chunk_size=500):
+    """Walks matching ids newest first, applying the SQL filters one chunk at a time."""
+    candidate_ids = sorted(_get_comment_index().score(query), reverse=True)
+    if before:
+        candidate_ids = [comment_id for comment_id in candidate_ids if comment_id < before]
+    results = []
+    for offset in range(0, len(candidate_ids), chunk_size):
+        chunk = candidate_ids[offset:offset + chunk_size]
+        comment_query = _filter_comments(Comment.query.filter(Comment.id.in_(chunk)), author, since, until)
+        results.extend(comment_query.order_by(Comment.id.desc()).all())
+        if len(results) > page_size: break
+    return results[:page_size + 1]
+
+def search_comments(query, author=None, since=None, until=None, before=None, page_size=50):
+    """Returns (comments, next_cursor) for comments whose content matches 'query'.
+
+    'since'/'until' bound Comment.commented_at as a half-open [since, until) range.
+    Results are ordered newest first; pass next_cursor back as 'before' for the next page.
+    """
+    tokens = tokenize(query)
+    if not tokens: return [], None
+    if db.engine.dialect.name == 'postgresql':
+        comments = _search_comments_postgres(tokens, author, since, until, before, page_size)
+    else:
+        comments = _search_comments_in_process(query, author, since, until, before, page_size)
+    next_cursor = comments[page_size - 1].id if len(comments) > page_size else None
+    return comments[:page_size], next_cursor
@@ -0,0 +1,14 @@
+# app/models/thread_leaderboard.py
+from app import db
+
+class ThreadLeaderboard(db.Model):
+    __tablename__ = 'thread_leaderboard'
+
+    # Derived table: rebuilt from 'comments' by rebuild_thread_leaderboard.py.
+    # 'rank' is the primary key so the homepage reads the top N straight off its index.
+    rank = db.Column(db.Integer, primary_key=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id'), nullable=False)
+    comment_count = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return f'<ThreadLeaderboard #{self.rank}: Post {self.post_id} ({self.comment_count} comments)>'
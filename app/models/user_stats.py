@@ -7,8 +7,10 @@ class UserStats(db.Model):
     username = db.Column(db.Text, primary_key=True)
     total_comments = db.Column(db.Integer, default=0)
     threads_participated = db.Column(db.Integer, default=0)
-    first_comment_date = db.Column(db.Text)
+    first_comment_date = db.Column(db.Text) # Source strings of the first/last comment, for display
     last_comment_date = db.Column(db.Text)
+    first_comment_at = db.Column(db.DateTime(timezone=True))
+    last_comment_at = db.Column(db.DateTime(timezone=True))
 
     def __repr__(self):
         return f'<UserStats for {self.username}>'
\ No newline at end of file
@@ -0,0 +1,15 @@
+# app/models/user_thread.py
+from app import db
+
+class UserThread(db.Model):
+    __tablename__ = 'user_threads'
+
+    # Derived table: one row per (user, thread) with the user's comment count in it.
+    # Rebuilt from 'comments' by rebuild_user_threads.py; the composite primary key
+    # serves profile pages as a plain index range scan.
+    username = db.Column(db.Text, primary_key=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id'), primary_key=True)
+    comment_count = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return f'<UserThread {self.username} on Post {self.post_id} ({self.comment_count} comments)>'
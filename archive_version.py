@@ -0,0 +1,92 @@
+# archive_version.py
+# A small version stamp for the archive's content. Scripts that modify the database
+# call bump_archive_version() after they commit; the web app derives its ETag /
+# Last-Modified headers (and cache keys) from it without querying the database.
+#
+# The stamp is a JSON file so reading it costs one stat() per request. Point
+# ARCHIVE_VERSION_FILE at a shared path if the scripts run on another machine.
+import os
+import json
+import time
+import threading
+from datetime import datetime, timezone
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+DEFAULT_VERSION_FILE = os.path.join(basedir, 'instance', 'archive_version.json')
+
+# Returned while no script has bumped the version yet
+INITIAL_VERSION = {'version': 0, 'updated_at': None, 'reason': None}
+LOCK_TIMEOUT = 30.0 # Seconds; an older lock file is left over from a killed script
+
+_cache = {'file_key': None, 'stamp': INITIAL_VERSION}
+_cache_lock = threading.Lock()
+
+def archive_version_path():
+    """Resolved at call time so scripts that load .env after importing this module still apply it."""
+    return os.environ.get('ARCHIVE_VERSION_FILE', DEFAULT_VERSION_FILE)
+
+def read_archive_version(path=None):
+    """Returns the current stamp dict ('version', 'updated_at', 'reason'), re-reading only when the file changes."""
+    path = path or archive_version_path()
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return INITIAL_VERSION
+    # bump_archive_version() replaces the file, so the inode changes even within one mtime tick
+    file_key = (path, stat.st_ino, stat.st_mtime_ns)
+    with _cache_lock:
+        if _cache['file_key'] != file_key:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    stamp = json.load(f)
+                if stamp.get('updated_at'):
+                    stamp['updated_at'] = datetime.fromisoformat(stamp['updated_at'])
+                _cache['stamp'], _cache['file_key'] = stamp, file_key
+            except (OSError, ValueError) as e:
+                # Half-written or corrupt file: keep serving the last good stamp
+                print(f"Warning: could not read archive version from '{path}': {e}")
+        return _cache['stamp']
+
+def _acquire_lock(lock_path):
+    """Creates the lock file exclusively, waiting for other bumps; clears a stale one."""
+    while True:
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > LOCK_TIMEOUT:
+                    print(f"Warning: removing stale archive version lock '{lock_path}'.")
+                    os.remove(lock_path)
+                    continue
+            except FileNotFoundError:
+                continue # Released meanwhile
+            time.sleep(0.05)
+
+def bump_archive_version(reason, path=None):
+    """Increments the archive version after a committed change. Returns the new version number.
+
+    The read-increment-write runs under a lock file, so scripts finishing at the same
+    time get distinct versions (two equal versions would leave the second change behind
+    a matching ETag and a stale page cache).
+    """
+    path = path or archive_version_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    lock_path = f"{path}.lock"
+    _acquire_lock(lock_path)
+    try:
+        current = read_archive_version(path)
+        stamp = {
+            'version': int(current.get('version') or 0) + 1,
+            'updated_at': datetime.now(timezone.utc).replace(microsecond=0).isoformat(),
+            'reason': reason,
+        }
+        # Write-then-rename so readers never see a partial file
+        temp_path = f"{path}.{os.getpid()}.{time.time_ns()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(stamp, f)
+        os.replace(temp_path, path)
+    finally:
+        os.remove(lock_path)
+    print(f"Archive version bumped to {stamp['version']} ({reason}).")
+    return stamp['version']
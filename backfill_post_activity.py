@@ -0,0 +1,108 @@
+# backfill_post_activity.py
+# Populates the denormalized activity columns on 'posts'
+# (comment_count, first_comment_at, last_comment_at) from the 'comments' table.
+# refresh_post_activity() is also imported by scripts that insert or move comments
+# so the columns stay in sync without a full backfill.
+import os
+import sys
+import time
+import psycopg2
+from dotenv import load_dotenv
+
+from archive_version import bump_archive_version
+
+# --- Configuration ---
+load_dotenv()
+DATABASE_URL = os.getenv('DATABASE_URL')
+
+# Number of post ids covered by one UPDATE/commit during the backfill
+BATCH_SIZE = 5000
+
+ADD_COLUMNS_SQL = """
+    ALTER TABLE posts
+        ADD COLUMN IF NOT EXISTS comment_count integer NOT NULL DEFAULT 0,
+        ADD COLUMN IF NOT EXISTS first_comment_at timestamptz,
+        ADD COLUMN IF NOT EXISTS last_comment_at timestamptz;
+    CREATE INDEX IF NOT EXISTS ix_posts_comment_count ON posts (comment_count);
+"""
+
+# {post_filter} restricts both the aggregation and the UPDATE to the same set of posts;
+# posts that lost all their comments are reset to 0 / NULL by the LEFT JOIN.
+# first/last activity come from comments.commented_at (see backfill_timestamps.py).
+REFRESH_SQL_TEMPLATE = """
+    WITH stats AS (
+        SELECT post_id, count(*) AS cnt, min(commented_at) AS first_at, max(commented_at) AS last_at
+        FROM comments
+        WHERE {comment_filter}
+        GROUP BY post_id
+    )
+    UPDATE posts p
+    SET comment_count = COALESCE(s.cnt, 0),
+        first_comment_at = s.first_at,
+        last_comment_at = s.last_at
+    FROM posts p0
+    LEFT JOIN stats s ON s.post_id = p0.id
+    WHERE p.id = p0.id AND {post_filter};
+"""
+
+# --- Functions ---
+def ensure_activity_columns(conn):
+    """Adds the activity columns and their index to 'posts' if they are missing."""
+    with conn.cursor() as cursor:
+        cursor.execute(ADD_COLUMNS_SQL)
+    conn.commit()
+
+def refresh_post_activity(cursor, post_ids):
+    """Recomputes the activity columns for the given post ids. Caller commits."""
+    post_ids = sorted(set(post_ids))
+    if not post_ids:
+        return 0
+    sql = REFRESH_SQL_TEMPLATE.format(comment_filter="post_id = ANY(%s)", post_filter="p0.id = ANY(%s)")
+    cursor.execute(sql, (post_ids, post_ids))
+    return cursor.rowcount
+
+def backfill_post_activity(conn, batch_size=BATCH_SIZE):
+    """Walks 'posts' in primary key ranges and recomputes every row, committing per batch."""
+    print(f"\n--- Backfilling post activity columns (batches of {batch_size} post ids) ---")
+    sql = REFRESH_SQL_TEMPLATE.format(comment_filter="post_id BETWEEN %s AND %s", post_filter="p0.id BETWEEN %s AND %s")
+    updated_count = 0
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT min(id), max(id) FROM posts;")
+        min_id, max_id = cursor.fetchone()
+        if min_id is None:
+            print("No posts found.")
+            return 0
+
+        for start_id in range(min_id, max_id + 1, batch_size):
+            end_id = min(start_id + batch_size - 1, max_id)
+            cursor.execute(sql, (start_id, end_id, start_id, end_id))
+            updated_count += cursor.rowcount
+            conn.commit()
+            print(f"Post ids {start_id}-{end_id}: {cursor.rowcount} rows updated (total {updated_count}).")
+
+    print(f"Finished backfill. Total posts updated: {updated_count}")
+    if updated_count: bump_archive_version("backfill_post_activity")
+    return updated_count
+
+# --- Main Execution ---
+if __name__ == "__main__":
+    start_run_time = time.time()
+    if not DATABASE_URL:
+        print("Error: DATABASE_URL environment variable not set.")
+        sys.exit(1)
+
+    conn = None
+    try:
+        print("Connecting to database...")
+        conn = psycopg2.connect(DATABASE_URL)
+        print("Database connection successful.")
+        ensure_activity_columns(conn)
+        backfill_post_activity(conn)
+    except psycopg2.Error as e:
+        print(f"!!! Database error occurred: {e}")
+        if conn: conn.rollback()
+        sys.exit(1)
+    finally:
+        if conn: conn.close(); print("\nDatabase connection closed.")
+
+    print(f"\nScript finished in {time.time() - start_run_time:.2f} seconds.")
@@ -0,0 +1,133 @@
+# backfill_timestamps.py
+# Parses the Turkish-formatted source strings (posts.timestamp,
+# comments.comment_date + comment_time) into typed timestamptz columns
+# (posts.posted_at, comments.commented_at), then refreshes the columns derived from them.
+#
+# Resumable: rows are processed in primary key order and committed per batch, so a
+# re-run continues after the highest id that already has a parsed value.
+#   python backfill_timestamps.py [--restart] [--batch-size 5000]
+import os
+import sys
+import time
+import argparse
+import psycopg2
+import psycopg2.extras
+from dotenv import load_dotenv
+
+from turkish_dates import parse_turkish_datetime
+from archive_version import bump_archive_version
+
+# --- Configuration ---
+load_dotenv()
+DATABASE_URL = os.getenv('DATABASE_URL')
+
+BATCH_SIZE = 5000
+
+ADD_COLUMNS_SQL = """
+    ALTER TABLE posts ADD COLUMN IF NOT EXISTS posted_at timestamptz;
+    ALTER TABLE comments ADD COLUMN IF NOT EXISTS commented_at timestamptz;
+"""
+
+# (table, typed column, source columns)
+TARGETS = [
+    ('posts', 'posted_at', ('timestamp',)),
+    ('comments', 'commented_at', ('comment_date', 'comment_time')),
+]
+
+# --- Functions ---
+def find_resume_id(conn, table, typed_column):
+    """Highest id already parsed; every lower id was handled by an earlier (committed) batch."""
+    with conn.cursor() as cursor:
+        cursor.execute(f"SELECT max(id) FROM {table} WHERE {typed_column} IS NOT NULL;")
+        return cursor.fetchone()[0] or 0
+
+def backfill_column(conn, table, typed_column, source_columns, start_after=0, batch_size=BATCH_SIZE):
+    """Parses source strings in id-ordered batches and writes the typed column."""
+    print(f"\n--- Backfilling {table}.{typed_column} from {', '.join(source_columns)} (ids > {start_after}) ---")
+    select_sql = f"SELECT id, {', '.join(source_columns)} FROM {table} WHERE id > %s ORDER BY id LIMIT %s;"
+    update_sql = f"""
+        UPDATE {table} AS t SET {typed_column} = v.parsed
+        FROM (VALUES %s) AS v(id, parsed)
+        WHERE t.id = v.id;
+    """
+    last_id = start_after
+    processed_count = 0
+    parsed_count = 0
+    unparsed_samples = []
+    batch_start = time.time()
+
+    with conn.cursor() as cursor:
+        while True:
+            cursor.execute(select_sql, (last_id, batch_size))
+            rows = cursor.fetchall()
+            if not rows: break
+
+            updates = []
+            for row in rows:
+                parsed = parse_turkish_datetime(*row[1:])
+                if parsed is not None:
+                    updates.append((row[0], parsed))
+                elif len(unparsed_samples) < 10 and row[1]:
+                    unparsed_samples.append(row[1:])
+            if updates:
+                psycopg2.extras.execute_values(cursor, update_sql, updates,
+                                               template="(%s, %s::timestamptz)", page_size=batch_size)
+            conn.commit()
+
+            last_id = rows[-1][0]
+            processed_count += len(rows)
+            parsed_count += len(updates)
+            rate = processed_count / max(time.time() - batch_start, 1e-9)
+            print(f"Up to id {last_id}: {processed_count} rows checked, {parsed_count} parsed ({rate:.0f} rows/s).")
+
+    print(f"Finished {table}.{typed_column}: {parsed_count} of {processed_count} rows parsed.")
+    if parsed_count: bump_archive_version(f"backfill_timestamps: {table}.{typed_column}")
+    if unparsed_samples:
+        print("Sample of unparseable source values (left NULL):")
+        for sample in unparsed_samples: print(f"  {sample}")
+    return processed_count, parsed_count
+
+# --- Main Execution ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill typed timestamp columns from source strings.")
+    parser.add_argument('--restart', action='store_true', help="Re-parse every row instead of resuming")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    start_run_time = time.time()
+    if not DATABASE_URL:
+        print("Error: DATABASE_URL environment variable not set.")
+        sys.exit(1)
+
+    conn = None
+    try:
+        print("Connecting to database...")
+        conn = psycopg2.connect(DATABASE_URL)
+        print("Database connection successful.")
+        with conn.cursor() as cursor:
+            cursor.execute(ADD_COLUMNS_SQL)
+        conn.commit()
+
+        for table, typed_column, source_columns in TARGETS:
+            start_after = 0 if args.restart else find_resume_id(conn, table, typed_column)
+            backfill_column(conn, table, typed_column, source_columns, start_after, args.batch_size)
+
+        # Derived columns that aggregate commented_at
+        from backfill_post_activity import ensure_activity_columns, backfill_post_activity
+        from convert_chars import rebuild_user_stats
+        ensure_activity_columns(conn)
+        backfill_post_activity(conn)
+        rebuild_user_stats(conn)
+
+        print("\nRun create_indexes.py to build the B-tree indexes on the new columns.")
+    except psycopg2.Error as e:
+        print(f"!!! Database error occurred: {e}")
+        if conn: conn.rollback()
+        sys.exit(1)
+    except KeyboardInterrupt:
+        print("\nInterrupted. Committed batches are kept; re-run to resume.")
+        if conn: conn.rollback()
+    finally:
+        if conn: conn.close(); print("\nDatabase connection closed.")
+
+    print(f"\nScript finished in {time.time() - start_run_time:.2f} seconds.")
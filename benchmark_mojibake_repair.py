@@ -0,0 +1,97 @@
+# benchmark_mojibake_repair.py
+# Checks the single-pass replacement engine (mojibake_repair.py) against the original
+# sequential str.replace() implementation and measures throughput of both over the
+# comments extracted by extract_garbled_comments.py. No database access.
+#   python benchmark_mojibake_repair.py [--input comments_with_garbled_A_char.txt] [--runs 3] [--show 10]
+#
+# The two can legitimately disagree where the sequential passes cascaded (a replacement
+# produced text that a later, shorter key matched again); every difference is listed
+# so those rows can be reviewed before switching a repair run over.
+import argparse
+import sys
+import time
+
+from convert_chars import REPLACEMENT_MAP_V7
+from mojibake_repair import ReplacementEngine, apply_fixes_sequential
+from transform_words import parse_input_file
+
+def self_check(replacement_map):
+    """Map-level checks: each key alone, all keys run together, and key-free text."""
+    engine = ReplacementEngine(replacement_map)
+    failures = []
+    for find, replace in replacement_map.items():
+        if engine.apply(find) != replace:
+            failures.append(f"key {find!r}: got {engine.apply(find)!r}, expected {replace!r}")
+    # Keys separated by a character no key contains must be replaced independently
+    separator = '\u0001'
+    keys = list(replacement_map)
+    joined = engine.apply(separator.join(keys))
+    if joined != separator.join(replacement_map[k] for k in keys):
+        failures.append("separated concatenation of all keys was not replaced key by key")
+    plain = 'Merhaba dünya, bu metinde bozuk karakter yok.'
+    if engine.apply(plain) != plain:
+        failures.append("text without any key was modified")
+    return failures
+
+def first_difference(a, b, context=30):
+    index = next((i for i, (x, y) in enumerate(zip(a, b)) if x != y), min(len(a), len(b)))
+    start = max(0, index - context)
+    return index, a[start:index + context], b[start:index + context]
+
+def time_function(func, texts, runs):
+    """Returns the best wall time over 'runs' passes over all texts."""
+    best = float('inf')
+    for _ in range(runs):
+        start = time.perf_counter()
+        for text in texts:
+            func(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description="Equivalence check and throughput benchmark for mojibake repair.")
+    parser.add_argument('--input', default='comments_with_garbled_A_char.txt')
+    parser.add_argument('--runs', type=int, default=3, help="Timed passes per implementation (best is reported)")
+    parser.add_argument('--show', type=int, default=10, help="Differences to print")
+    args = parser.parse_args()
+
+    failures = self_check(REPLACEMENT_MAP_V7)
+    for failure in failures:
+        print(f"SELF-CHECK FAILED: {failure}")
+
+    entries = parse_input_file(args.input)
+    texts = [entry[field] for entry in entries for field in ('title', 'author', 'content') if entry.get(field)]
+    total_mb = sum(len(text.encode('utf-8')) for text in texts) / (1024 * 1024)
+    print(f"Loaded {len(texts)} strings ({total_mb:.2f} MB) from {len(entries)} entries.")
+
+    build_start = time.perf_counter()
+    engine = ReplacementEngine(REPLACEMENT_MAP_V7)
+    print(f"Compiled {len(REPLACEMENT_MAP_V7)} keys in {(time.perf_counter() - build_start) * 1000:.1f} ms.")
+
+    # --- Equivalence ---
+    differences = 0
+    changed = 0
+    for text in texts:
+        expected = apply_fixes_sequential(text, REPLACEMENT_MAP_V7)
+        actual = engine.apply(text)
+        if expected != text: changed += 1
+        if actual != expected:
+            differences += 1
+            if differences <= args.show:
+                index, old_part, new_part = first_difference(expected, actual)
+                print(f"\n  Difference at char {index}:\n    sequential:  {old_part!r}\n    single-pass: {new_part!r}")
+    print(f"\n{changed} of {len(texts)} strings are modified by the map; "
+          f"{differences} differ between implementations.")
+
+    # --- Throughput ---
+    print(f"\n{'impl':<12} {'seconds':>9} {'MB/s':>9} {'strings/s':>11}")
+    print("-" * 44)
+    for name, func in (('sequential', lambda t: apply_fixes_sequential(t, REPLACEMENT_MAP_V7)),
+                       ('single-pass', engine.apply)):
+        seconds = time_function(func, texts, args.runs)
+        print(f"{name:<12} {seconds:>9.3f} {total_mb / seconds:>9.2f} {len(texts) / seconds:>11.0f}")
+
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+# benchmark_repair.py
+# Throughput and accuracy of every repair engine in the repo over a golden corpus.
+# Offline: no database access.
+#   python benchmark_repair.py [--input comments_with_garbled_A_char.txt] [--golden golden_corpus.jsonl]
+#                              [--runs 3] [--output benchmark_results/<timestamp>.json] [--baseline old.json]
+#   python benchmark_repair.py --build-golden 200   # writes a review template, see below
+#
+# Two golden sets, both with known expected output:
+#   synthetic  Clean sentences from the comments of the input file, garbled the ways the
+#              archive was (UTF-8 read as cp1252, lost continuation bytes, double
+#              encoding). The truth is the clean sentence. Comments are split by id:
+#              the round-trip model only trains on ids the golden set does not use.
+#   verified   golden_corpus.jsonl, if present: {"id", "input", "expected", "verified"}
+#              lines. --build-golden writes a fixed random sample of real garbled
+#              comments with "expected" prefilled by the current best engine and
+#              "verified": false; a reviewer corrects "expected" and sets "verified":
+#              true. Only verified lines are scored. The committed file holds
+#              hand-checked real comments with lost continuation bytes ('gÃ zel'),
+#              the commonest damage in the archive and the hardest to repair.
+#
+# Accuracy is measured on edits: text_diff(input, expected) gives the expected
+# [position, removed, inserted] edits, text_diff(input, output) the engine's. An engine
+# edit equal to an expected one is a true positive. Precision and recall are reported
+# overall and per pattern (the garbled text removed, e.g. 'Ã¼' or 'Ã ').
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import subprocess
+import tracemalloc
+from collections import Counter, defaultdict
+
+from change_journal import text_diff
+from convert_chars import REPLACEMENT_MAP_V7, apply_fixes_py_v7
+from garble_flags import garble_flags_of
+from mojibake_repair import (SUSPICIOUS_CHARS, RoundTripRepairer, TurkishCharModel, apply_fixes_sequential,
+                             get_engine, get_word_engine)
+from transform_words import WORD_REPLACEMENT_MAP, apply_word_fixes_optimized, build_regex_and_replace_func, parse_input_file
+
+DEFAULT_GOLDEN_FILE = 'golden_corpus.jsonl'
+RESULTS_DIR = 'benchmark_results'
+SEED = 20250101
+GOLDEN_SHARE = 5 # Every 5th comment id goes to the golden set, the rest trains the model
+TURKISH_NON_ASCII = set('çğıöşüÇĞİÖŞÜâîû')
+GARBLE_MODES = ['cp1252', 'lost_byte', 'double']
+
+# --- Golden corpus ---
+def _cp1252(data):
+    """Bytes as cp1252 text; bytes cp1252 leaves undefined keep their latin-1 character."""
+    return ''.join(bytes([b]).decode('cp1252', errors='ignore') or chr(b) for b in data)
+
+def garble(text, mode):
+    """Garbles every Turkish letter of text the way the archive was damaged."""
+    out = []
+    for char in text:
+        if char not in TURKISH_NON_ASCII:
+            out.append(char)
+        elif mode == 'cp1252':
+            out.append(_cp1252(char.encode('utf-8')))
+        elif mode == 'lost_byte':
+            out.append(_cp1252(char.encode('utf-8')[:1]) + ' ') # 'ü' -> 'Ã '
+        else:
+            out.append(_cp1252(_cp1252(char.encode('utf-8')).encode('utf-8')))
+    return ''.join(out)
+
+def clean_sentences(text):
+    """Sentences of text without any garble marker or mojibake-looking character."""
+    for sentence in text.replace('!', '.').replace('?', '.').replace('\n', '.').split('.'):
+        sentence = sentence.strip()
+        if len(sentence) < 15 or garble_flags_of(sentence): continue
+        if any(char in SUSPICIOUS_CHARS for char in sentence): continue
+        yield sentence
+
+def load_corpus(input_file):
+    """(training texts, synthetic golden cases) from the extracted comments."""
+    entries = parse_input_file(input_file)
+    training = []
+    golden = []
+    rng = random.Random(SEED)
+    for entry in entries:
+        texts = [entry.get('author'), entry.get('content')]
+        if entry['id'] % GOLDEN_SHARE:
+            training.extend(text for text in texts if text)
+            continue
+        for sentence in clean_sentences(entry.get('content') or ''):
+            if not TURKISH_NON_ASCII.intersection(sentence): continue
+            mode = rng.choice(GARBLE_MODES)
+            golden.append({'id': f"{entry['id']}:{len(golden)}", 'mode': mode,
+                           'input': garble(sentence, mode), 'expected': sentence})
+    return entries, training, golden
+
+def load_verified(golden_file):
+    if not os.path.exists(golden_file): return []
+    with open(golden_file, 'r', encoding='utf-8') as f:
+        cases = [json.loads(line) for line in f if line.strip()]
+    return [case for case in cases if case.get('verified')]
+
+def build_golden_template(entries, engine, size, golden_file):
+    """Writes a seeded sample of garbled comments with prefilled, unverified expectations."""
+    if os.path.exists(golden_file):
+        print(f"'{golden_file}' exists; not overwriting reviewed entries.")
+        return
+    rng = random.Random(SEED)
+    garbled = [entry for entry in entries if garble_flags_of(entry.get('content'))]
+    sample = sorted(rng.sample(garbled, min(size, len(garbled))), key=lambda entry: entry['id'])
+    expected = engine(entry['content'] for entry in sample)
+    with open(golden_file, 'w', encoding='utf-8') as f:
+        for entry, fixed in zip(sample, expected):
+            f.write(json.dumps({'id': entry['id'], 'input': entry['content'], 'expected': fixed,
+                                'verified': False}, ensure_ascii=False) + '\n')
+    print(f"Wrote {len(sample)} cases to '{golden_file}'. Correct 'expected' and set 'verified' to true.")
+
+# --- Engines ---
+def build_engines(training_texts):
+    """name -> batch function (list of texts -> list of repaired texts)."""
+    model = TurkishCharModel()
+    model.train(training_texts)
+    v7 = get_engine(REPLACEMENT_MAP_V7)
+    words = get_word_engine(WORD_REPLACEMENT_MAP)
+    regex, replace_func = build_regex_and_replace_func(WORD_REPLACEMENT_MAP)
+    return {
+        'v7_sequential': lambda texts: [apply_fixes_sequential(text, REPLACEMENT_MAP_V7) for text in texts],
+        'v7_map': lambda texts: [apply_fixes_py_v7(text, REPLACEMENT_MAP_V7) for text in texts],
+        'v7_map_batch': v7.apply_many,
+        'v3_words': lambda texts: [apply_word_fixes_optimized(text, regex, replace_func) for text in texts],
+        'v3_words_batch': words.apply_many,
+        'roundtrip': lambda texts: RoundTripRepairer(model).repair_many(texts),
+        'roundtrip+v7': lambda texts: RoundTripRepairer(model, fallback=v7).repair_many(texts),
+        'roundtrip+v3': lambda texts: RoundTripRepairer(model, fallback=words).repair_many(texts),
+    }
+
+# --- Measurements ---
+def measure_speed(engine, texts, runs):
+    total_bytes = sum(len(text.encode('utf-8')) for text in texts)
+    best = float('inf')
+    for _ in range(runs):
+        start = time.perf_counter()
+        engine(list(texts))
+        best = min(best, time.perf_counter() - start)
+    return {'seconds': best, 'mb_per_s': total_bytes / (1024 * 1024) / best, 'rows_per_s': len(texts) / best}
+
+def measure_peak_memory(engine, texts):
+    """Peak Python allocation (MiB) during one untimed run."""
+    tracemalloc.start()
+    engine(list(texts))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / (1024 * 1024)
+
+def _ratio(numerator, denominator):
+    return numerator / denominator if denominator else None
+
+def score(cases, outputs):
+    """Edit-level precision/recall, overall and per pattern, plus exact-match rate."""
+    counts = defaultdict(Counter) # pattern -> tp / fp / fn
+    exact = 0
+    for case, output in zip(cases, outputs):
+        if output == case['expected']: exact += 1
+        expected = {tuple(op) for op in text_diff(case['input'], case['expected'])}
+        produced = {tuple(op) for op in text_diff(case['input'], output)}
+        for op in expected & produced: counts[op[1]]['tp'] += 1
+        for op in produced - expected: counts[op[1]]['fp'] += 1
+        for op in expected - produced: counts[op[1]]['fn'] += 1
+    total = sum(counts.values(), Counter())
+
+    def summary(c):
+        return {'tp': c['tp'], 'fp': c['fp'], 'fn': c['fn'],
+                'precision': _ratio(c['tp'], c['tp'] + c['fp']), 'recall': _ratio(c['tp'], c['tp'] + c['fn'])}
+    return {'cases': len(cases), 'exact_match': _ratio(exact, len(cases)), **summary(total),
+            'patterns': {pattern: summary(c) for pattern, c in
+                         sorted(counts.items(), key=lambda item: -sum(item[1].values()))}}
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _fmt(value, spec='.3f'):
+    return format(value, spec) if value is not None else '-'
+
+def print_report(results, baseline, show_patterns):
+    print(f"\n{'engine':<15} {'MB/s':>8} {'rows/s':>9} {'peak MiB':>9} | "
+          f"{'set':<9} {'prec':>6} {'recall':>6} {'exact':>6}")
+    print("-" * 80)
+    for name, result in results['engines'].items():
+        speed = result['speed']
+        first = True
+        for set_name, accuracy in result['accuracy'].items():
+            prefix = (f"{name:<15} {speed['mb_per_s']:>8.2f} {speed['rows_per_s']:>9.0f} {result['peak_mib']:>9.1f}"
+                      if first else ' ' * 44)
+            line = (f"{prefix} | {set_name:<9} {_fmt(accuracy['precision']):>6} {_fmt(accuracy['recall']):>6} "
+                    f"{_fmt(accuracy['exact_match']):>6}")
+            old = (baseline or {}).get('engines', {}).get(name, {}).get('accuracy', {}).get(set_name)
+            if old and old['recall'] is not None and accuracy['recall'] is not None:
+                line += f"  (recall {accuracy['recall'] - old['recall']:+.3f}, precision "
+                line += f"{(accuracy['precision'] or 0) - (old['precision'] or 0):+.3f} vs baseline)"
+            print(line)
+            first = False
+        if baseline and name in baseline.get('engines', {}):
+            old_speed = baseline['engines'][name]['speed']['mb_per_s']
+            print(f"{'':<15} speed {100.0 * (speed['mb_per_s'] / old_speed - 1):+.1f}% vs baseline")
+    for name, result in results['engines'].items():
+        patterns = result['accuracy']['synthetic']['patterns']
+        if not show_patterns or not patterns: continue
+        print(f"\n{name}: top patterns (synthetic)")
+        for pattern, c in list(patterns.items())[:show_patterns]:
+            print(f"  {pattern!r:<12} tp={c['tp']:<6} fp={c['fp']:<6} fn={c['fn']:<6} "
+                  f"precision={_fmt(c['precision'])} recall={_fmt(c['recall'])}")
+
+# --- Main Execution ---
+def main():
+    parser = argparse.ArgumentParser(description="Throughput and accuracy benchmark of the repair engines.")
+    parser.add_argument('--input', default='comments_with_garbled_A_char.txt')
+    parser.add_argument('--golden', default=DEFAULT_GOLDEN_FILE, help="Hand-verified cases (JSONL)")
+    parser.add_argument('--build-golden', type=int, metavar='N', help="Write an N-case review template and exit")
+    parser.add_argument('--engines', nargs='*', help="Subset of engines to run")
+    parser.add_argument('--runs', type=int, default=3, help="Timed passes per engine (best is reported)")
+    parser.add_argument('--show-patterns', type=int, default=0, help="Per-pattern lines to print per engine")
+    parser.add_argument('--output', help="Results JSON (default: benchmark_results/<timestamp>.json)")
+    parser.add_argument('--baseline', help="Earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    entries, training, synthetic = load_corpus(args.input)
+    engines = build_engines(training)
+    if args.build_golden:
+        build_golden_template(entries, engines['roundtrip+v7'], args.build_golden, args.golden)
+        return
+    if args.engines:
+        unknown = set(args.engines) - set(engines)
+        if unknown:
+            print(f"Unknown engines: {', '.join(sorted(unknown))}. Available: {', '.join(engines)}")
+            sys.exit(1)
+        engines = {name: engines[name] for name in args.engines}
+
+    verified = load_verified(args.golden)
+    throughput_texts = [text for entry in entries for text in (entry.get('author'), entry.get('content')) if text]
+    print(f"{len(throughput_texts)} strings for throughput, {len(synthetic)} synthetic and "
+          f"{len(verified)} verified golden cases, model trained on {len(training)} strings.")
+
+    results = {'created_at': time.strftime('%Y-%m-%d %H:%M:%S'), 'git_commit': _git_commit(),
+               'python': platform.python_version(), 'input': args.input,
+               'corpus': {'throughput_strings': len(throughput_texts), 'synthetic_cases': len(synthetic),
+                          'verified_cases': len(verified), 'training_strings': len(training)},
+               'engines': {}}
+    golden_sets = {'synthetic': synthetic}
+    if verified: golden_sets['verified'] = verified
+    for name, engine in engines.items():
+        print(f"Running {name}...")
+        results['engines'][name] = {
+            'speed': measure_speed(engine, throughput_texts, args.runs),
+            'peak_mib': measure_peak_memory(engine, throughput_texts),
+            'accuracy': {set_name: score(cases, engine([case['input'] for case in cases]))
+                         for set_name, cases in golden_sets.items()},
+        }
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_report(results, baseline, args.show_patterns)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\nResults saved to '{output}'.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+# benchmark_title_search.py
+# Compares latency of the original ILIKE '%q%' title search with the indexed search
+# used by /search/threads. Runs against the database configured in .env.
+#   python benchmark_title_search.py [--runs 50] [query ...]
+import argparse
+import statistics
+import time
+
+from app import create_app
+from app.models.search import search_titles, search_titles_ilike
+
+DEFAULT_QUERIES = ['full discography', 'metallica', 'istanbul', 'black metal', 'albüm', 'rock', 'x']
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    index = max(0, min(len(samples) - 1, int(round(pct / 100.0 * len(samples) + 0.5)) - 1))
+    return samples[index]
+
+def time_search(search_func, query, runs):
+    """Returns (sorted latencies in ms, result count) for 'runs' calls of search_func."""
+    latencies = []
+    result_count = 0
+    for _ in range(runs):
+        start = time.perf_counter()
+        result_count = len(search_func(query, limit=100))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return sorted(latencies), result_count
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark title search implementations.")
+    parser.add_argument('queries', nargs='*', default=DEFAULT_QUERIES)
+    parser.add_argument('--runs', type=int, default=50, help="Timed runs per query and implementation")
+    parser.add_argument('--warmup', type=int, default=3, help="Untimed runs before measuring")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        print(f"\n{'query':<20} {'impl':<8} {'rows':>5} {'p50 ms':>9} {'p99 ms':>9} {'mean ms':>9}")
+        print("-" * 65)
+        for query in args.queries:
+            for name, search_func in (('ilike', search_titles_ilike), ('indexed', search_titles)):
+                for _ in range(args.warmup): search_func(query, limit=100)
+                latencies, result_count = time_search(search_func, query, args.runs)
+                print(f"{query[:20]:<20} {name:<8} {result_count:>5} "
+                      f"{percentile(latencies, 50):>9.2f} {percentile(latencies, 99):>9.2f} {statistics.mean(latencies):>9.2f}")
+
+if __name__ == "__main__":
+    main()
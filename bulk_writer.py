@@ -0,0 +1,101 @@
+# bulk_writer.py
+# Bulk UPDATE path for the repair scripts. Instead of one UPDATE ... WHERE id = %s per
+# row (execute_batch), each batch of (id, value, ...) rows is streamed into a session
+# temp table with COPY FROM STDIN and applied with a single UPDATE ... FROM join.
+#
+#   writer = BulkUpdater(write_conn, 'comments', 'id', ['author', 'content'])
+#   writer.apply([(comment_id, fixed_author, fixed_content), ...])
+#   write_conn.commit()
+#   print(writer.report())
+#
+# If COPY or temp tables are not available on the connection (e.g. behind a pooler that
+# rejects COPY, or a role without TEMP privilege) the writer falls back to execute_batch.
+import io
+import time
+
+import psycopg2
+import psycopg2.extras
+
+def _copy_text_field(value):
+    """Encodes one value for COPY's text format."""
+    if value is None: return '\\N'
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+def copy_rows(cursor, table_name, columns, rows):
+    """Streams rows (tuples in column order) into table_name with COPY FROM STDIN."""
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(_copy_text_field(value) for value in row))
+        buffer.write('\n')
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table_name} ({', '.join(columns)}) FROM STDIN", buffer)
+
+class BulkUpdater:
+    """Applies batches of (pk, col1, col2, ...) rows to one table. The caller commits."""
+
+    def __init__(self, conn, table_name, pk_column, columns, use_copy=True):
+        self.conn = conn
+        self.table_name = table_name
+        self.pk_column = pk_column
+        self.columns = list(columns)
+        self.method = 'copy' if use_copy else 'execute_batch'
+        self.temp_table = f"bulk_{table_name}_{'_'.join(self.columns)}"[:63]
+        self.rows_written = 0
+        self.seconds = 0.0
+
+    def apply(self, rows):
+        """Writes the batch; returns the number of rows updated."""
+        rows = list(rows)
+        if not rows: return 0
+        start = time.perf_counter()
+        if self.method == 'copy':
+            updated = self._apply_copy(rows)
+            if updated is None: # COPY failed; the batch is retried below
+                updated = self._apply_execute_batch(rows)
+        else:
+            updated = self._apply_execute_batch(rows)
+        self.seconds += time.perf_counter() - start
+        self.rows_written += len(rows)
+        return updated
+
+    def _apply_copy(self, rows):
+        all_columns = [self.pk_column] + self.columns
+        column_list = ', '.join(all_columns)
+        with self.conn.cursor() as cursor:
+            # A savepoint keeps the caller's transaction usable if COPY is refused
+            cursor.execute("SAVEPOINT bulk_writer_copy")
+            try:
+                # Same column types as the target; lives for the session, emptied per batch
+                cursor.execute(f"CREATE TEMP TABLE IF NOT EXISTS {self.temp_table} AS "
+                               f"SELECT {column_list} FROM {self.table_name} WITH NO DATA")
+                cursor.execute(f"TRUNCATE {self.temp_table}")
+                copy_rows(cursor, self.temp_table, all_columns, rows)
+            except psycopg2.Error as e:
+                cursor.execute("ROLLBACK TO SAVEPOINT bulk_writer_copy")
+                print(f"Warning: COPY unavailable ({str(e).strip()}); falling back to execute_batch.")
+                self.method = 'execute_batch'
+                return None
+            cursor.execute("RELEASE SAVEPOINT bulk_writer_copy")
+
+            assignments = ', '.join(f"{column} = s.{column}" for column in self.columns)
+            cursor.execute(f"UPDATE {self.table_name} AS t SET {assignments} FROM {self.temp_table} AS s "
+                           f"WHERE t.{self.pk_column} = s.{self.pk_column}")
+            return cursor.rowcount
+
+    def _apply_execute_batch(self, rows):
+        """One UPDATE per row. execute_batch does not report a total, so all rows count as updated."""
+        assignments = ', '.join(f"{column} = %s" for column in self.columns)
+        update_sql = f"UPDATE {self.table_name} SET {assignments} WHERE {self.pk_column} = %s"
+        with self.conn.cursor() as cursor:
+            psycopg2.extras.execute_batch(cursor, update_sql, [tuple(row[1:]) + (row[0],) for row in rows],
+                                          page_size=500)
+        return len(rows)
+
+    @property
+    def rows_per_second(self):
+        return self.rows_written / self.seconds if self.seconds else 0.0
+
+    def report(self):
+        return (f"{self.rows_written} rows written to {self.table_name} via {self.method} "
+                f"in {self.seconds:.2f}s ({self.rows_per_second:.0f} rows/s)")
@@ -0,0 +1,339 @@
+# change_journal.py
+# Compact, reversible record of what a repair run changed, and the command that reverts it.
+#   python change_journal.py show repair_journals/update_A_db-comments-20250101-120000.jsonl.gz [--limit 20]
+#   python change_journal.py undo repair_journals/convert_chars-*.jsonl.gz [--dry-run]
+#
+# A journal is gzip-compressed JSONL: a header naming the table, primary key and columns,
+# then one line per changed row with, for each changed column, the edit operations
+# [position, removed, inserted] (positions in the original text) and the CRC-32 of the
+# text as written. Only the changed spans are stored, never full before/after copies.
+#
+# RepairJob writes each batch's entries and flushes them BEFORE the batch commits, so
+# every committed change is journaled. Undo fetches the current values in batches,
+# checks the CRC (a row edited since the run is reported as a conflict and left alone),
+# applies the operations in reverse and writes the originals back with BulkUpdater.
+# A row appears once per journal; undo several journals newest first.
+#
+# A run that was killed leaves a journal without the gzip end marker. Everything up to
+# its last flushed batch is still read; the cut-off tail is reported and skipped.
+import os
+import re
+import sys
+import json
+import gzip
+import time
+import zlib
+import difflib
+import argparse
+
+from dotenv import load_dotenv
+
+from archive_version import bump_archive_version
+# psycopg2 / bulk_writer are imported where the database is used, so the diff helpers
+# stay usable offline (transform_words.py, benchmark_repair.py)
+
+JOURNAL_FORMAT = 1
+UNDO_BATCH_SIZE = 5000
+
+def journal_dir():
+    """Resolved at call time so REPAIR_JOURNAL_DIR from .env applies."""
+    return os.environ.get('REPAIR_JOURNAL_DIR', 'repair_journals')
+
+def text_crc(text):
+    return zlib.crc32(text.encode('utf-8')) if text is not None else None
+
+# --- Diffs ---
+def text_diff(old, new):
+    """Edit operations turning old into new: [[position in old, removed, inserted], ...]."""
+    # Repairs are local; trimming the common ends keeps SequenceMatcher on a small middle
+    prefix = 0
+    limit = min(len(old), len(new))
+    while prefix < limit and old[prefix] == new[prefix]: prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and old[-1 - suffix] == new[-1 - suffix]: suffix += 1
+    old_middle = old[prefix:len(old) - suffix]
+    new_middle = new[prefix:len(new) - suffix]
+    ops = []
+    matcher = difflib.SequenceMatcher(None, old_middle, new_middle)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag != 'equal':
+            ops.append([prefix + i1, old_middle[i1:i2], new_middle[j1:j2]])
+    return ops
+
+def apply_diff(text, ops, reverse=False):
+    """Applies ops to the original text, or with reverse=True undoes them on the changed text."""
+    pieces = []
+    position = 0 # In the text being read
+    shift = 0    # len(changed) - len(original) so far
+    for start, removed, inserted in ops:
+        if reverse:
+            start, removed, inserted = start + shift, inserted, removed
+            shift += len(removed) - len(inserted)
+        pieces.append(text[position:start])
+        if text[start:start + len(removed)] != removed:
+            raise ValueError(f"journal entry does not match the text at position {start}")
+        pieces.append(inserted)
+        position = start + len(removed)
+    pieces.append(text[position:])
+    return ''.join(pieces)
+
+def column_change(old, new):
+    """Journal form of one column's change."""
+    if old is None or new is None:
+        return {'old': old, 'new': new} # NULL <-> text: nothing to diff
+    return {'crc': text_crc(new), 'was': text_crc(old), 'ops': text_diff(old, new)}
+
+def is_reverted(current, change):
+    """True if the column already holds its original value (e.g. an undo is re-run)."""
+    if 'ops' not in change: return current == change['old'] and current != change['new']
+    return current is not None and text_crc(current) == change['was'] != change['crc']
+
+def revert_column(current, change):
+    """Original value from the current one, or raises ValueError if the column changed since."""
+    if 'ops' not in change:
+        if current != change['new']: raise ValueError("value changed since the run")
+        return change['old']
+    if current is None or text_crc(current) != change['crc']:
+        raise ValueError("value changed since the run")
+    return apply_diff(current, change['ops'], reverse=True)
+
+# --- Writing ---
+class ChangeJournal:
+    """Per-run journal of changed rows. The file is created on the first change."""
+
+    def __init__(self, path, run_name, table_name, pk_column, columns):
+        self.path = path
+        self.run_name = run_name
+        self.table_name = table_name
+        self.pk_column = pk_column
+        self.columns = list(columns)
+        self.rows = 0
+        self.text_bytes = 0 # What full before/after copies would have taken
+        self._file = None
+
+    @classmethod
+    def for_run(cls, run_name, table_name, pk_column, columns):
+        """Journal at <journal_dir>/<run name>-<timestamp>-<pid>.jsonl.gz."""
+        safe_name = re.sub(r'[^\w.-]+', '-', run_name).strip('-')
+        path = os.path.join(journal_dir(), f"{safe_name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.jsonl.gz")
+        return cls(path, run_name, table_name, pk_column, columns)
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        # Never overwrite another run's journal: the same run name started twice in one
+        # second by this process gets a -2, -3, ... suffix
+        stem, attempt = re.sub(r'\.jsonl\.gz$', '', self.path), 1
+        while True:
+            try:
+                self._file = gzip.open(self.path, 'xt', encoding='utf-8')
+                break
+            except FileExistsError:
+                attempt += 1
+                self.path = f"{stem}-{attempt}.jsonl.gz"
+        self._write({'type': 'meta', 'format': JOURNAL_FORMAT, 'run': self.run_name,
+                     'table': self.table_name, 'pk_column': self.pk_column, 'columns': self.columns,
+                     'started_at': time.strftime('%Y-%m-%d %H:%M:%S')})
+
+    def _write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+
+    def record_batch(self, rows, updates):
+        """Journals a batch: rows are the (pk, col1, ...) originals, updates the changed rows."""
+        if not updates: return
+        if self._file is None: self._open()
+        originals = {row[0]: row[1:] for row in rows}
+        for update in updates:
+            original = originals[update[0]]
+            changes = {}
+            for column, old, new in zip(self.columns, original, update[1:]):
+                if old != new:
+                    changes[column] = column_change(old, new)
+                    self.text_bytes += len((old or '').encode('utf-8')) + len((new or '').encode('utf-8'))
+            if changes:
+                self._write({'id': update[0], 'cols': changes})
+                self.rows += 1
+        self._file.flush() # Readable up to here even if the process dies
+
+    def close(self):
+        if self._file is not None and not self._file.closed: self._file.close()
+
+    def report(self):
+        if not self.rows: return f"No changes journaled for {self.run_name}."
+        size = os.path.getsize(self.path)
+        return (f"Journaled {self.rows} changed rows to '{self.path}' ({size / 1024:.1f} KiB; "
+                f"full before/after text would be {self.text_bytes / 1024:.1f} KiB).")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+# --- Reading ---
+def _read_header_line(f, path):
+    try:
+        line = f.readline()
+    except (EOFError, zlib.error) as e:
+        raise ValueError(f"'{path}' is cut off before its header line ({e})")
+    header = json.loads(line) if line.endswith('\n') else {}
+    if header.get('type') != 'meta':
+        raise ValueError(f"'{path}' is not a change journal (no header line)")
+    return header
+
+def read_header(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        return _read_header_line(f, path)
+
+def read_journal(path):
+    """Returns (header, iterator over change records). The file is streamed.
+
+    A journal cut off by a killed run yields its complete lines, then prints a warning.
+    """
+    f = gzip.open(path, 'rt', encoding='utf-8')
+    try:
+        header = _read_header_line(f, path)
+    except ValueError:
+        f.close()
+        raise
+
+    def records():
+        count = 0
+        with f:
+            try:
+                for line in f:
+                    if not line.endswith('\n'):
+                        raise EOFError("last line is incomplete")
+                    if line.strip():
+                        count += 1
+                        yield json.loads(line)
+            except (EOFError, zlib.error) as e:
+                print(f"Warning: '{path}' is truncated ({e}); using the {count} complete records before the cut.")
+    return header, records()
+
+def _batches(records, size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch: yield batch
+
+def undo_journal(conn, path, batch_size=UNDO_BATCH_SIZE, dry_run=False):
+    """Reverts the journaled changes that are still current. Commits per batch.
+
+    Returns {'restored', 'reverted', 'conflicts', 'missing'} ('reverted': already original,
+    e.g. from an interrupted undo); conflicting rows are listed on stdout.
+    """
+    from bulk_writer import BulkUpdater
+    header, records = read_journal(path)
+    table_name, pk_column, columns = header['table'], header['pk_column'], header['columns']
+    print(f"\n--- Undoing '{header['run']}' on {table_name} ({', '.join(columns)}) from '{path}' ---")
+    writer = BulkUpdater(conn, table_name, pk_column, columns)
+    stats = {'restored': 0, 'reverted': 0, 'conflicts': 0, 'missing': 0}
+    for batch in _batches(records, batch_size):
+        with conn.cursor() as cursor:
+            cursor.execute(f"SELECT {pk_column}, {', '.join(columns)} FROM {table_name} "
+                           f"WHERE {pk_column} = ANY(%s)", ([record['id'] for record in batch],))
+            current = {row[0]: list(row[1:]) for row in cursor.fetchall()}
+        restores = []
+        for record in batch:
+            values = current.get(record['id'])
+            if values is None:
+                stats['missing'] += 1
+                continue
+            if all(is_reverted(values[columns.index(column)], change) for column, change in record['cols'].items()):
+                stats['reverted'] += 1
+                continue
+            try:
+                restored = list(values)
+                for column, change in record['cols'].items():
+                    index = columns.index(column)
+                    restored[index] = revert_column(values[index], change)
+            except ValueError as e:
+                stats['conflicts'] += 1
+                print(f"  Conflict, left as is: {pk_column}={record['id']} ({e})")
+                continue
+            restores.append((record['id'], *restored))
+        if restores and not dry_run: writer.apply(restores)
+        stats['restored'] += len(restores)
+        if dry_run: conn.rollback()
+        else: conn.commit()
+        print(f"  {stats['restored']} rows {'would be ' if dry_run else ''}restored so far "
+              f"({stats['reverted']} already reverted, {stats['conflicts']} conflicts, {stats['missing']} missing)")
+    return stats
+
+def show_journal(path, limit):
+    header, records = read_journal(path)
+    print(f"Run '{header['run']}' on {header['table']} ({', '.join(header['columns'])}), started {header['started_at']}")
+    shown = 0
+    total = 0
+    for record in records:
+        total += 1
+        if shown >= limit: continue
+        shown += 1
+        for column, change in record['cols'].items():
+            if 'ops' in change:
+                edits = ', '.join(f"@{start} {removed!r} -> {inserted!r}" for start, removed, inserted in change['ops'])
+            else:
+                edits = f"{change['old']!r} -> {change['new']!r}"
+            print(f"{header['pk_column']}={record['id']} {column}: {edits}")
+    print(f"{total} changed rows in journal.")
+
+# --- Main Execution ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or revert a repair run's change journal.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    show_parser = subparsers.add_parser('show', help="Print the journaled edits")
+    show_parser.add_argument('journal')
+    show_parser.add_argument('--limit', type=int, default=20, help="Rows to print")
+    undo_parser = subparsers.add_parser('undo', help="Revert the journaled changes in the database")
+    undo_parser.add_argument('journals', nargs='+', help="Journal files; several are undone newest first")
+    undo_parser.add_argument('--dry-run', action='store_true', help="Check every row but write nothing")
+    args = parser.parse_args()
+
+    if args.command == 'show':
+        try:
+            show_journal(args.journal, args.limit)
+        except (OSError, ValueError) as e:
+            print(f"!!! Cannot read journal: {e}")
+            sys.exit(1)
+        sys.exit(0)
+
+    import psycopg2
+
+    load_dotenv()
+    DATABASE_URL = os.getenv('DATABASE_URL')
+    if not DATABASE_URL:
+        print("Error: DATABASE_URL environment variable not set.")
+        sys.exit(1)
+    # Newest run first, so rows changed by several runs step back through each of them
+    try:
+        journals = sorted(args.journals, key=lambda path: read_header(path)['started_at'], reverse=True)
+    except (OSError, ValueError) as e:
+        print(f"!!! Cannot read journal: {e}")
+        sys.exit(1)
+    if not args.dry_run:
+        print("!!! This will write the journaled original values back to the database. !!!")
+        confirm = input("Type 'YES' to confirm you wish to proceed: ")
+        if confirm != 'YES': print("Operation cancelled."); sys.exit()
+
+    conn = None
+    restored = 0
+    interrupted = False
+    try:
+        conn = psycopg2.connect(DATABASE_URL)
+        for path in journals:
+            stats = undo_journal(conn, path, dry_run=args.dry_run)
+            restored += stats['restored']
+    except KeyboardInterrupt:
+        interrupted = True
+        print("\nInterrupted; batches committed so far stay reverted. Re-run to continue.")
+    except (OSError, EOFError, ValueError, psycopg2.Error) as e:
+        print(f"!!! Undo stopped: {e}")
+        if conn: conn.rollback()
+    finally:
+        if conn: conn.close()
+        # An interrupted undo has no stats, but may have committed batches
+        if (restored or interrupted) and not args.dry_run:
+            bump_archive_version("change_journal undo: " + ", ".join(os.path.basename(path) for path in journals))
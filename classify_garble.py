@@ -0,0 +1,102 @@
+# classify_garble.py
+# One-pass classifier for the garble_flags column (see garble_flags.py).
+#   python classify_garble.py [--all] [--batch-size 20000]
+#
+# 1. Adds garble_flags, archive_garble_flags() and the keep-current triggers.
+# 2. Fills the flags of unclassified rows (or of all rows with --all, e.g. after a new
+#    family was added) in id-range batches, computed inside PostgreSQL.
+# 3. Creates the partial indexes (create_indexes.py) and prints the dirty-set size.
+# Re-running only classifies rows that are still NULL.
+import os
+import sys
+import time
+import argparse
+import psycopg2
+from dotenv import load_dotenv
+
+from create_indexes import STATEMENTS, create_indexes
+from garble_flags import FAMILY_MARKERS, TABLE_COLUMNS, ensure_garble_flags, flags_expression
+
+# --- Configuration ---
+load_dotenv()
+DATABASE_URL = os.getenv('DATABASE_URL')
+
+# --- Functions ---
+def classify_table(conn, table_name, batch_size, reclassify=False):
+    """Sets garble_flags for every id range of the table; commits per batch."""
+    print(f"\n--- Classifying '{table_name}' ({', '.join(TABLE_COLUMNS[table_name])}) ---")
+    with conn.cursor() as cursor:
+        cursor.execute(f"SELECT min(id), max(id) FROM {table_name}")
+        low, high = cursor.fetchone()
+    conn.commit()
+    if low is None:
+        print("Table is empty.")
+        return 0
+
+    only_unclassified = "" if reclassify else "AND garble_flags IS NULL"
+    update_sql = f"""
+        UPDATE {table_name} SET garble_flags = {flags_expression(table_name)}
+        WHERE id >= %s AND id < %s {only_unclassified}
+    """
+    classified = 0
+    start_time = time.time()
+    with conn.cursor() as cursor:
+        for batch_start in range(low, high + 1, batch_size):
+            cursor.execute(update_sql, (batch_start, batch_start + batch_size))
+            classified += cursor.rowcount
+            conn.commit()
+            done = min(batch_start + batch_size, high + 1) - low
+            elapsed = time.time() - start_time
+            print(f"  ids up to {batch_start + batch_size - 1}: {classified} rows classified "
+                  f"({100.0 * done / (high - low + 1):.1f}% of id range, {classified / max(elapsed, 1e-9):.0f} rows/s)")
+    return classified
+
+def print_dirty_summary(conn):
+    """Rows per family among the dirty set (served by the partial indexes)."""
+    print("\n--- Dirty rows per family ---")
+    with conn.cursor() as cursor:
+        for table_name in TABLE_COLUMNS:
+            columns = ", ".join(f"count(*) FILTER (WHERE garble_flags & {flag} <> 0)" for flag, _ in FAMILY_MARKERS)
+            cursor.execute(f"SELECT count(*), {columns} FROM {table_name} WHERE garble_flags <> 0")
+            total, *per_family = cursor.fetchone()
+            families = ", ".join(f"'{marker}': {count}" for (_, marker), count in zip(FAMILY_MARKERS, per_family))
+            print(f"{table_name}: {total} dirty rows ({families})")
+    conn.rollback()
+
+# --- Main Execution ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Classify rows by mojibake family into garble_flags.")
+    parser.add_argument('--all', action='store_true', help="Reclassify every row, not only unclassified ones")
+    parser.add_argument('--batch-size', type=int, default=20000, help="Ids per UPDATE/commit")
+    args = parser.parse_args()
+
+    start_run_time = time.time()
+    if not DATABASE_URL:
+        print("Error: DATABASE_URL environment variable not set.")
+        sys.exit(1)
+
+    conn = None
+    try:
+        print("Connecting to database...")
+        conn = psycopg2.connect(DATABASE_URL)
+        print("Database connection successful.")
+
+        print("Adding garble_flags columns, function and triggers (if missing)...")
+        ensure_garble_flags(conn)
+        for table_name in TABLE_COLUMNS:
+            classify_table(conn, table_name, args.batch_size, reclassify=args.all)
+
+        conn.autocommit = True # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+        failed = create_indexes(conn, [s for s in STATEMENTS if 'garble' in s[1]])
+        conn.autocommit = False
+        print_dirty_summary(conn)
+        if failed: print(f"\n!!! {failed} index statement(s) failed; see above.")
+    except KeyboardInterrupt:
+        print("\nInterrupted; committed batches are kept. Re-run to continue with unclassified rows.")
+    except psycopg2.Error as e:
+        print(f"!!! Database error: {e}")
+        if conn: conn.rollback()
+    finally:
+        if conn: conn.close(); print("\nDatabase connection closed.")
+
+    print(f"\nScript finished in {time.time() - start_run_time:.2f} seconds.")
@@ -17,4 +17,24 @@ class Config:
 
     # Database
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
-    SQLALCHEMY_TRACK_MODIFICATIONS = False # Silence the deprecation warning
\ No newline at end of file
+    SQLALCHEMY_TRACK_MODIFICATIONS = False # Silence the deprecation warning
+
+    # Pagination
+    THREAD_PAGE_SIZE = int(os.environ.get('THREAD_PAGE_SIZE', 100)) # Comments per page in thread view
+    PROFILE_PAGE_SIZE = int(os.environ.get('PROFILE_PAGE_SIZE', 50)) # Threads per page on user profiles
+    # Read profile thread lists from the precomputed 'user_threads' table (rebuild_user_threads.py)
+    USE_USER_THREADS_TABLE = os.environ.get('USE_USER_THREADS_TABLE', '').lower() in ('1', 'true', 'yes')
+    # Set by export_static.py: pages are rendered for a host that ignores query strings,
+    # so every link must be a path (see the /after/ and /before/ cursor routes)
+    STATIC_EXPORT = False
+
+    # HTTP caching: Cache-Control max-age for pages validated against the archive version
+    HTTP_CACHE_MAX_AGE = int(os.environ.get('HTTP_CACHE_MAX_AGE', 300))
+
+    # Rendered-page cache (app/models/page_cache.py), invalidated by the archive version
+    PAGE_CACHE_ENABLED = os.environ.get('PAGE_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    PAGE_CACHE_MAX_BYTES = int(os.environ.get('PAGE_CACHE_MAX_BYTES', 64 * 1024 * 1024)) # Per worker process
+    # Optional directory shared by all workers (use a tmpfs path such as /dev/shm/... for shared memory)
+    PAGE_CACHE_DIR = os.environ.get('PAGE_CACHE_DIR') or None
+    # Size bound for that directory, shared by all workers; least recently used pages are unlinked
+    PAGE_CACHE_DIR_MAX_BYTES = int(os.environ.get('PAGE_CACHE_DIR_MAX_BYTES', 256 * 1024 * 1024))
\ No newline at end of file
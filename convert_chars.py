@@ -2,11 +2,16 @@
 import os
 import sys
 import psycopg2
-import psycopg2.extras
 from dotenv import load_dotenv
 from tqdm import tqdm
 import re
 
+from archive_version import bump_archive_version
+from change_journal import ChangeJournal
+from garble_flags import candidate_where, flags_for_keys
+from repair_jobs import RepairJob
+from mojibake_repair import RoundTripRepairer, get_engine, train_model_from_db
+
 # --- Configuration ---
 load_dotenv()
 DATABASE_URL = os.getenv('DATABASE_URL')
@@ -81,82 +86,82 @@ BATCH_SIZE = 500
 
 # --- Functions ---
 def apply_fixes_py_v7(text, replacement_map):
-    """Applies replacements using the character/short-sequence map (V7)."""
+    """Applies replacements using the character/short-sequence map (V7).
+
+    Single pass, longest key wins at each position; the engine is compiled once per map.
+    """
     if text is None: return None
-    fixed_text = text
-    sorted_keys = sorted(replacement_map.keys(), key=len, reverse=True)
-    for find in sorted_keys:
-        replace = replacement_map[find]
-        fixed_text = fixed_text.replace(find, replace)
-    return fixed_text
-
-def fix_table_column_v7_two_conn(read_conn, write_conn, table_name, column_name, pk_column, replacement_map):
-    """Uses separate connections for reading (named cursor) and writing."""
-    print(f"\n--- Fixing table '{table_name}', column '{column_name}' using V7 Map (Two Connections) ---")
-    read_cursor = None
-    updated_count = 0
-    processed_count = 0
-    # Build LIKE patterns (same as before)
-    like_patterns = set()
+    return get_engine(replacement_map).apply(text)
+
+def build_candidate_where(conn, table_name, column_name, replacement_map):
+    """(SQL condition, params) selecting rows that may contain a garbled sequence from the map.
+
+    Reads the dirty set from garble_flags once classify_garble.py has run; until then
+    (or if a key belongs to no known family) it falls back to LIKE scans.
+    """
+    like_values = set()
     for key in replacement_map.keys():
         if key and key[0] in 'ÃÅÄâ':
              escaped_key_part = key[0].replace('%', '\\%').replace('_', '\\_')
-             like_patterns.add(f"{column_name} LIKE '%{escaped_key_part}%'")
-    if not like_patterns: where_clause = "1=1"
-    else: where_clause = " OR ".join(like_patterns)
+             like_values.add(f"%{escaped_key_part}%")
+    if not like_values: return "1=1", []
+    like_values = sorted(like_values)
+    like_sql = " OR ".join(f"{column_name} LIKE %s" for _ in like_values)
+    return candidate_where(conn, table_name, flags_for_keys(replacement_map), like_sql, like_values)
 
-    try:
-        # Use named cursor on the read connection (NO autocommit needed here)
-        read_cursor = read_conn.cursor(name=f'fetch_{table_name}_{column_name}_v7')
-        sql_select = f"SELECT {pk_column}, {column_name} FROM {table_name} WHERE {where_clause}"
-        read_cursor.execute(sql_select)
-        print(f"Fetching rows from '{table_name}' matching potential encoding patterns...")
-
-        while True:
-            rows_to_update = []
-            results = read_cursor.fetchmany(BATCH_SIZE)
-            if not results: break
-
-            processed_count += len(results)
-            print(f"Processing batch of {len(results)} rows (Total checked: {processed_count})...")
-
-            for row_pk, original_text in tqdm(results, desc="Applying V7 fixes"):
-                if original_text:
-                    fixed_text = apply_fixes_py_v7(original_text, replacement_map)
-                    if fixed_text != original_text:
-                        rows_to_update.append((fixed_text, row_pk))
-
-            # Update using the *separate* write connection
-            if rows_to_update:
-                print(f"Updating {len(rows_to_update)} rows via write connection...")
-                # Use a standard cursor for writing on the write connection
-                with write_conn.cursor() as write_cursor:
-                    update_sql = f"UPDATE {table_name} SET {column_name} = %s WHERE {pk_column} = %s"
-                    psycopg2.extras.execute_batch(write_cursor, update_sql, rows_to_update, page_size=BATCH_SIZE)
-                    # Commit changes on the write connection
-                    write_conn.commit()
-                    updated_count += len(rows_to_update)
-                # No write_cursor.close() needed with 'with' statement
-
-        print(f"Finished processing '{table_name}.{column_name}'. Total rows updated: {updated_count} out of {processed_count} checked.")
+def fix_table_column_v7_two_conn(read_conn, write_conn, table_name, column_name, pk_column, replacement_map,
+                                 id_range=None, verbose=True, bump_version=True, restart=False, repairer=None):
+    """Uses separate connections for reading (keyset batches) and writing.
 
-    except psycopg2.Error as e:
-        print(f"!!! Database error occurred for {table_name}.{column_name}: {e}")
-        # Rollback might not be needed if write_conn auto-commits or handles errors
-        # Ensure write_conn is rolled back if an error happens DURING batch execution
-        if write_conn: write_conn.rollback() # Rollback the write connection just in case
-        print(f"Skipping further fixes for {table_name}.{column_name} due to error.")
-    except Exception as e:
-        print(f"!!! An unexpected error occurred for {table_name}.{column_name}: {e}")
-        if write_conn: write_conn.rollback()
-        print(f"Skipping further fixes for {table_name}.{column_name} due to error.")
-    finally:
-        if read_cursor: read_cursor.close() # Close the named read cursor
+    Runs as a resumable job (repair_jobs.py): each batch is committed together with its
+    checkpoint, and a re-run continues after the last committed id unless restart=True.
+    id_range=(low, high) limits the pass to low <= pk < high (used by parallel_repair.py).
+    With a RoundTripRepairer (mojibake_repair.py) the batch is repaired algorithmically
+    first and the map only handles what the repairer was not confident about.
+    Changed spans are journaled (change_journal.py) so the run can be undone.
+    Returns {'checked', 'updated', 'error', 'journal'} for this run.
+    """
+    range_label = f":{id_range[0]}-{id_range[1]}" if id_range else ""
+    if verbose: print(f"\n--- Fixing table '{table_name}', column '{column_name}' using V7 Map (Two Connections) ---")
+    candidate_sql, params = build_candidate_where(read_conn, table_name, column_name, replacement_map)
+    job_name = f"convert_chars:{table_name}.{column_name}{range_label}"
+    job = RepairJob(write_conn, job_name, table_name, pk_column,
+                    [column_name], candidate_sql, params, batch_size=BATCH_SIZE, id_range=id_range, read_conn=read_conn)
+    journal = ChangeJournal.for_run(job_name, table_name, pk_column, [column_name])
+
+    def fix_batch(rows):
+        if repairer is not None:
+            fixed_texts = repairer.repair_many(original_text for _, original_text in rows)
+            return [(row_pk, fixed_text) for (row_pk, original_text), fixed_text in zip(rows, fixed_texts)
+                    if fixed_text != original_text]
+        rows_to_update = []
+        for row_pk, original_text in tqdm(rows, desc="Applying V7 fixes", disable=not verbose):
+            if original_text:
+                fixed_text = apply_fixes_py_v7(original_text, replacement_map)
+                if fixed_text != original_text:
+                    rows_to_update.append((row_pk, fixed_text))
+        return rows_to_update
+
+    try:
+        with journal:
+            result = job.run(fix_batch, restart=restart, verbose=verbose, journal=journal)
+    except KeyboardInterrupt:
+        # Batches committed before Ctrl-C changed the archive
+        if bump_version: bump_archive_version(f"convert_chars: {table_name}.{column_name} (interrupted)")
+        raise
+    if verbose: print(f"Finished processing '{table_name}.{column_name}'. Rows updated this run: {result['updated']} out of {result['checked']} checked.")
+    if verbose and repairer is not None: print(repairer.report())
+    if verbose: print(journal.report())
+    # Committed batches changed the archive, even if a later batch failed
+    if result['updated'] and bump_version: bump_archive_version(f"convert_chars: {table_name}.{column_name}")
+    return {'checked': result['checked'], 'updated': result['updated'], 'error': result['error'],
+            'journal': journal.path if journal.rows else None}
 
 
 def rebuild_user_stats(conn):
     """Drops and rebuilds the user_stats table."""
-    # (Same implementation as before - uses its own cursor/transaction)
+    # First/last activity comes from the typed comments.commented_at column
+    # (backfill_timestamps.py); the *_date text columns keep the source strings for display.
     print("\n--- Rebuilding 'user_stats' table ---")
     cursor = None
     try:
@@ -165,12 +170,26 @@ def rebuild_user_stats(conn):
         cursor.execute("DROP TABLE IF EXISTS user_stats;")
         print("Creating new user_stats table from comments...")
         cursor.execute('''
-            CREATE TABLE user_stats AS SELECT ... (rest of query same as before) ...
-        ''') # Shortened for brevity
+            CREATE TABLE user_stats AS
+            SELECT author AS username,
+                   count(*)::integer AS total_comments,
+                   count(DISTINCT post_id)::integer AS threads_participated,
+                   (array_agg(concat_ws(' ', comment_date, comment_time)
+                              ORDER BY commented_at ASC NULLS LAST, id ASC))[1] AS first_comment_date,
+                   (array_agg(concat_ws(' ', comment_date, comment_time)
+                              ORDER BY commented_at DESC NULLS LAST, id DESC))[1] AS last_comment_date,
+                   min(commented_at) AS first_comment_at,
+                   max(commented_at) AS last_comment_at
+            FROM comments
+            GROUP BY author;
+        ''')
         cursor.execute("ALTER TABLE user_stats ADD PRIMARY KEY (username);")
         conn.commit()
         print("Successfully rebuilt 'user_stats' table.")
-    # ... (rest of error handling same as before) ...
+        bump_archive_version("rebuild_user_stats")
+    except psycopg2.Error as e:
+        print(f"!!! Database error while rebuilding user_stats: {e}")
+        conn.rollback()
     finally:
         if cursor: cursor.close()
 
@@ -182,6 +201,12 @@ if __name__ == "__main__":
     # ... (rest of warnings same as before) ...
     print("="*60)
 
+    # Each column pass resumes from its checkpoint; --restart starts all of them over
+    restart = '--restart' in sys.argv[1:]
+    if restart: print("--restart given: ignoring saved checkpoints.")
+    # Round-trip repair with the map as fallback; --maps-only applies the map alone
+    maps_only = '--maps-only' in sys.argv[1:]
+
     confirm = input("Type 'YES' to confirm you have a backup and wish to proceed: ")
     if confirm != 'YES': print("Operation cancelled."); sys.exit()
 
@@ -197,12 +222,18 @@ if __name__ == "__main__":
         # write_conn.autocommit = True
         print("Database connections successful.")
 
+        repairer = None
+        if not maps_only:
+            repairer = RoundTripRepairer(train_model_from_db(read_conn), fallback=get_engine(REPLACEMENT_MAP_V7))
+
         # --- Apply Fixes ---
         print(">>> Fixing comments.content...")
-        fix_table_column_v7_two_conn(read_conn, write_conn, 'comments', 'content', 'id', REPLACEMENT_MAP_V7)
+        fix_table_column_v7_two_conn(read_conn, write_conn, 'comments', 'content', 'id', REPLACEMENT_MAP_V7, restart=restart,
+                                     repairer=repairer)
 
         print("\n>>> Fixing posts.title...")
-        fix_table_column_v7_two_conn(read_conn, write_conn, 'posts', 'title', 'id', REPLACEMENT_MAP_V7)
+        fix_table_column_v7_two_conn(read_conn, write_conn, 'posts', 'title', 'id', REPLACEMENT_MAP_V7, restart=restart,
+                                     repairer=repairer)
 
         # --- Optional: Fix Author Names ---
         print("\n>>> Optional: Fixing author names (requires user_stats rebuild)")
@@ -210,7 +241,8 @@ if __name__ == "__main__":
         if fix_author == 'yes':
              print("Fixing comments.author...")
              # Pass the connections to the fix function
-             fix_table_column_v7_two_conn(read_conn, write_conn, 'comments', 'author', 'id', REPLACEMENT_MAP_V7)
+             fix_table_column_v7_two_conn(read_conn, write_conn, 'comments', 'author', 'id', REPLACEMENT_MAP_V7, restart=restart,
+                                          repairer=repairer)
              # Rebuild stats using the write connection (or either, as it manages its own transaction)
              rebuild_user_stats(write_conn)
         else:
@@ -220,6 +252,8 @@ if __name__ == "__main__":
         print("--- Please verify the results on your website. ---")
 
     # ... (rest of error handling same as before) ...
+    except KeyboardInterrupt:
+        print("\nStopped. Run the script again to resume from the last committed batch.")
     finally:
         # Close both connections
         if read_conn: read_conn.close(); print("\nRead connection closed.")
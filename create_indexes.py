@@ -0,0 +1,99 @@
+# create_indexes.py
+# Creates the helper functions and indexes the web app's queries rely on.
+# Safe to re-run: every statement is IF NOT EXISTS / OR REPLACE. Indexes are built
+# CONCURRENTLY so the site keeps serving while they are created.
+import os
+import sys
+import time
+import psycopg2
+from dotenv import load_dotenv
+
+# --- Configuration ---
+load_dotenv()
+DATABASE_URL = os.getenv('DATABASE_URL')
+
+# (description, SQL) pairs, executed in order with autocommit.
+# archive_fold() must stay in sync with fold_text() in app/models/search.py.
+STATEMENTS = [
+    ("composite index on comments (post_id, id) for thread pagination",
+     """CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_comments_post_id_id
+        ON comments (post_id, id);"""),
+    ("composite index on comments (author, post_id) for user profiles",
+     """CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_comments_author_post_id
+        ON comments (author, post_id);"""),
+    ("B-tree index on posts (posted_at)",
+     """CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_posts_posted_at
+        ON posts (posted_at);"""),
+    ("B-tree index on comments (commented_at)",
+     """CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_comments_commented_at
+        ON comments (commented_at);"""),
+    ("pg_trgm extension (trigram indexes)",
+     "CREATE EXTENSION IF NOT EXISTS pg_trgm;"),
+    ("archive_fold() Turkish-aware folding function",
+     """CREATE OR REPLACE FUNCTION archive_fold(value text) RETURNS text
+        LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS
+        $$ SELECT lower(translate(value, 'İIıŞşĞğÜüÖöÇçÂâÎîÛû', 'iiissgguuooccaaiiuu')) $$;"""),
+    ("full-text GIN index on posts.title",
+     """CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_posts_title_fts
+        ON posts USING gin (to_tsvector('simple'::regconfig, archive_fold(title)));"""),
+    ("trigram GIN index on posts.title",
+     """CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_posts_title_trgm
+        ON posts USING gin (archive_fold(title) gin_trgm_ops);"""),
+    # Postgres maintains this index on every UPDATE, so repaired comments are
+    # re-indexed incrementally without a rebuild.
+    ("full-text GIN index on comments.content",
+     """CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_comments_content_fts
+        ON comments USING gin (to_tsvector('simple'::regconfig, archive_fold(content)));"""),
+] + [
+    # Partial indexes on the garble_flags column added by classify_garble.py (garble_flags.py).
+    # The repair scripts walk the dirty set by id; the unclassified index makes the
+    # "is the table fully classified?" check cheap. Both shrink as rows are cleaned.
+    (f"partial index on dirty {table} rows (garble_flags <> 0)",
+     f"""CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_{table}_garbled
+        ON {table} (id) WHERE garble_flags <> 0;""")
+    for table in ('comments', 'posts')
+] + [
+    (f"partial index on unclassified {table} rows",
+     f"""CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_{table}_garble_unclassified
+        ON {table} (id) WHERE garble_flags IS NULL;""")
+    for table in ('comments', 'posts')
+]
+
+# --- Functions ---
+def create_indexes(conn, statements=STATEMENTS):
+    """Runs each statement on its own; a failure is reported and the rest still run."""
+    failed = 0
+    with conn.cursor() as cursor:
+        for description, sql in statements:
+            print(f"Creating {description}...")
+            step_start = time.time()
+            try:
+                cursor.execute(sql)
+                print(f"  Done in {time.time() - step_start:.2f} seconds.")
+            except psycopg2.Error as e:
+                failed += 1
+                print(f"  !!! Failed: {e}")
+    return failed
+
+# --- Main Execution ---
+if __name__ == "__main__":
+    start_run_time = time.time()
+    if not DATABASE_URL:
+        print("Error: DATABASE_URL environment variable not set.")
+        sys.exit(1)
+
+    conn = None
+    try:
+        print("Connecting to database...")
+        conn = psycopg2.connect(DATABASE_URL)
+        conn.autocommit = True # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+        print("Database connection successful.")
+        failed = create_indexes(conn)
+        print(f"\n--- Finished with {failed} failed statement(s). ---")
+    except psycopg2.OperationalError as e:
+        print(f"!!! Database Connection Error: {e}")
+        sys.exit(1)
+    finally:
+        if conn: conn.close(); print("\nDatabase connection closed.")
+
+    print(f"\nScript finished in {time.time() - start_run_time:.2f} seconds.")
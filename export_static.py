@@ -0,0 +1,226 @@
+# export_static.py
+# Pre-renders the whole archive (index, every thread, every user profile) into a static
+# directory tree that nginx can serve directly, with .gz (and .br, if the 'brotli'
+# package is installed) siblings for gzip_static / brotli_static.
+#
+#   python export_static.py OUTPUT_DIR [--workers 8] [--chunk-size 200]
+#
+# Pages whose rendered HTML did not change since the previous export (tracked by
+# content hash in OUTPUT_DIR/.export-manifest.json) are not rewritten or recompressed.
+# Every page of a paginated view is exported: later pages under their path-style cursor
+# URLs (/thread/<id>/after/<comment id>, /user/<name>/before/<post id>), which is what
+# the pages link to when rendered with STATIC_EXPORT; nginx ignores query strings.
+import os
+import sys
+import json
+import gzip
+import time
+import shutil
+import hashlib
+import argparse
+from urllib.parse import quote, unquote
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+try:
+    import brotli # Optional: pip install brotli
+except ImportError:
+    brotli = None
+
+from sqlalchemy import select, text
+
+from app import create_app, db
+from app.models.post import Post
+from app.models.user_stats import UserStats
+
+MANIFEST_NAME = '.export-manifest.json'
+
+# --- Worker side ---
+_client = None
+
+def _init_worker():
+    """Each worker process builds its own app (and database connections)."""
+    global _client
+    app = create_app()
+    # Every page is rendered once; the page cache would only cost memory here
+    app.config['PAGE_CACHE_ENABLED'] = False
+    app.config['STATIC_EXPORT'] = True
+    _client = app.test_client()
+
+def output_path(output_dir, url_path):
+    """Maps '/thread/12' to OUTPUT_DIR/thread/12/index.html (nginx: try_files $uri/index.html)."""
+    relative = unquote(url_path).strip('/')
+    parts = [part for part in relative.split('/') if part]
+    if any(part in ('.', '..') for part in parts):
+        raise ValueError(f"Unsafe path: {url_path}")
+    return os.path.join(output_dir, *parts, 'index.html')
+
+def write_page(path, body):
+    """Writes the page and its compressed siblings, each via write-then-rename."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    variants = [(path, body), (path + '.gz', gzip.compress(body, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append((path + '.br', brotli.compress(body, quality=11)))
+    for target, data in variants:
+        temp_path = f"{target}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, target)
+
+def render_chunk(output_dir, tasks):
+    """Renders (url_path, previous_hash) tasks; returns [(url_path, new_hash, status)]."""
+    results = []
+    for url_path, previous_hash in tasks:
+        try:
+            path = output_path(output_dir, url_path)
+            response = _client.get(url_path)
+            if response.status_code != 200:
+                results.append((url_path, previous_hash, f"http {response.status_code}"))
+                continue
+            body = response.get_data()
+            content_hash = hashlib.sha256(body).hexdigest()
+            if content_hash == previous_hash and os.path.exists(path):
+                results.append((url_path, content_hash, 'unchanged'))
+                continue
+            write_page(path, body)
+            results.append((url_path, content_hash, 'written'))
+        except Exception as e:
+            results.append((url_path, previous_hash, f"error: {e}"))
+    return results
+
+# --- Main process ---
+# Cursors of the pages after the first, matching the views' keyset pagination: page k+1
+# starts after the last row of page k, i.e. at every page_size-th row that is not the last.
+# {rows} yields (owner, cursor) numbered in display order within each owner.
+PAGE_CURSORS_SQL = """
+    SELECT owner, cursor FROM (
+        SELECT owner, cursor,
+               row_number() OVER (PARTITION BY owner ORDER BY cursor {direction}) AS position,
+               count(*) OVER (PARTITION BY owner) AS total
+        FROM ({rows}) AS page_rows
+    ) AS numbered
+    WHERE position % :page_size = 0 AND position < total
+    ORDER BY owner, cursor
+"""
+
+def iter_page_cursors(rows_sql, direction, page_size):
+    sql = text(PAGE_CURSORS_SQL.format(rows=rows_sql, direction=direction)).execution_options(yield_per=2000)
+    yield from db.session.execute(sql, {'page_size': page_size})
+
+def _user_path(username):
+    if '/' in username or username in ('.', '..'):
+        return None
+    return f'/user/{quote(username, safe="")}'
+
+def iter_page_urls(config):
+    """Streams every exportable URL; ids and names come through server-side cursors."""
+    yield '/'
+    for post_id in db.session.execute(select(Post.id).order_by(Post.id).execution_options(yield_per=2000)).scalars():
+        yield f'/thread/{post_id}'
+    for post_id, after in iter_page_cursors("SELECT post_id AS owner, id AS cursor FROM comments",
+                                            'ASC', config['THREAD_PAGE_SIZE']):
+        yield f'/thread/{post_id}/after/{after}'
+
+    for username in db.session.execute(select(UserStats.username).order_by(UserStats.username).execution_options(yield_per=2000)).scalars():
+        path = _user_path(username)
+        if path is None:
+            print(f"Skipping user '{username}': name cannot be mapped to a file path.")
+            continue
+        yield path
+    # Same source as the profile view: user_threads, or the live (author, post_id) pairs
+    if config['USE_USER_THREADS_TABLE']:
+        profile_rows = "SELECT username AS owner, post_id AS cursor FROM user_threads"
+    else:
+        profile_rows = "SELECT DISTINCT author AS owner, post_id AS cursor FROM comments"
+    for username, before in iter_page_cursors(profile_rows, 'DESC', config['PROFILE_PAGE_SIZE']):
+        path = _user_path(username)
+        if path is not None:
+            yield f'{path}/before/{before}'
+
+def iter_chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk: yield chunk
+
+def load_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def save_manifest(output_dir, manifest):
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(path + '.tmp', path)
+
+def export_archive(output_dir, workers, chunk_size):
+    app = create_app()
+    manifest = load_manifest(output_dir)
+    counts = {'written': 0, 'unchanged': 0, 'failed': 0}
+    start_time = time.time()
+    last_report = start_time
+
+    # Static assets are referenced by url_for('static', ...) in every page
+    static_dir = os.path.join(app.root_path, 'static')
+    shutil.copytree(static_dir, os.path.join(output_dir, 'static'), dirs_exist_ok=True)
+
+    # The manifest is saved every report and on the way out (Ctrl-C, a failed chunk), so
+    # an interrupted export keeps the hashes of the pages it finished
+    try:
+        with app.app_context(), ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            pending = set()
+            for urls in iter_chunks(iter_page_urls(app.config), chunk_size):
+                pending.add(pool.submit(render_chunk, output_dir, [(url, manifest.get(url)) for url in urls]))
+                # Bound the number of queued chunks so the URL stream is not read ahead unboundedly
+                while len(pending) >= workers * 2:
+                    done = next(as_completed(pending))
+                    pending.remove(done)
+                    _collect(done.result(), manifest, counts)
+                last_report = _checkpoint(output_dir, manifest, counts, start_time, last_report)
+            for done in as_completed(pending):
+                _collect(done.result(), manifest, counts)
+                last_report = _checkpoint(output_dir, manifest, counts, start_time, last_report)
+    finally:
+        save_manifest(output_dir, manifest)
+        _report(counts, start_time)
+    return counts
+
+def _checkpoint(output_dir, manifest, counts, start_time, last_report):
+    """Every 10 seconds: saves the manifest and prints progress. Returns the last report time."""
+    if time.time() - last_report <= 10: return last_report
+    save_manifest(output_dir, manifest)
+    _report(counts, start_time)
+    return time.time()
+
+def _collect(results, manifest, counts):
+    for url_path, content_hash, status in results:
+        if status in ('written', 'unchanged'):
+            counts[status] += 1
+            manifest[url_path] = content_hash
+        else:
+            counts['failed'] += 1
+            print(f"  Failed {url_path}: {status}")
+
+def _report(counts, start_time):
+    elapsed = time.time() - start_time
+    total = sum(counts.values())
+    print(f"{total} pages ({counts['written']} written, {counts['unchanged']} unchanged, "
+          f"{counts['failed']} failed) in {elapsed:.1f}s - {total / max(elapsed, 1e-9):.1f} pages/s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the archive as a static site.")
+    parser.add_argument('output_dir')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4)
+    parser.add_argument('--chunk-size', type=int, default=200, help="Pages per worker task")
+    args = parser.parse_args()
+
+    if brotli is None:
+        print("Note: 'brotli' package not installed; writing only .html and .gz files.")
+    os.makedirs(args.output_dir, exist_ok=True)
+    counts = export_archive(os.path.abspath(args.output_dir), args.workers, args.chunk_size)
+    sys.exit(1 if counts['failed'] else 0)
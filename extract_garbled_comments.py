@@ -4,6 +4,9 @@ import psycopg2 # Ensure this is installed: pip install psycopg2-binary
 from dotenv import load_dotenv
 import time
 
+from garble_flags import candidate_where, garble_flags_of
+from garbled_dump import DumpWriter, index_path_for
+
 # --- Configuration ---
 load_dotenv() # Load environment variables from .env file
 
@@ -27,7 +30,9 @@ COMMENT_AUTHOR_COLUMN = 'author'
 COMMENT_CONTENT_COLUMN = 'content'
 
 # --- Output File ---
-OUTPUT_FILE = 'comments_with_garbled_A_char.txt'
+# JSONL dump plus '.idx' id index (garbled_dump.py); read it with iter_records/DumpIndex
+OUTPUT_FILE = 'garbled_rows.jsonl'
+FETCH_SIZE = 2000 # Rows per round trip from the server-side cursor
 
 # --- The Specific Garbled Character to Find ---
 # We are looking for the single character 'Ã' (Unicode U+00C3)
@@ -51,66 +56,60 @@ def connect_db():
         print(f"Database connection failed with an unexpected error: {e}")
         sys.exit(1)
 
-def fetch_corrupted_data(conn):
+def candidate_queries(conn):
+    """(kind, query, params) for the post and comment rows containing the GARBLED_CHAR."""
+    # Parameter for LIKE needs wildcards included
+    like_pattern = f'%{GARBLED_CHAR}%'
+    # Once classify_garble.py has run, the garble_flags dirty set replaces the LIKE scan
+    garble_mask = garble_flags_of(GARBLED_CHAR)
+    post_where, post_params = candidate_where(conn, POSTS_TABLE, garble_mask,
+                                              f"{POST_TITLE_COLUMN} LIKE %s", [like_pattern])
+    post_query = f"""
+        SELECT {POST_ID_COLUMN}, {POST_TITLE_COLUMN}
+        FROM {POSTS_TABLE}
+        WHERE {post_where}
+        ORDER BY {POST_ID_COLUMN};
     """
-    Fetches IDs and content containing the GARBLED_CHAR
-    from both post titles and comment content/authors.
+    # Search in both author and content fields
+    comment_where, comment_params = candidate_where(
+        conn, COMMENTS_TABLE, garble_mask,
+        f"{COMMENT_AUTHOR_COLUMN} LIKE %s OR {COMMENT_CONTENT_COLUMN} LIKE %s", [like_pattern, like_pattern])
+    comment_query = f"""
+        SELECT {COMMENT_ID_COLUMN}, {COMMENT_AUTHOR_COLUMN}, {COMMENT_CONTENT_COLUMN}
+        FROM {COMMENTS_TABLE}
+        WHERE {comment_where}
+        ORDER BY {COMMENT_ID_COLUMN};
     """
-    results = {'posts': [], 'comments': []}
-    cursor = None
-    print(f"Searching for garbled character '{GARBLED_CHAR}'...")
+    return [('post', post_query, post_params), ('comment', comment_query, comment_params)]
 
+def export_corrupted_data(conn, writer):
+    """
+    Streams post titles and comments containing the GARBLED_CHAR into the dump.
+    Rows come from server-side (named) cursors, FETCH_SIZE at a time, so memory use
+    does not grow with the number of matches. Returns False on a database error.
+    """
+    print(f"Searching for garbled character '{GARBLED_CHAR}'...")
     try:
-        cursor = conn.cursor()
-
-        # --- Fetch from Posts ---
-        post_query = f"""
-            SELECT {POST_ID_COLUMN}, {POST_TITLE_COLUMN}
-            FROM {POSTS_TABLE}
-            WHERE {POST_TITLE_COLUMN} LIKE %s
-            ORDER BY {POST_ID_COLUMN};
-        """
-        # Parameter for LIKE needs wildcards included
-        like_pattern = f'%{GARBLED_CHAR}%'
-
-        cursor.execute(post_query, (like_pattern,))
-        post_results = cursor.fetchall()
-        if post_results:
-            print(f"Found {len(post_results)} potentially corrupted post titles.")
-            results['posts'] = post_results
-        else:
-            print("No potentially corrupted post titles found.")
-
-
-        # --- Fetch from Comments ---
-        # Search in both author and content fields
-        comment_query = f"""
-            SELECT {COMMENT_ID_COLUMN}, {COMMENT_AUTHOR_COLUMN}, {COMMENT_CONTENT_COLUMN}
-            FROM {COMMENTS_TABLE}
-            WHERE {COMMENT_AUTHOR_COLUMN} LIKE %s OR {COMMENT_CONTENT_COLUMN} LIKE %s
-            ORDER BY {COMMENT_ID_COLUMN};
-        """
-        cursor.execute(comment_query, (like_pattern, like_pattern))
-        comment_results = cursor.fetchall()
-        if comment_results:
-             print(f"Found {len(comment_results)} potentially corrupted comments (author or content).")
-             results['comments'] = comment_results
-        else:
-            print("No potentially corrupted comments found.")
-
-        return results
+        queries = candidate_queries(conn)
+        for kind, query, params in queries:
+            with conn.cursor(name=f"extract_garbled_{kind}s") as cursor:
+                cursor.itersize = FETCH_SIZE
+                cursor.execute(query, params)
+                for row in cursor:
+                    if kind == 'post':
+                        post_id, title = row
+                        writer.write('post', post_id, title=title)
+                    else:
+                        comm_id, author, content = row
+                        writer.write('comment', comm_id, author=author, content=content)
+            print(f"Found {writer.counts[kind]} potentially corrupted {kind}s.")
+        conn.commit() # Ends the read transaction the named cursors lived in
+        return True
 
     except psycopg2.Error as e:
         print(f"Database query failed: {e}")
-        # Optional: Rollback if necessary, though SELECT shouldn't need it
-        # conn.rollback()
-        return None # Indicate failure
-    except Exception as e:
-        print(f"An unexpected error occurred during query execution: {e}")
-        return None
-    finally:
-        if cursor:
-            cursor.close()
+        conn.rollback()
+        return False
 
 
 # --- Main Execution Block ---
@@ -119,49 +118,25 @@ if __name__ == "__main__":
     conn = connect_db()
 
     if conn:
-        fetched_data = fetch_corrupted_data(conn)
-        conn.close() # Close connection once data is fetched
-        print("\nDatabase connection closed.")
-
-        if fetched_data is not None:
-            total_posts = len(fetched_data['posts'])
-            total_comments = len(fetched_data['comments'])
+        print(f"\nWriting results to '{OUTPUT_FILE}' (index: '{index_path_for(OUTPUT_FILE)}')...")
+        try:
+            with DumpWriter(OUTPUT_FILE, marker=GARBLED_CHAR) as writer:
+                exported = export_corrupted_data(conn, writer)
+        except OSError as e:
+            print(f"Error writing to file '{OUTPUT_FILE}': {e}")
+            exported = False
+        finally:
+            conn.close() # Close connection once data is exported
+            print("\nDatabase connection closed.")
+
+        if exported:
+            total_posts = writer.counts['post']
+            total_comments = writer.counts['comment']
             print(f"\nTotal potentially corrupted items found: Posts={total_posts}, Comments={total_comments}")
-
             if total_posts == 0 and total_comments == 0:
                 print("No data containing the garbled character found.")
-                sys.exit(0)
-
-            # --- Write to File ---
-            print(f"\nWriting results to '{OUTPUT_FILE}'...")
-            try:
-                with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-                    f.write(f"# Data extracted on: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
-                    f.write(f"# Searching for character: '{GARBLED_CHAR}'\n\n")
-
-                    if fetched_data['posts']:
-                        f.write("--- Potentially Corrupted Post Titles ---\n")
-                        for post_id, title in fetched_data['posts']:
-                            f.write(f"Post ID: {post_id}\n")
-                            f.write(f"Title: {title}\n")
-                            f.write("---\n")
-                        f.write("\n")
-
-                    if fetched_data['comments']:
-                        f.write("--- Potentially Corrupted Comments ---\n")
-                        for comm_id, author, content in fetched_data['comments']:
-                            f.write(f"Comment ID: {comm_id}\n")
-                            f.write(f"Author: {author}\n")
-                            f.write(f"Content: {content}\n")
-                            f.write("---\n")
-                        f.write("\n")
-
+            else:
                 print(f"Successfully saved data to '{OUTPUT_FILE}'.")
 
-            except IOError as e:
-                print(f"Error writing to file '{OUTPUT_FILE}': {e}")
-            except Exception as e:
-                print(f"An unexpected error occurred during file writing: {e}")
-
     end_run_time = time.time()
-    print(f"\nScript finished in {end_run_time - start_run_time:.2f} seconds.")
\ No newline at end of file
+    print(f"\nScript finished in {end_run_time - start_run_time:.2f} seconds.")
@@ -0,0 +1,110 @@
+# garble_flags.py
+# Persisted "suspect encoding" classification. Every comment and post carries a
+# garble_flags smallint: a bitmask of the mojibake families found in its text
+# (comments: author | content, posts: title). NULL means "not classified yet", 0 clean.
+#
+# A BEFORE INSERT/UPDATE trigger keeps the flags current, so a row drops out of the
+# partial index ix_<table>_garbled as soon as a repair script writes clean text, and
+# later passes only walk the shrinking dirty set. classify_garble.py adds the column
+# and trigger, backfills existing rows and creates the indexes.
+#
+# garble_flags_of() must stay in sync with the archive_garble_flags() SQL function.
+
+# --- Families ---
+FLAG_A_TILDE = 1           # 'Ã': UTF-8 ü/ö/ç read as Latin-1 ('Ã¼'), or its remnants
+FLAG_A_DIAERESIS = 2       # 'Ä': ğ/ı/İ ('ÄŸ', 'Ä±', 'Ä°')
+FLAG_A_RING = 4            # 'Å': ş/Ş ('ÅŸ', 'Åž')
+FLAG_PUNCTUATION = 8       # 'â€': curly quotes, dashes, ellipsis ('â€™')
+FLAG_REPLACEMENT_CHAR = 16 # U+FFFD, bytes that were lost entirely
+
+# (flag, marker) pairs; a family is present when its marker occurs in the text
+FAMILY_MARKERS = [
+    (FLAG_A_TILDE, 'Ã'),
+    (FLAG_A_DIAERESIS, 'Ä'),
+    (FLAG_A_RING, 'Å'),
+    (FLAG_PUNCTUATION, 'â€'),
+    (FLAG_REPLACEMENT_CHAR, '�'),
+]
+
+TABLE_COLUMNS = {'comments': ['author', 'content'], 'posts': ['title']}
+
+def garble_flags_of(text):
+    """Python twin of archive_garble_flags(): the bitmask of families present in text."""
+    if not text: return 0
+    flags = 0
+    for flag, marker in FAMILY_MARKERS:
+        if marker in text: flags |= flag
+    return flags
+
+def flags_for_keys(keys):
+    """Mask covering every key of a replacement map, or None if some key has no family."""
+    mask = 0
+    for key in keys:
+        key_flags = garble_flags_of(key)
+        if not key_flags: return None
+        mask |= key_flags
+    return mask
+
+# --- SQL ---
+def _function_sql():
+    cases = "\n              | ".join(f"(CASE WHEN strpos(value, '{marker}') > 0 THEN {flag} ELSE 0 END)"
+                                     for flag, marker in FAMILY_MARKERS)
+    return f"""
+        CREATE OR REPLACE FUNCTION archive_garble_flags(value text) RETURNS smallint
+        LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS
+        $$ SELECT ({cases})::smallint $$;
+    """
+
+def flags_expression(table_name, prefix=''):
+    """SQL expression computing a row's flags from its text columns."""
+    return " | ".join(f"coalesce(archive_garble_flags({prefix}{column}), 0)"
+                      for column in TABLE_COLUMNS[table_name])
+
+def _trigger_sql(table_name):
+    columns = ', '.join(TABLE_COLUMNS[table_name])
+    return f"""
+        CREATE OR REPLACE FUNCTION {table_name}_garble_flags_trigger() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            NEW.garble_flags := {flags_expression(table_name, 'NEW.')};
+            RETURN NEW;
+        END $$;
+        DROP TRIGGER IF EXISTS {table_name}_garble_flags ON {table_name};
+        CREATE TRIGGER {table_name}_garble_flags
+            BEFORE INSERT OR UPDATE OF {columns} ON {table_name}
+            FOR EACH ROW EXECUTE FUNCTION {table_name}_garble_flags_trigger();
+    """
+
+def ensure_garble_flags(conn):
+    """Adds the columns, the SQL function and the triggers (idempotent); commits."""
+    with conn.cursor() as cursor:
+        cursor.execute(_function_sql())
+        for table_name in TABLE_COLUMNS:
+            cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS garble_flags smallint;")
+            cursor.execute(_trigger_sql(table_name))
+    conn.commit()
+
+def garble_flags_ready(conn, table_name):
+    """True once the column exists and every row is classified (cheap via ix_<table>_unclassified)."""
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT EXISTS (SELECT 1 FROM information_schema.columns
+                           WHERE table_name = %s AND column_name = 'garble_flags')
+        """, (table_name,))
+        ready = cursor.fetchone()[0]
+        if ready:
+            cursor.execute(f"SELECT NOT EXISTS (SELECT 1 FROM {table_name} WHERE garble_flags IS NULL)")
+            ready = cursor.fetchone()[0]
+    conn.rollback()
+    return ready
+
+def candidate_where(conn, table_name, mask, fallback_sql, fallback_params):
+    """(SQL condition, params) for rows that may need repair.
+
+    Uses the flags (and the partial index) when the table is fully classified and the
+    mask is known; otherwise falls back to the caller's LIKE condition.
+    """
+    if mask and garble_flags_ready(conn, table_name):
+        # 'garble_flags <> 0' matches the partial index predicate literally
+        return "garble_flags <> 0 AND (garble_flags & %s) <> 0", [mask]
+    return fallback_sql, list(fallback_params)
@@ -0,0 +1,174 @@
+# garbled_dump.py
+# JSONL dump of garbled rows, written by extract_garbled_comments.py and read by
+# transform_words.py and the other review tools.
+#
+# One JSON object per line ('\n' inside values is escaped by JSON, so multi-line
+# comments need no special parsing). The first line is a header:
+#   {"type": "meta", "format": 1, "extracted_at": "...", ...}
+#   {"type": "post", "id": 17, "title": "..."}
+#   {"type": "comment", "id": 42, "author": "...", "content": "..."}
+#
+# Next to <dump>.jsonl the writer stores <dump>.jsonl.idx: fixed-size (kind, id, byte
+# offset) entries sorted by kind then id. DumpIndex memory-maps both files for random
+# access by id, so a dump of millions of rows can be reviewed in constant memory.
+import os
+import json
+import mmap
+import time
+import struct
+
+DUMP_FORMAT = 1
+KIND_CODES = {'post': 0, 'comment': 1}
+INDEX_MAGIC = b'GDUMPIX1'
+INDEX_ENTRY = struct.Struct('<qqq') # kind code, id, byte offset of the line
+
+def index_path_for(path):
+    return path + '.idx'
+
+class DumpWriter:
+    """Streams records to a JSONL dump and its id index. Use as a context manager.
+
+    Records are expected in (kind, id) order (posts by id, then comments by id), as the
+    extraction queries produce them; otherwise the index is sorted once on close.
+    """
+
+    def __init__(self, path, **metadata):
+        self.path = path
+        self.counts = {kind: 0 for kind in KIND_CODES}
+        self._data = open(path, 'wb')
+        self._index = open(index_path_for(path), 'wb')
+        self._index.write(INDEX_MAGIC)
+        self._last_key = None
+        self._sorted = True
+        header = {'type': 'meta', 'format': DUMP_FORMAT, 'extracted_at': time.strftime('%Y-%m-%d %H:%M:%S')}
+        header.update(metadata)
+        self._write_line(header)
+
+    def _write_line(self, record):
+        offset = self._data.tell()
+        self._data.write(json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n')
+        return offset
+
+    def write(self, kind, row_id, **fields):
+        """Appends one post or comment record, e.g. write('comment', 42, author=..., content=...)."""
+        record = {'type': kind, 'id': row_id}
+        record.update(fields)
+        offset = self._write_line(record)
+        key = (KIND_CODES[kind], row_id)
+        if self._last_key is not None and key <= self._last_key: self._sorted = False
+        self._last_key = key
+        self._index.write(INDEX_ENTRY.pack(key[0], row_id, offset))
+        self.counts[kind] += 1
+
+    def close(self):
+        if self._data.closed: return
+        self._data.close()
+        self._index.close()
+        if not self._sorted: _sort_index(index_path_for(self.path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def _sort_index(index_path):
+    """Rewrites an out-of-order index sorted (loads all entries; only needed for unordered writes)."""
+    with open(index_path, 'rb') as f:
+        data = f.read()[len(INDEX_MAGIC):]
+    entries = sorted(INDEX_ENTRY.iter_unpack(data))
+    with open(index_path, 'wb') as f:
+        f.write(INDEX_MAGIC)
+        for entry in entries:
+            f.write(INDEX_ENTRY.pack(*entry))
+
+def read_metadata(path):
+    """The dump's header record."""
+    with open(path, 'rb') as f:
+        header = json.loads(f.readline())
+    if header.get('type') != 'meta':
+        raise ValueError(f"'{path}' is not a garbled-row dump (no header line)")
+    return header
+
+def iter_records(path, kind=None):
+    """Yields the dump's records one at a time (optionally only 'post' or 'comment' ones)."""
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.strip(): continue
+            record = json.loads(line)
+            if record['type'] == 'meta': continue
+            if kind is None or record['type'] == kind:
+                yield record
+
+def iter_batches(records, batch_size):
+    """Groups an iterable of records into lists of at most batch_size."""
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch: yield batch
+
+class DumpIndex:
+    """Random access to a dump by (kind, id) through the memory-mapped index and data files."""
+
+    def __init__(self, path):
+        self.path = path
+        self._files = []
+        self._index = self._map(index_path_for(path))
+        self._data = self._map(path)
+        if self._index[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+            self.close()
+            raise ValueError(f"'{index_path_for(path)}' is not a garbled-row dump index")
+        self._count = (len(self._index) - len(INDEX_MAGIC)) // INDEX_ENTRY.size
+
+    def _map(self, path):
+        f = open(path, 'rb')
+        self._files.append(f)
+        if os.fstat(f.fileno()).st_size == 0: return b''
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return self._count
+
+    def _entry(self, position):
+        return INDEX_ENTRY.unpack_from(self._index, len(INDEX_MAGIC) + position * INDEX_ENTRY.size)
+
+    def offset_of(self, kind, row_id):
+        """Byte offset of the record's line, or None (binary search over the index)."""
+        key = (KIND_CODES[kind], row_id)
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._entry(middle)[:2] < key: low = middle + 1
+            else: high = middle
+        if low < self._count and self._entry(low)[:2] == key:
+            return self._entry(low)[2]
+        return None
+
+    def get(self, kind, row_id):
+        """The record for this post/comment id, or None if it is not in the dump."""
+        offset = self.offset_of(kind, row_id)
+        if offset is None: return None
+        end = self._data.find(b'\n', offset)
+        return json.loads(self._data[offset:end if end != -1 else len(self._data)])
+
+    def ids(self, kind):
+        """Ids of one kind, in order, read straight from the index."""
+        code = KIND_CODES[kind]
+        for position in range(self._count):
+            entry_code, row_id, _ = self._entry(position)
+            if entry_code == code: yield row_id
+
+    def close(self):
+        for mapped in (getattr(self, '_index', None), getattr(self, '_data', None)):
+            if isinstance(mapped, mmap.mmap): mapped.close()
+        for f in self._files: f.close()
+        self._files = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
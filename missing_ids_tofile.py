@@ -11,6 +11,8 @@ from bs4 import BeautifulSoup
 import argparse
 from datetime import datetime
 
+from post_coverage import MISSING_POSTS_SQL, coverage_ready, uncovered_posts_query
+
 # --- Setup Logging ---
 logging.basicConfig(
     level=logging.INFO,
@@ -70,6 +72,20 @@ def display_results(success, columns, results):
         for row in results[:10]: print(row)
         if len(results) > 10: print("...")
 
+def iter_query_rows(conn, query, params=None, fetch_size=10000):
+    """Yields a query's rows through a server-side cursor, fetch_size rows at a time."""
+    cursor = conn.cursor(name='missing_ids_export')
+    try:
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows: break
+            yield from rows
+    finally:
+        try: cursor.close()
+        except psycopg2.Error: pass
+        conn.rollback()
+
 def normalize_query(query_string):
     return ' '.join(query_string.lower().split())
 
@@ -88,11 +104,8 @@ def save_results_to_file(filename, results):
 
     try:
         count = 0
-        if not isinstance(results, list):
-            logging.error(f"Cannot save results: Expected a list, got {type(results)}")
-            print(f"\nError: Internal error preparing data for saving.")
-            return False
-        if not results:
+        # Rows may be a list or a stream from iter_query_rows()
+        if isinstance(results, list) and not results:
             logging.warning("Cannot save results: The result list is empty.")
             print("\nWarning: Query returned results, but data list was empty before saving.")
             return False # Treat as non-success if nothing to write
@@ -119,7 +132,8 @@ def save_results_to_file(filename, results):
              return False
         else:
              logging.warning(f"No valid rows were written to file '{full_path}'.")
-             print(f"\nWarning: No valid data found to save to '{filename}'.")
+             print(f"\nWarning: No valid data found to save to '{filename}'. File not created.")
+             if os.path.exists(full_path): os.remove(full_path)
              return False # No data written = not a success
 
     except PermissionError:
@@ -139,8 +153,15 @@ def save_results_to_file(filename, results):
 def main():
     conn = connect_db()
     if not conn: sys.exit(1)
-    target_query = "select id from posts where id not in ( select distinct post_id from comments );"
-    target_query_normalized = normalize_query(target_query)
+    # The old NOT IN (SELECT DISTINCT ...) form is still recognized, but runs as the NOT EXISTS
+    # anti-join; with the post_coverage table (post_coverage.py) export_missing reads that instead
+    legacy_query = "select id from posts where id not in ( select distinct post_id from comments );"
+    target_queries = {normalize_query(legacy_query), normalize_query(MISSING_POSTS_SQL)}
+    if coverage_ready(conn):
+        target_query, target_params = uncovered_posts_query()
+        print("Using post_coverage for 'export_missing' (run post_coverage.py --recheck if it looks stale).")
+    else:
+        target_query, target_params = MISSING_POSTS_SQL, None
     output_filename = "missing_comment_post_ids.txt"
     try:
         while True:
@@ -159,15 +180,12 @@ def main():
             normalized_user_query = normalize_query(query_to_run)
 
             # --- Special Handling OR Normal Handling ---
-            if normalized_user_query == target_query_normalized:
+            if query_to_run is target_query or normalized_user_query in target_queries:
                 print(f"\nExecuting specific query to save results to '{output_filename}'...\n")
-                success, columns, results = execute_query(conn, query_to_run) # Use the query
-                if success:
-                    if isinstance(results, list):
-                        if results: save_results_to_file(output_filename, results) # Call save function
-                        else: print("Query returned no results (no missing IDs found). File not created.")
-                    else: print(f"Query executed with message, but expected rows: {results}")
-                else: print(f"Query failed: {results}")
+                # Streamed into the file; the id list is never held in memory as a whole
+                if query_to_run is target_query: rows = iter_query_rows(conn, target_query, target_params)
+                else: rows = iter_query_rows(conn, MISSING_POSTS_SQL)
+                save_results_to_file(output_filename, rows)
             else: # Normal query execution
                 print("\nExecuting query...\n"); success, columns, results = execute_query(conn, query_to_run); display_results(success, columns, results)
 
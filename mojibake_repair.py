@@ -0,0 +1,432 @@
+# mojibake_repair.py
+# Shared single-pass replacement engine for the encoding-repair scripts.
+#
+# The old approach (apply_fixes_py_v7) re-sorted the map on every call and ran one
+# str.replace() over the whole text per key, i.e. hundreds of full scans per comment,
+# and let earlier replacements create matches for later keys. Here every key is
+# compiled once into a trie-shaped regex: a single left-to-right scan where, at each
+# position, the longest matching key wins (leftmost-longest), and output is never
+# re-scanned.
+#
+# WordRepairEngine does the same for whole-word maps (update_A_db.py, transform_words.py),
+# with Turkish-aware case-insensitive matching and case preservation.
+#
+# RoundTripRepairer repairs mojibake algorithmically (cp1252/latin-1 -> UTF-8 round
+# trip, scored with a Turkish bigram model) and uses the maps only as a fallback.
+import re
+import math
+import threading
+from collections import Counter
+
+from garble_flags import garble_flags_of
+
+def build_trie_pattern(keys, ordered=False):
+    """Compiles keys into a regex source string shaped like a trie.
+
+    Shared prefixes are matched once, and every "a key may end here" point is an
+    optional group. By default the group is greedy, so the longest key wins. With
+    ordered=True a key listed before every longer key sharing its prefix is tried
+    first instead, which is how a flat 'key1|key2|...' alternation behaves.
+    """
+    trie = {}
+    for index, key in enumerate(keys):
+        if not key: continue
+        node = trie
+        for char in key:
+            node = node.setdefault(char, {})
+        node.setdefault('', index) # End-of-key marker: position of the key in the map
+    return _node_pattern(trie, ordered)[0]
+
+def _node_pattern(node, ordered):
+    """Returns (pattern, index of the first-listed key in this subtree)."""
+    branches = []
+    first_below = float('inf')
+    for char, child in sorted(node.items()):
+        if not char: continue
+        pattern, child_first = _node_pattern(child, ordered)
+        branches.append(re.escape(char) + pattern)
+        first_below = min(first_below, child_first)
+    end_index = node.get('')
+    first_index = first_below if end_index is None else min(end_index, first_below)
+    if not branches: return '', first_index
+    if end_index is not None:
+        # A key ends here; continuing is optional
+        lazy = ordered and end_index < first_below
+        return '(?:' + '|'.join(branches) + (')??' if lazy else ')?'), first_index
+    return (branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'), first_index
+
+
+class ReplacementEngine:
+    """Rewrites a string in one pass using a fixed {garbled: fixed} map."""
+
+    def __init__(self, replacement_map):
+        self.replacement_map = dict(replacement_map)
+        self.regex = re.compile(build_trie_pattern(self.replacement_map))
+        self._lookup = self.replacement_map.__getitem__
+
+    def _replace(self, match):
+        return self._lookup(match.group())
+
+    def apply(self, text):
+        if text is None: return None
+        return self.regex.sub(self._replace, text)
+
+    def apply_many(self, texts):
+        """Applies the map to every string of a batch (None values pass through)."""
+        return [self.apply(text) for text in texts]
+
+
+# --- Word-level repair ---
+# Turkish dotted/dotless i: 'I' lowercases to 'ı' and 'i' uppercases to 'İ'
+TURKISH_LOWER = str.maketrans({'İ': 'i', 'I': 'ı'})
+TURKISH_UPPER = str.maketrans({'i': 'İ', 'ı': 'I'})
+# For text typed with English casing (e.g. 'ÇIFT' for 'ÇİFT') all four forms are one letter
+LOOSE_I = str.maketrans({'İ': 'i', 'I': 'i', 'ı': 'i'})
+
+def turkish_lower(text):
+    return text.translate(TURKISH_LOWER).lower()
+
+def turkish_upper(text):
+    return text.translate(TURKISH_UPPER).upper()
+
+def turkish_title(text):
+    """str.title() with Turkish i/ı casing: 'ilginç' -> 'İlginç', not 'Ilginç'."""
+    return re.sub(r'[^\W\d_]+', lambda m: turkish_upper(m.group()[0]) + turkish_lower(m.group()[1:]), text)
+
+def loose_fold(text):
+    return text.translate(LOOSE_I).lower()
+
+
+class WordRepairEngine:
+    """Case-insensitive whole-word replacement that preserves the matched word's casing.
+
+    Each regex hit is resolved with one dict lookup: first by Turkish lowercase, then by
+    a looser fold that treats i/ı/I/İ alike. When two keys fold to the same word, the
+    one listed first in the map wins, as with the old linear scan.
+    """
+
+    def __init__(self, word_map):
+        self.word_map = dict(word_map)
+        self._exact = {}
+        self._loose = {}
+        for key, replacement in self.word_map.items():
+            self._exact.setdefault(turkish_lower(key), replacement)
+            self._loose.setdefault(loose_fold(key), replacement)
+        pattern = build_trie_pattern([loose_fold(key) for key in self.word_map], ordered=True)
+        self.regex = re.compile(r'\b(' + pattern + r')\b', re.IGNORECASE | re.UNICODE)
+
+    def replace_match(self, match):
+        matched_word = match.group(1)
+        replacement = self._exact.get(turkish_lower(matched_word))
+        if replacement is None:
+            replacement = self._loose.get(loose_fold(matched_word))
+        if replacement is None:
+            return matched_word
+        # Preserve case, judged on the real letters: the garbled ones ('Ã', 'Å') are
+        # uppercase whatever the word's case was
+        letters = [char for char in matched_word if char.isalpha() and char not in SUSPICIOUS_CHARS]
+        if len(letters) > 1 and all(char.isupper() for char in letters):
+            return turkish_upper(replacement)
+        elif letters and letters[0].isupper():
+            return turkish_title(replacement)
+        return replacement
+
+    def apply(self, text):
+        if text is None: return None
+        return self.regex.sub(self.replace_match, text)
+
+    def apply_many(self, texts):
+        """Applies the map to every string of a batch (None values pass through)."""
+        return [self.apply(text) for text in texts]
+
+
+# Engines are cached per map object; maps are module-level constants in the scripts.
+_engines = {}
+_engines_lock = threading.Lock()
+
+def _cached_engine(engine_class, replacement_map):
+    cache_key = (engine_class, id(replacement_map))
+    cached = _engines.get(cache_key)
+    if cached is not None and cached[0] is replacement_map and cached[1] == len(replacement_map):
+        return cached[2]
+    with _engines_lock:
+        engine = engine_class(replacement_map)
+        _engines[cache_key] = (replacement_map, len(replacement_map), engine)
+        return engine
+
+def get_engine(replacement_map):
+    """Returns the (cached) character-sequence engine for this map, building it on first use."""
+    return _cached_engine(ReplacementEngine, replacement_map)
+
+def get_word_engine(word_map):
+    """Returns the (cached) whole-word engine for this map, building it on first use."""
+    return _cached_engine(WordRepairEngine, word_map)
+
+def apply_fixes_sequential(text, replacement_map):
+    """The original multi-pass implementation, kept as the reference for equivalence checks."""
+    if text is None: return None
+    fixed_text = text
+    sorted_keys = sorted(replacement_map.keys(), key=len, reverse=True)
+    for find in sorted_keys:
+        fixed_text = fixed_text.replace(find, replacement_map[find])
+    return fixed_text
+
+
+# --- Round-trip (algorithmic) repair ---
+# Mojibake here is UTF-8 bytes decoded as cp1252 (or latin-1): 'ü' -> b'\xc3\xbc' -> 'Ã¼'.
+# Suspicious spans are re-encoded to bytes and decoded as UTF-8. Spans that lost a byte
+# (it became a space, a no-break space or U+FFFD, e.g. 'gÃ�zel') have several possible
+# fills; every candidate is scored in context with a Turkish character bigram model and
+# only confident winners are applied. The rest is left to the hand-made maps.
+CP1252_TO_BYTE = {}
+for _byte in range(0x80, 0x100):
+    try:
+        CP1252_TO_BYTE[bytes([_byte]).decode('cp1252')] = _byte
+    except UnicodeDecodeError:
+        pass # 0x81, 0x8D, 0x8F, 0x90, 0x9D are undefined in cp1252; they survive as latin-1 controls
+_continuation = sorted({chr(b) for b in range(0x80, 0xC0)} |
+                       {char for char, b in CP1252_TO_BYTE.items() if 0x80 <= b < 0xC0})
+CONT_CLASS = '[' + ''.join(re.escape(char) for char in _continuation) + ']'
+LOST_CHARS = ' \xa0�'
+TURKISH_LETTERS = set('abcçdefgğhıijklmnoöprsştuüvyzâîû')
+TURKISH_PUNCTUATION = set('‘’“”…–—•')
+LOSSY_PREFIXES = ['Ã', 'Ä', 'Å', 'â€']
+SUSPICIOUS_CHARS = (set(_continuation) | {chr(b) for b in range(0xC2, 0xF5)} | {'�'}) - TURKISH_LETTERS - set('ÂÎÛ')
+
+# One UTF-8 sequence per match, so each is judged in its own context
+ROUNDTRIP_PATTERN = re.compile(
+    '(?:' + '|'.join(re.escape(prefix) for prefix in LOSSY_PREFIXES) + ')[' + LOST_CHARS + ']'
+    '|[Â-ß]' + CONT_CLASS + '|[à-ï]' + CONT_CLASS + '{2}|[ð-ô]' + CONT_CLASS + '{3}')
+
+def roundtrip_decode(span):
+    """Re-encodes a span with cp1252 (latin-1 for bytes cp1252 lacks) and decodes it as UTF-8."""
+    data = bytearray()
+    for char in span:
+        byte = CP1252_TO_BYTE.get(char)
+        if byte is None:
+            if ord(char) > 0xFF: return None
+            byte = ord(char)
+        data.append(byte)
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        return None
+
+def _lossy_fills(prefix):
+    """Lowercase Turkish letters / punctuation whose UTF-8 encoding starts with the prefix's bytes."""
+    prefix_bytes = bytes(CP1252_TO_BYTE.get(char, ord(char)) for char in prefix)
+    fills = []
+    for byte in range(0x80, 0xC0):
+        try:
+            char = (prefix_bytes + bytes([byte])).decode('utf-8')
+        except UnicodeDecodeError:
+            continue
+        if char in TURKISH_LETTERS or char in TURKISH_PUNCTUATION:
+            fills.append(char)
+    return fills
+
+LOSSY_FILLS = {prefix: _lossy_fills(prefix) for prefix in LOSSY_PREFIXES}
+
+
+class TurkishCharModel:
+    """Character bigram model (add-k smoothed) trained on clean archive text."""
+    BOUNDARY = '\x02'
+    SMOOTHING = 0.5
+    MIN_CHAR_COUNT = 5 # A non-Turkish character rarer than this in clean text is not a plausible repair
+
+    def __init__(self):
+        self.contexts = Counter()
+        self.bigrams = Counter()
+        self.vocabulary = 1
+        self._cache = {}
+
+    @staticmethod
+    def normalize(text):
+        return re.sub(r'\d', '0', turkish_lower(text)).replace('\xa0', ' ')
+
+    def train(self, texts):
+        """Counts bigrams over texts without any garble marker. Returns the number of texts used."""
+        used = 0
+        for text in texts:
+            if not text or garble_flags_of(text): continue
+            padded = self.BOUNDARY + self.normalize(text) + self.BOUNDARY
+            self.contexts.update(padded[:-1])
+            self.bigrams.update(padded[i:i + 2] for i in range(len(padded) - 1))
+            used += 1
+        self.vocabulary = len(set(self.contexts) | {pair[1] for pair in self.bigrams}) + 1
+        self._cache.clear()
+        return used
+
+    def transition(self, pair):
+        logprob = self._cache.get(pair)
+        if logprob is None:
+            logprob = math.log((self.bigrams[pair] + self.SMOOTHING) /
+                               (self.contexts[pair[0]] + self.SMOOTHING * self.vocabulary))
+            self._cache[pair] = logprob
+        return logprob
+
+    def plausible(self, text):
+        """True if every character is ASCII, Turkish, or seen often enough in clean text."""
+        for char in text:
+            if char.isascii() or char in TURKISH_PUNCTUATION: continue
+            lower = self.normalize(char)
+            if lower in TURKISH_LETTERS: continue
+            if self.contexts[lower] < self.MIN_CHAR_COUNT: return False
+        return True
+
+    def mean_logprob(self, text):
+        """Average log-probability per character transition (length-neutral)."""
+        text = self.normalize(text)
+        if len(text) < 2: return 0.0
+        return sum(self.transition(text[i:i + 2]) for i in range(len(text) - 1)) / (len(text) - 1)
+
+
+BATCH_SEPARATOR = '\x00' # Cannot occur in PostgreSQL text, and is a \b boundary like a string end
+
+class RoundTripRepairer:
+    """Algorithmic repair stage with a map-based fallback.
+
+    repair_many() scans a whole batch once (NUL-joined) and memoizes decisions per
+    (context, span), since the same garbled words repeat across the archive. fallback
+    is an engine with apply_many() (ReplacementEngine or WordRepairEngine) run
+    afterwards for the spans that were not confidently repaired.
+    """
+    CONTEXT = 3
+    SUSPICIOUS_PENALTY = 2.0 # Per mojibake-looking character left in a candidate
+    MAX_CACHE = 200000
+
+    def __init__(self, model, fallback=None, min_margin=0.5):
+        self.model = model
+        self.fallback = fallback
+        self.min_margin = min_margin
+        self._decisions = {}
+        self.stats = {'spans': 0, 'repaired': 0, 'low_confidence': 0, 'cache_hits': 0}
+
+    def _score(self, left, candidate, right):
+        penalty = sum(1 for char in candidate if char in SUSPICIOUS_CHARS)
+        return self.model.mean_logprob(left + candidate + right) - self.SUSPICIOUS_PENALTY * penalty
+
+    def _candidates(self, left, span, right):
+        candidates = {span}
+        exact = roundtrip_decode(span)
+        # Byte-exact decodes foreign to the archive ('Ã”' -> 'Ô' where 'Ç' was meant) are
+        # left to the maps
+        if exact is not None and self.model.plausible(exact):
+            candidates.add(exact)
+        if exact is not None and len(span) > 2:
+            # Double encoding: the decoded span is mojibake itself
+            deeper = roundtrip_decode(exact)
+            if deeper is not None and self.model.plausible(deeper): candidates.add(deeper)
+        if span[-1] in LOST_CHARS and span[:-1] in LOSSY_FILLS:
+            # The fill's case cannot be recovered; follow the neighbouring letter
+            neighbour = left[-1:] if left[-1:].isalpha() else right[:1]
+            upper = neighbour.isalpha() and neighbour.isupper()
+            for fill in LOSSY_FILLS[span[:-1]]:
+                fill = turkish_upper(fill) if upper else fill
+                candidates.add(fill) # The lost byte was replaced by the character
+                if span[-1] != '�' and not right[:1].isalpha():
+                    candidates.add(fill + span[-1]) # The byte vanished; the space is real
+        return candidates
+
+    def _decide(self, left, span, right):
+        """Returns the replacement for span, or None to leave it (and count low confidence)."""
+        scored = sorted(((self._score(left, candidate, right), candidate)
+                         for candidate in self._candidates(left, span, right)), reverse=True)
+        best_score, best = scored[0]
+        if best == span: return None
+        runner_up = scored[1][0] if len(scored) > 1 else float('-inf')
+        if best_score - runner_up < self.min_margin:
+            self.stats['low_confidence'] += 1
+            return None
+        return best
+
+    def _resolve(self, left, span, right):
+        self.stats['spans'] += 1
+        key = (left, span, right)
+        if key in self._decisions:
+            self.stats['cache_hits'] += 1
+            decision = self._decisions[key]
+        else:
+            if len(self._decisions) >= self.MAX_CACHE: self._decisions.clear()
+            decision = self._decisions[key] = self._decide(left, span, right)
+        if decision is None: return span
+        self.stats['repaired'] += 1
+        return decision
+
+    @staticmethod
+    def _double_encoded_end(text, match):
+        """End of a double-encoded character starting at match ('Ã„Â±' for 'ı'), or None."""
+        first = roundtrip_decode(match.group())
+        if first is None or not '\xc2' <= first[0] <= '\xf4': return None # Must decode to a lead byte
+        end = match.end()
+        for _ in range(3):
+            following = ROUNDTRIP_PATTERN.match(text, end)
+            if following is None: return None
+            end = following.end()
+            decoded = roundtrip_decode(text[match.start():end])
+            if decoded is not None and roundtrip_decode(decoded) is not None: return end
+        return None
+
+    def _sub(self, text):
+        """One left-to-right pass; the left context is the already repaired output."""
+        pieces = []
+        tail = ''
+        position = 0
+        while True:
+            match = ROUNDTRIP_PATTERN.search(text, position)
+            if match is None: break
+            start, end = match.span()
+            end = self._double_encoded_end(text, match) or end
+            gap = text[position:start]
+            left = (tail + gap)[-self.CONTEXT:].rpartition(BATCH_SEPARATOR)[2]
+            right = text[end:end + self.CONTEXT].partition(BATCH_SEPARATOR)[0]
+            piece = self._resolve(left, text[start:end], right)
+            pieces += [gap, piece]
+            tail = (tail + gap + piece)[-self.CONTEXT:]
+            position = end
+        pieces.append(text[position:])
+        return ''.join(pieces)
+
+    def _roundtrip(self, text):
+        # A second pass undoes double encoding ('ÃƒÂ¼' -> 'Ã¼' -> 'ü')
+        for _ in range(2):
+            fixed = self._sub(text)
+            if fixed == text: break
+            text = fixed
+        return text
+
+    def repair(self, text):
+        if text is None: return None
+        return self.repair_many([text])[0]
+
+    def repair_many(self, texts):
+        texts = list(texts)
+        present = [text for text in texts if text]
+        if present and not any(BATCH_SEPARATOR in text for text in present):
+            fixed = iter(self._roundtrip(BATCH_SEPARATOR.join(present)).split(BATCH_SEPARATOR))
+            texts = [next(fixed) if text else text for text in texts]
+        else:
+            texts = [self._roundtrip(text) if text else text for text in texts]
+        if self.fallback is not None:
+            texts = self.fallback.apply_many(texts)
+        return texts
+
+    def report(self):
+        s = self.stats
+        return (f"round-trip repair: {s['spans']} suspicious spans, {s['repaired']} repaired, "
+                f"{s['low_confidence']} left to the maps (low confidence), {s['cache_hits']} cache hits")
+
+
+def train_model_from_db(conn, sample_size=20000):
+    """Trains the Turkish model on a random sample of comment texts (garbled ones are skipped)."""
+    model = TurkishCharModel()
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT content FROM comments TABLESAMPLE SYSTEM (5) LIMIT %s", (sample_size,))
+        texts = [row[0] for row in cursor.fetchall()]
+        if len(texts) < sample_size // 2: # Small table: the block sample may miss most rows
+            cursor.execute("SELECT content FROM comments LIMIT %s", (sample_size,))
+            texts = [row[0] for row in cursor.fetchall()]
+    conn.rollback()
+    used = model.train(texts)
+    print(f"Trained Turkish character model on {used} clean comments ({len(model.bigrams)} bigrams).")
+    return model
@@ -0,0 +1,174 @@
+# parallel_repair.py
+# Runs the V7 encoding repair (convert_chars.py) on all cores: each column is split into
+# primary-key ranges that a pool of worker processes repairs independently, each worker
+# with its own read and write connection. Progress and the final summary are merged
+# in the parent process.
+#
+#   python parallel_repair.py [comments.content posts.title ...] [--workers 8] [--bucket-size 50000] [--maps-only]
+#
+# Ranges are fixed id buckets [k * bucket_size, (k + 1) * bucket_size), many more than
+# there are workers, so a few dense buckets do not leave the other workers idle at the
+# end. Each bucket is a resumable job (repair_jobs.py) named after its bounds; since the
+# bounds do not depend on the table's current min/max, a re-run after the table grew
+# continues unfinished buckets after their last committed batch, reopens finished ones
+# that got new ids after their last id (the old top bucket) and adds buckets for the
+# ids beyond. Keep the same --bucket-size when resuming; --restart starts over.
+# The Turkish character model for round-trip repair is trained once here and shipped to
+# every worker; --maps-only skips it and applies REPLACEMENT_MAP_V7 alone.
+# Every range journals its changes (change_journal.py); the summary lists the journals
+# to pass to 'change_journal.py undo'.
+import os
+import sys
+import time
+import atexit
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import psycopg2
+from tqdm import tqdm
+
+from archive_version import bump_archive_version
+from repair_jobs import ensure_checkpoint_tables
+from mojibake_repair import RoundTripRepairer, get_engine, train_model_from_db
+from convert_chars import DATABASE_URL, REPLACEMENT_MAP_V7, fix_table_column_v7_two_conn, rebuild_user_stats
+
+# --- Configuration ---
+DEFAULT_TARGETS = ['comments.content', 'posts.title']
+PK_COLUMN = 'id'
+BUCKET_SIZE = 50000 # Ids per range job; part of the job names, so resume with the same value
+
+# --- Worker side ---
+_read_conn = None
+_write_conn = None
+_repairer = None
+
+def _init_worker(model):
+    """Opens this worker's read and write connections once, for all of its ranges."""
+    global _read_conn, _write_conn, _repairer
+    _read_conn = psycopg2.connect(DATABASE_URL)
+    _write_conn = psycopg2.connect(DATABASE_URL)
+    if model is not None:
+        _repairer = RoundTripRepairer(model, fallback=get_engine(REPLACEMENT_MAP_V7))
+    atexit.register(_close_worker)
+
+def _close_worker():
+    for conn in (_read_conn, _write_conn):
+        if conn and not conn.closed: conn.close()
+
+def repair_range(table_name, column_name, id_range, restart):
+    result = fix_table_column_v7_two_conn(_read_conn, _write_conn, table_name, column_name, PK_COLUMN,
+                                          REPLACEMENT_MAP_V7, id_range=id_range, verbose=False, bump_version=False,
+                                          restart=restart, repairer=_repairer)
+    result['range'] = id_range
+    return result
+
+# --- Main process ---
+def split_id_ranges(conn, table_name, bucket_size=BUCKET_SIZE):
+    """The fixed half-open id buckets between min(id) and max(id), covering every row."""
+    with conn.cursor() as cursor:
+        cursor.execute(f"SELECT min({PK_COLUMN}), max({PK_COLUMN}) FROM {table_name}")
+        low, high = cursor.fetchone()
+    conn.rollback()
+    if low is None: return []
+    return [(bucket * bucket_size, (bucket + 1) * bucket_size)
+            for bucket in range(low // bucket_size, high // bucket_size + 1)]
+
+def repair_column_parallel(conn, table_name, column_name, workers, bucket_size=BUCKET_SIZE, restart=False, model=None):
+    """Repairs one column across the pool (round-trip repair if model is given). Returns the merged summary dict."""
+    ranges = split_id_ranges(conn, table_name, bucket_size)
+    summary = {'target': f"{table_name}.{column_name}", 'ranges': len(ranges),
+               'checked': 0, 'updated': 0, 'failed_ranges': [], 'journals': [], 'seconds': 0.0}
+    if not ranges:
+        print(f"'{table_name}' is empty; nothing to do.")
+        return summary
+
+    print(f"\n--- Repairing {summary['target']}: {len(ranges)} id ranges on {workers} workers ---")
+    ensure_checkpoint_tables(conn) # Once here, rather than racing CREATE TABLE in every worker
+    start = time.time()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model,)) as pool:
+        futures = [pool.submit(repair_range, table_name, column_name, id_range, restart) for id_range in ranges]
+        with tqdm(total=len(futures), desc=summary['target'], unit='range') as progress:
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e: # e.g. a worker could not connect
+                    result = {'checked': 0, 'updated': 0, 'error': str(e), 'range': None, 'journal': None}
+                summary['checked'] += result['checked']
+                summary['updated'] += result['updated']
+                if result['journal']: summary['journals'].append(result['journal'])
+                if result['error']:
+                    summary['failed_ranges'].append((result['range'], result['error']))
+                progress.update(1)
+                progress.set_postfix(checked=summary['checked'], updated=summary['updated'],
+                                     failed=len(summary['failed_ranges']))
+    summary['seconds'] = time.time() - start
+    return summary
+
+def print_summary(summaries):
+    print("\n" + "=" * 72)
+    print(f"{'target':<20} {'ranges':>7} {'checked':>10} {'updated':>9} {'failed':>7} {'rows/s':>10}")
+    print("-" * 72)
+    for s in summaries:
+        rate = s['checked'] / s['seconds'] if s['seconds'] else 0
+        print(f"{s['target']:<20} {s['ranges']:>7} {s['checked']:>10} {s['updated']:>9} "
+              f"{len(s['failed_ranges']):>7} {rate:>10.0f}")
+    print("=" * 72)
+    for s in summaries:
+        for id_range, error in s['failed_ranges']:
+            print(f"  FAILED {s['target']} range {id_range}: {error}")
+    journals = [path for s in summaries for path in s['journals']]
+    if journals:
+        print(f"{len(journals)} change journals written to '{os.path.dirname(journals[0])}'; "
+              f"revert with: python change_journal.py undo <journals>")
+
+# --- Main Execution ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parallel V7 encoding repair by primary-key range.")
+    parser.add_argument('targets', nargs='*', default=DEFAULT_TARGETS, help="table.column to repair")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4)
+    parser.add_argument('--bucket-size', type=int, default=BUCKET_SIZE,
+                        help="Ids per range job (keep it unchanged when resuming)")
+    parser.add_argument('--restart', action='store_true', help="Ignore saved checkpoints and repair every range again")
+    parser.add_argument('--maps-only', action='store_true', help="Apply REPLACEMENT_MAP_V7 only, without round-trip repair")
+    args = parser.parse_args()
+
+    if not DATABASE_URL:
+        print("Error: DATABASE_URL environment variable not set.")
+        sys.exit(1)
+    targets = []
+    for target in args.targets:
+        table_name, _, column_name = target.partition('.')
+        if not column_name:
+            print(f"Error: target '{target}' must be table.column")
+            sys.exit(1)
+        targets.append((table_name, column_name))
+
+    print(f"Parallel encoding repair of {', '.join(args.targets)} with {args.workers} workers.")
+    print("!!! HAVE YOU BACKED UP YOUR DATABASE? !!!")
+    confirm = input("Type 'YES' to confirm you have a backup and wish to proceed: ")
+    if confirm != 'YES': print("Operation cancelled."); sys.exit()
+
+    conn = None
+    summaries = []
+    interrupted = False
+    try:
+        conn = psycopg2.connect(DATABASE_URL)
+        model = None if args.maps_only else train_model_from_db(conn)
+        for table_name, column_name in targets:
+            summaries.append(repair_column_parallel(conn, table_name, column_name,
+                                                    args.workers, args.bucket_size, args.restart, model))
+    except KeyboardInterrupt:
+        interrupted = True
+        print("\nInterrupted; batches committed so far are kept. Re-run to continue.")
+    except psycopg2.Error as e:
+        print(f"Database error: {e}")
+    finally:
+        print_summary(summaries)
+        # An interrupted column has no summary, but may have committed batches
+        if interrupted or any(s['updated'] for s in summaries):
+            bump_archive_version("parallel_repair: " + ", ".join(args.targets))
+        if conn and any(s['target'] == 'comments.author' and s['updated'] for s in summaries):
+            rebuild_user_stats(conn)
+        if conn: conn.close()
+
+    sys.exit(1 if any(s['failed_ranges'] for s in summaries) else 0)
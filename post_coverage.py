@@ -0,0 +1,215 @@
+# post_coverage.py
+# Per-post comment extraction status, kept in the post_coverage table instead of being
+# recomputed with NOT IN (SELECT DISTINCT post_id FROM comments) and dumped by hand.
+#   python post_coverage.py [--recheck] [--batch-size 20000]
+#
+# post_coverage (post_id, status, attempts, last_error, last_attempt_at, updated_at):
+#   missing      no comments, no re-extraction tried yet
+#   covered      the post has comments
+#   no_snapshot / no_comments / error
+#                last re-extraction attempt's outcome (re_extract_comments.py)
+#
+# Statement-level triggers keep it current: inserting comments marks their posts
+# covered (one upsert per COPY/INSERT statement, via the transition table), deleting a
+# post's last comment marks it missing again, and new posts start as missing. The
+# dirty set is served by the partial index ix_post_coverage_uncovered.
+#
+# This script creates the table and triggers, then fills it for posts that are not
+# tracked yet with a NOT EXISTS anti-join on ix_comments_post_id_id; --recheck also
+# corrects rows that were tracked before the triggers existed.
+import os
+import sys
+import time
+import argparse
+import psycopg2
+import psycopg2.extras
+from dotenv import load_dotenv
+
+# --- Configuration ---
+load_dotenv()
+DATABASE_URL = os.getenv('DATABASE_URL')
+BATCH_SIZE = 20000 # Post ids per INSERT/commit during the backfill
+
+STATUS_MISSING = 'missing'
+STATUS_COVERED = 'covered'
+ATTEMPT_STATUSES = ('no_snapshot', 'no_comments', 'error')
+
+ENSURE_SQL = f"""
+    CREATE TABLE IF NOT EXISTS post_coverage (
+        post_id integer PRIMARY KEY REFERENCES posts (id) ON DELETE CASCADE,
+        status text NOT NULL DEFAULT '{STATUS_MISSING}',
+        attempts integer NOT NULL DEFAULT 0,
+        last_error text,
+        last_attempt_at timestamptz,
+        updated_at timestamptz NOT NULL DEFAULT now()
+    );
+    CREATE INDEX IF NOT EXISTS ix_post_coverage_uncovered
+        ON post_coverage (post_id) WHERE status <> '{STATUS_COVERED}';
+
+    CREATE OR REPLACE FUNCTION post_coverage_comments_inserted() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        INSERT INTO post_coverage (post_id, status)
+        SELECT DISTINCT post_id, '{STATUS_COVERED}' FROM new_comments
+        ON CONFLICT (post_id) DO UPDATE
+            SET status = '{STATUS_COVERED}', last_error = NULL, updated_at = now()
+            WHERE post_coverage.status <> '{STATUS_COVERED}';
+        RETURN NULL;
+    END $$;
+    DROP TRIGGER IF EXISTS post_coverage_insert ON comments;
+    CREATE TRIGGER post_coverage_insert
+        AFTER INSERT ON comments REFERENCING NEW TABLE AS new_comments
+        FOR EACH STATEMENT EXECUTE FUNCTION post_coverage_comments_inserted();
+
+    CREATE OR REPLACE FUNCTION post_coverage_comments_deleted() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        UPDATE post_coverage pc SET status = '{STATUS_MISSING}', updated_at = now()
+        FROM (SELECT DISTINCT post_id FROM old_comments) o
+        WHERE pc.post_id = o.post_id AND pc.status = '{STATUS_COVERED}'
+          AND NOT EXISTS (SELECT 1 FROM comments c WHERE c.post_id = o.post_id);
+        RETURN NULL;
+    END $$;
+    DROP TRIGGER IF EXISTS post_coverage_delete ON comments;
+    CREATE TRIGGER post_coverage_delete
+        AFTER DELETE ON comments REFERENCING OLD TABLE AS old_comments
+        FOR EACH STATEMENT EXECUTE FUNCTION post_coverage_comments_deleted();
+
+    CREATE OR REPLACE FUNCTION post_coverage_posts_inserted() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        INSERT INTO post_coverage (post_id) SELECT id FROM new_posts
+        ON CONFLICT (post_id) DO NOTHING;
+        RETURN NULL;
+    END $$;
+    DROP TRIGGER IF EXISTS post_coverage_posts_insert ON posts;
+    CREATE TRIGGER post_coverage_posts_insert
+        AFTER INSERT ON posts REFERENCING NEW TABLE AS new_posts
+        FOR EACH STATEMENT EXECUTE FUNCTION post_coverage_posts_inserted();
+"""
+
+# Posts without comments, as an anti-join probing ix_comments_post_id_id (post_id, id).
+# Unlike NOT IN (SELECT DISTINCT post_id ...) nothing is materialized, and a NULL
+# post_id cannot empty the result.
+MISSING_POSTS_SQL = """
+    SELECT p.id FROM posts p
+    WHERE NOT EXISTS (SELECT 1 FROM comments c WHERE c.post_id = p.id)
+    ORDER BY p.id;
+"""
+
+BACKFILL_SQL = f"""
+    INSERT INTO post_coverage (post_id, status)
+    SELECT p.id,
+           CASE WHEN EXISTS (SELECT 1 FROM comments c WHERE c.post_id = p.id)
+                THEN '{STATUS_COVERED}' ELSE '{STATUS_MISSING}' END
+    FROM posts p
+    WHERE p.id >= %s AND p.id < %s
+    ON CONFLICT (post_id) DO {{conflict}};
+"""
+# --recheck: fix rows whose covered-ness is wrong, keeping the outcome of past attempts
+RECHECK_CONFLICT = f"""UPDATE SET status = EXCLUDED.status, updated_at = now()
+        WHERE (post_coverage.status = '{STATUS_COVERED}') IS DISTINCT FROM (EXCLUDED.status = '{STATUS_COVERED}')"""
+
+# --- Functions ---
+def ensure_post_coverage(conn):
+    """Creates the table, its index and the triggers (idempotent); commits."""
+    with conn.cursor() as cursor:
+        cursor.execute(ENSURE_SQL)
+    conn.commit()
+
+def coverage_ready(conn):
+    """True if the post_coverage table exists (callers then record their attempts in it)."""
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT to_regclass('post_coverage') IS NOT NULL")
+        ready = cursor.fetchone()[0]
+    conn.rollback()
+    return ready
+
+def uncovered_posts_query(statuses=None):
+    """(SQL, params) listing the ids of uncovered posts, optionally only some statuses."""
+    if statuses:
+        return "SELECT post_id FROM post_coverage WHERE status = ANY(%s) ORDER BY post_id;", (list(statuses),)
+    return "SELECT post_id FROM post_coverage WHERE status <> %s ORDER BY post_id;", (STATUS_COVERED,)
+
+def record_attempts(cursor, attempts):
+    """Counts one extraction attempt per (post_id, status, error); caller commits.
+
+    status is 'covered' or one of ATTEMPT_STATUSES. A post the insert trigger already
+    marked covered stays covered.
+    """
+    if not attempts: return
+    psycopg2.extras.execute_values(cursor, f"""
+        INSERT INTO post_coverage (post_id, status, attempts, last_error, last_attempt_at)
+        VALUES %s
+        ON CONFLICT (post_id) DO UPDATE SET
+            attempts = post_coverage.attempts + 1,
+            last_attempt_at = now(),
+            last_error = EXCLUDED.last_error,
+            status = CASE WHEN post_coverage.status = '{STATUS_COVERED}' THEN post_coverage.status
+                          ELSE EXCLUDED.status END,
+            updated_at = now()
+    """, attempts, template="(%s, %s, 1, %s, now())")
+
+def backfill_post_coverage(conn, batch_size=BATCH_SIZE, recheck=False):
+    """Tracks every post (or re-derives covered/missing with recheck) in id-range batches."""
+    print(f"\n--- Filling post_coverage (batches of {batch_size} post ids{', recheck' if recheck else ''}) ---")
+    sql = BACKFILL_SQL.format(conflict=RECHECK_CONFLICT if recheck else "NOTHING")
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT min(id), max(id) FROM posts;")
+        min_id, max_id = cursor.fetchone()
+        if min_id is None:
+            print("No posts found.")
+            return 0
+        written = 0
+        for start_id in range(min_id, max_id + 1, batch_size):
+            cursor.execute(sql, (start_id, start_id + batch_size))
+            written += cursor.rowcount
+            conn.commit()
+            print(f"  Post ids {start_id}-{min(start_id + batch_size - 1, max_id)}: "
+                  f"{cursor.rowcount} rows written (total {written}).")
+    return written
+
+def print_coverage_summary(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT status, count(*), sum(attempts), max(last_attempt_at)
+            FROM post_coverage GROUP BY status ORDER BY count(*) DESC
+        """)
+        rows = cursor.fetchall()
+    conn.rollback()
+    print("\n--- Post coverage ---")
+    for status, count, attempts, last_attempt in rows:
+        print(f"{status:>12}: {count} posts, {attempts} attempts"
+              + (f", last attempt {last_attempt:%Y-%m-%d %H:%M}" if last_attempt else ""))
+
+# --- Main Execution ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create and fill the post_coverage tracking table.")
+    parser.add_argument('--recheck', action='store_true', help="Re-derive covered/missing for already tracked posts")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Post ids per INSERT/commit")
+    args = parser.parse_args()
+
+    start_run_time = time.time()
+    if not DATABASE_URL:
+        print("Error: DATABASE_URL environment variable not set.")
+        sys.exit(1)
+
+    conn = None
+    try:
+        print("Connecting to database...")
+        conn = psycopg2.connect(DATABASE_URL)
+        print("Database connection successful.")
+        # Triggers first, so comments inserted while the backfill runs are tracked too
+        ensure_post_coverage(conn)
+        backfill_post_coverage(conn, args.batch_size, recheck=args.recheck)
+        print_coverage_summary(conn)
+    except KeyboardInterrupt:
+        print("\nInterrupted; committed batches are kept. Re-run to continue with untracked posts.")
+    except psycopg2.Error as e:
+        print(f"!!! Database error occurred: {e}")
+        if conn: conn.rollback()
+        sys.exit(1)
+    finally:
+        if conn: conn.close(); print("\nDatabase connection closed.")
+
+    print(f"\nScript finished in {time.time() - start_run_time:.2f} seconds.")
@@ -0,0 +1,195 @@
+# query_history.py
+# Local history of the queries run in query_db.py, with their timings and plans, so
+# index changes can be measured against real archive queries.
+#
+# Every query is stored in a SQLite file (QUERY_HISTORY_FILE, default
+# query_history.sqlite3) with its wall time, row count and EXPLAIN (FORMAT JSON) plan:
+# estimated only, or with actual times and buffers when \explain was on. Benchmarks
+# (\bench N) store their min/median/p95 as well. Runs of the same query share a
+# query_hash (whitespace- and case-insensitive), which \plandiff uses to find the
+# previous plan to compare with.
+import os
+import json
+import time
+import sqlite3
+import difflib
+import hashlib
+import statistics
+
+HISTORY_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS runs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        run_at TEXT NOT NULL,
+        database TEXT,
+        mode TEXT NOT NULL,        -- normal / stream / export / explain / bench
+        query TEXT NOT NULL,
+        query_hash TEXT NOT NULL,
+        wall_ms REAL,
+        rows INTEGER,
+        plan TEXT,                 -- EXPLAIN (FORMAT JSON) document
+        analyzed INTEGER NOT NULL DEFAULT 0,
+        stats TEXT,                -- bench: {"runs", "min_ms", "median_ms", "p95_ms", ...}
+        error TEXT
+    );
+    CREATE INDEX IF NOT EXISTS ix_runs_query_hash ON runs (query_hash, id);
+"""
+
+# Plan node properties printed under the node line, as EXPLAIN does
+DETAIL_KEYS = ['Index Cond', 'Recheck Cond', 'Hash Cond', 'Merge Cond', 'Join Filter', 'Filter',
+               'Rows Removed by Filter', 'Rows Removed by Index Recheck', 'Sort Key', 'Sort Method',
+               'Group Key', 'Heap Fetches']
+
+def history_path():
+    return os.environ.get('QUERY_HISTORY_FILE', 'query_history.sqlite3')
+
+def query_hash(query):
+    normalized = ' '.join(query.split()).rstrip(';').strip().lower()
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+def timing_stats(timings_ms):
+    """min / median / p95 / max / mean of a benchmark's run times (ms)."""
+    ordered = sorted(timings_ms)
+    if len(ordered) > 1:
+        p95 = statistics.quantiles(ordered, n=20, method='inclusive')[18]
+    else:
+        p95 = ordered[0]
+    return {'runs': len(ordered), 'min_ms': ordered[0], 'median_ms': statistics.median(ordered),
+            'p95_ms': p95, 'max_ms': ordered[-1], 'mean_ms': statistics.fmean(ordered)}
+
+# --- Store ---
+class QueryHistory:
+    def __init__(self, path=None, database=None):
+        self.path = path or history_path()
+        self.database = database
+        self.db = sqlite3.connect(self.path)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(HISTORY_SCHEMA)
+
+    def record(self, mode, query, wall_ms=None, rows=None, plan=None, analyzed=False, stats=None, error=None):
+        """Stores one run; returns its id."""
+        cursor = self.db.execute("""
+            INSERT INTO runs (run_at, database, mode, query, query_hash, wall_ms, rows, plan, analyzed, stats, error)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (time.strftime('%Y-%m-%d %H:%M:%S'), self.database, mode, query, query_hash(query), wall_ms, rows,
+              json.dumps(plan) if plan is not None else None, int(analyzed),
+              json.dumps(stats) if stats is not None else None, error))
+        self.db.commit()
+        return cursor.lastrowid
+
+    def get(self, run_id):
+        return self.db.execute("SELECT * FROM runs WHERE id = ?", (run_id,)).fetchone()
+
+    def recent(self, limit=20):
+        return self.db.execute("SELECT * FROM runs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+
+    def previous_with_plan(self, run):
+        """The latest earlier run of the same query that has a plan (analyzed ones preferred)."""
+        return self.db.execute("""
+            SELECT * FROM runs WHERE query_hash = ? AND id < ? AND plan IS NOT NULL
+            ORDER BY analyzed DESC, id DESC LIMIT 1
+        """, (run['query_hash'], run['id'])).fetchone()
+
+    def latest_with_plan(self):
+        return self.db.execute("SELECT * FROM runs WHERE plan IS NOT NULL ORDER BY id DESC LIMIT 1").fetchone()
+
+    def close(self):
+        self.db.close()
+
+# --- Plans ---
+def _node_label(node):
+    label = node['Node Type']
+    if node.get('Join Type') and node['Join Type'] != 'Inner': label += f" ({node['Join Type']})"
+    if node.get('Index Name'): label += f" using {node['Index Name']}"
+    if node.get('Relation Name'):
+        label += f" on {node['Relation Name']}"
+        if node.get('Alias') and node['Alias'] != node['Relation Name']: label += f" {node['Alias']}"
+    return label
+
+def _buffers(node):
+    parts = [f"{kind}={node[f'Shared {kind.title()} Blocks']}" for kind in ('hit', 'read', 'dirtied', 'written')
+             if node.get(f'Shared {kind.title()} Blocks')]
+    return f"shared {' '.join(parts)}" if parts else ''
+
+def _walk(node, depth=0):
+    yield node, depth
+    for child in node.get('Plans', []):
+        yield from _walk(child, depth + 1)
+
+def render_plan(plan):
+    """EXPLAIN-style text lines for an EXPLAIN (FORMAT JSON) document."""
+    document = plan[0]
+    lines = []
+    for node, depth in _walk(document['Plan']):
+        indent = '  ' * depth + ('->  ' if depth else '')
+        line = (f"{indent}{_node_label(node)}  (cost={node['Startup Cost']:.2f}..{node['Total Cost']:.2f} "
+                f"rows={node['Plan Rows']} width={node['Plan Width']})")
+        if 'Actual Loops' in node:
+            if node['Actual Loops'] == 0:
+                line += " (never executed)"
+            else:
+                line += (f" (actual time={node['Actual Startup Time']:.3f}..{node['Actual Total Time']:.3f} "
+                         f"rows={node['Actual Rows']} loops={node['Actual Loops']})")
+        lines.append(line)
+        detail_indent = '  ' * depth + ('      ' if depth else '  ')
+        for key in DETAIL_KEYS:
+            if key in node:
+                value = ', '.join(node[key]) if isinstance(node[key], list) else node[key]
+                lines.append(f"{detail_indent}{key}: {value}")
+        buffers = _buffers(node)
+        if buffers: lines.append(f"{detail_indent}Buffers: {buffers}")
+    for key in ('Planning Time', 'Execution Time'):
+        if key in document: lines.append(f"{key}: {document[key]:.3f} ms")
+    return lines
+
+def plan_rows(plan):
+    """Rows returned by the top node (actual when analyzed, else the estimate)."""
+    top = plan[0]['Plan']
+    return top.get('Actual Rows', top['Plan Rows'])
+
+def _node_metrics(node):
+    loops = node.get('Actual Loops') or 0
+    return {'time_ms': node['Actual Total Time'] * loops if 'Actual Total Time' in node else None,
+            'rows': node['Actual Rows'] * loops if 'Actual Rows' in node else node['Plan Rows'],
+            'buffers': (node.get('Shared Hit Blocks') or 0) + (node.get('Shared Read Blocks') or 0),
+            'cost': node['Total Cost']}
+
+def _fmt(value, unit=''):
+    if value is None: return '-'
+    return f"{value:.2f}{unit}" if isinstance(value, float) else f"{value}{unit}"
+
+def _change(old, new):
+    if old is None or new is None or not old: return ''
+    return f"{100.0 * (new - old) / old:+.0f}%"
+
+def diff_plans(run_a, run_b):
+    """Lines comparing two history runs' plans: structure first, then per-node numbers."""
+    plan_a, plan_b = json.loads(run_a['plan']), json.loads(run_b['plan'])
+    lines = [f"A: run {run_a['id']} ({run_a['run_at']}, {run_a['mode']}, wall {_fmt(run_a['wall_ms'], ' ms')})",
+             f"B: run {run_b['id']} ({run_b['run_at']}, {run_b['mode']}, wall {_fmt(run_b['wall_ms'], ' ms')})"]
+    if run_a['query_hash'] != run_b['query_hash']: lines.append("(different queries)")
+    for key in ('Planning Time', 'Execution Time'):
+        old, new = plan_a[0].get(key), plan_b[0].get(key)
+        if old is not None or new is not None:
+            lines.append(f"{key}: {_fmt(old, ' ms')} -> {_fmt(new, ' ms')} {_change(old, new)}")
+
+    nodes_a, nodes_b = list(_walk(plan_a[0]['Plan'])), list(_walk(plan_b[0]['Plan']))
+    shape_a = ['  ' * depth + _node_label(node) for node, depth in nodes_a]
+    shape_b = ['  ' * depth + _node_label(node) for node, depth in nodes_b]
+    if shape_a != shape_b:
+        lines.append("\nPlan shape changed:")
+        lines.extend(line for line in difflib.unified_diff(shape_a, shape_b, 'A', 'B', lineterm='', n=len(shape_a))
+                     if not line.startswith(('---', '+++', '@@')))
+        return lines
+
+    lines.append("\nSame plan shape; per node (time = total over loops):")
+    table = [("node", "time A", "time B", "", "rows A", "rows B", "buffers A", "buffers B")]
+    for (node_a, depth), (node_b, _) in zip(nodes_a, nodes_b):
+        a, b = _node_metrics(node_a), _node_metrics(node_b)
+        table.append(('  ' * depth + _node_label(node_a), _fmt(a['time_ms']), _fmt(b['time_ms']),
+                      _change(a['time_ms'], b['time_ms']), _fmt(a['rows']), _fmt(b['rows']),
+                      _fmt(a['buffers']), _fmt(b['buffers'])))
+    widths = [max(len(row[i]) for row in table) for i in range(len(table[0]))]
+    for row in table:
+        lines.append('  '.join(cell.ljust(width) if i == 0 else cell.rjust(width)
+                               for i, (cell, width) in enumerate(zip(row, widths))))
+    return lines
@@ -0,0 +1,335 @@
+# re_extract_comments.py
+# Re-extracts the comments of posts that have none (missing_comment_post_ids.txt, from
+# missing_ids_tofile.py) out of saved Wayback Machine HTML snapshots of their pages.
+#   python re_extract_comments.py [--snapshots wayback_snapshots] [--workers 8] [--dry-run] [--limit N]
+#
+# Snapshots are looked up by post id: <dir>/<id>.html, <dir>/<id>-<anything>.html or
+# <dir>/<id>/<anything>.html (optionally .gz). When a post has several, the one yielding
+# the most comments wins. wayback_fetch.py downloads snapshots in this layout.
+#
+# 1. Ids that still have no comments are parsed in a process pool (lxml when installed,
+#    else html.parser) into comments rows; dates go through parse_turkish_datetime.
+# 2. Rows are inserted with COPY in batches; each batch also refreshes the posts'
+#    activity columns, counts each post's attempt in post_coverage (if post_coverage.py
+#    has created it) and is committed before its ids are written to the manifest.
+# 3. The manifest (JSONL, one line per id: status, comments, snapshot, error) and the
+#    throughput stats are the output. Re-running skips posts that have comments now.
+import os
+import re
+import sys
+import html
+import gzip
+import json
+import time
+import logging
+import argparse
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+
+import psycopg2
+from bs4 import BeautifulSoup
+from dotenv import load_dotenv
+
+from archive_version import bump_archive_version
+from backfill_post_activity import refresh_post_activity
+from bulk_writer import copy_rows
+from post_coverage import STATUS_COVERED, coverage_ready, record_attempts
+from turkish_dates import parse_turkish_datetime
+
+try:
+    import lxml # Optional: pip install lxml (several times faster than html.parser)
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+# --- Setup Logging ---
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler("re_extract_comments.log"),
+        logging.StreamHandler()
+    ]
+)
+
+# --- Configuration ---
+load_dotenv()
+DATABASE_URL = os.getenv('DATABASE_URL')
+SNAPSHOT_DIR = os.getenv('WAYBACK_SNAPSHOT_DIR', 'wayback_snapshots')
+ID_FILE = 'missing_comment_post_ids.txt'
+MANIFEST_FILE = 're_extract_manifest.jsonl'
+INSERT_BATCH_SIZE = 5000 # Comment rows (or posts) per COPY/commit
+
+COMMENT_COLUMNS = ['post_id', 'author', 'comment_date', 'comment_time', 'commented_at', 'comment_number', 'content']
+SNAPSHOT_NAME_RE = re.compile(r'^(\d+)(?:[-_.][^/]*)?\.html?(?:\.gz)?$')
+COMMENT_ID_RE = re.compile(r'^(?:comment|div-comment|li-comment)-(\d+)$')
+
+# WordPress-style comment markup; the first selector that matches wins
+AUTHOR_SELECTORS = ['.comment-author .fn', '.comment-author cite', 'cite.fn', '.fn', '.comment-author', 'cite']
+META_SELECTORS = ['.comment-meta', '.commentmetadata', '.comment-date', 'small']
+NUMBER_SELECTORS = ['.comment-number', '.commentnumber', '.comment-count']
+NON_CONTENT_SELECTORS = AUTHOR_SELECTORS + META_SELECTORS + NUMBER_SELECTORS + ['.reply', '.comment-reply-link', '.avatar']
+_TIME_SPLIT_RE = re.compile(r'\s*(?:at|@|-|,|saat)?\s*(\d{1,2}[:.]\d{2}(?:[:.]\d{2})?\s*(?:am|pm|ÖÖ|ÖS)?)\s*$', re.IGNORECASE)
+
+# --- Snapshots ---
+def index_snapshots(snapshot_dir):
+    """{post id: [paths]} for every snapshot file under snapshot_dir."""
+    snapshots = {}
+    for root, _, files in os.walk(snapshot_dir):
+        folder_id = os.path.basename(root)
+        for name in files:
+            match = SNAPSHOT_NAME_RE.match(name)
+            if match:
+                post_id = int(match.group(1))
+            elif folder_id.isdigit() and re.search(r'\.html?(?:\.gz)?$', name):
+                post_id = int(folder_id)
+            else:
+                continue
+            snapshots.setdefault(post_id, []).append(os.path.join(root, name))
+    return snapshots
+
+def read_snapshot(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    if path.endswith('.gz'): data = gzip.decompress(data)
+    return data
+
+# --- Parsing (worker side) ---
+def _clean_text(text):
+    lines = (' '.join(line.split()) for line in text.splitlines())
+    return unicodedata.normalize('NFC', '\n'.join(line for line in lines if line)).strip()
+
+def _is_comment(element):
+    return element.name in ('li', 'div', 'article') and bool(COMMENT_ID_RE.match(element.get('id') or ''))
+
+def _comment_key(element):
+    return COMMENT_ID_RE.match(element['id']).group(1)
+
+def _own_elements(container, elements):
+    """Elements whose nearest comment container is this comment (not a nested reply)."""
+    key = _comment_key(container)
+    return [element for element in elements if _comment_key(element.find_parent(_is_comment)) == key]
+
+def split_date_time(meta_text):
+    """'12 Mart 2008 at 14:32' -> ('12 Mart 2008', '14:32'); a date without time keeps None."""
+    if not meta_text: return None, None
+    match = _TIME_SPLIT_RE.search(meta_text)
+    if not match or match.start() == 0: return meta_text, None
+    return meta_text[:match.start()].strip(' ,-'), match.group(1)
+
+def content_html(blocks):
+    """Stored form of a comment body: the HTML that goes inside the thread template's <p>.
+
+    The snapshot is third-party HTML and the templates print content unescaped, so only
+    text is kept: every line is escaped, lines are joined with <br> and paragraphs with
+    </p><p>.
+    """
+    paragraphs = []
+    for block in blocks:
+        lines = _clean_text(block).split('\n')
+        if lines != ['']: paragraphs.append('<br>'.join(html.escape(line, quote=False) for line in lines))
+    return '</p><p>'.join(paragraphs)
+
+def _block_text(element):
+    """Text of an element with its <br>s kept as line breaks."""
+    for br in element.find_all('br'):
+        br.replace_with('\n')
+    return element.get_text()
+
+def parse_comments(page, post_id):
+    """Comment rows (tuples in COMMENT_COLUMNS order) found in one page."""
+    soup = BeautifulSoup(page, HTML_PARSER)
+    containers = soup.find_all(_is_comment)
+    # A 'div-comment-N' body inside 'li-comment-N' is the same comment
+    seen = set()
+    rows = []
+    for container in containers:
+        comment_key = _comment_key(container)
+        if comment_key in seen: continue
+        seen.add(comment_key)
+
+        # Selectors only look at this comment's own nodes, not at nested replies
+        def own_text(selectors):
+            for selector in selectors:
+                for found in _own_elements(container, container.select(selector)):
+                    text = _clean_text(found.get_text(' '))
+                    if text: return text
+            return None
+        author = own_text(AUTHOR_SELECTORS) or 'Anonim'
+        comment_date, comment_time = split_date_time(own_text(META_SELECTORS))
+        comment_number = own_text(NUMBER_SELECTORS) or str(len(rows) + 1)
+
+        skip = set()
+        for selector in NON_CONTENT_SELECTORS:
+            skip.update(id(found) for found in container.select(selector))
+        body = container.select_one('.comment-content') or container.select_one('.comment-body') or container
+        paragraphs = [p for p in _own_elements(container, body.find_all(['p', 'blockquote']))
+                      if not any(id(parent) in skip for parent in [p, *p.parents])]
+        if paragraphs:
+            content = content_html(_block_text(p) for p in paragraphs)
+        else:
+            content = content_html([_block_text(body)]) if body is not container else ''
+        if not content: continue
+
+        commented_at = parse_turkish_datetime(comment_date, comment_time)
+        rows.append((post_id, author, comment_date, comment_time, commented_at, comment_number, content))
+    return rows
+
+def parse_post(post_id, paths):
+    """Worker: parses every snapshot of one post; returns its manifest entry and rows."""
+    start = time.perf_counter()
+    result = {'post_id': post_id, 'status': 'no_snapshot', 'comments': 0, 'snapshot': None,
+              'error': None, 'bytes': 0, 'rows': []}
+    errors = []
+    for path in paths:
+        try:
+            page = read_snapshot(path)
+            result['bytes'] += len(page)
+            rows = parse_comments(page, post_id)
+        except Exception as e: # A broken snapshot must not stop the others
+            errors.append(f"{os.path.basename(path)}: {e}")
+            continue
+        if len(rows) > len(result['rows']) or result['snapshot'] is None:
+            result['rows'] = rows
+            result['snapshot'] = path
+    if result['rows']:
+        result['status'] = 'ok'
+    elif result['snapshot']:
+        result['status'] = 'no_comments'
+    elif errors:
+        result['status'] = 'error'
+    result['comments'] = len(result['rows'])
+    result['error'] = '; '.join(errors) or None
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+def _parse_post_star(args):
+    return parse_post(*args)
+
+# --- Main process ---
+def read_missing_ids(filename):
+    with open(filename, 'r', encoding='utf-8') as f:
+        return [int(line) for line in (line.strip() for line in f) if line.isdigit()]
+
+def still_missing(conn, post_ids):
+    """The ids (in order) that exist in posts and still have no comments."""
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT p.id FROM posts p
+            WHERE p.id = ANY(%s) AND NOT EXISTS (SELECT 1 FROM comments c WHERE c.post_id = p.id)
+        """, (post_ids,))
+        missing = {row[0] for row in cursor.fetchall()}
+    conn.rollback()
+    return [post_id for post_id in post_ids if post_id in missing]
+
+def insert_batch(conn, rows, entries, track_coverage):
+    """COPYs the rows, refreshes the posts' activity columns, records the attempts and commits."""
+    with conn.cursor() as cursor:
+        if rows:
+            copy_rows(cursor, 'comments', COMMENT_COLUMNS, rows)
+            refresh_post_activity(cursor, [entry['post_id'] for entry in entries if entry['comments']])
+        if track_coverage:
+            record_attempts(cursor, [(entry['post_id'], STATUS_COVERED if entry['status'] == 'ok' else entry['status'],
+                                      entry['error']) for entry in entries])
+    conn.commit()
+
+def run(conn, post_ids, snapshots, workers, manifest_path, dry_run=False):
+    stats = {'posts': len(post_ids), 'ok': 0, 'no_comments': 0, 'no_snapshot': 0, 'error': 0,
+             'comments': 0, 'bytes': 0, 'parse_seconds': 0.0, 'insert_seconds': 0.0}
+    pending_rows = []
+    pending_entries = []
+    start = time.time()
+    # Attempts and failures go to post_coverage when post_coverage.py has created it
+    track_coverage = not dry_run and coverage_ready(conn)
+
+    def flush(manifest):
+        if (pending_rows or track_coverage) and pending_entries and not dry_run:
+            insert_start = time.perf_counter()
+            insert_batch(conn, pending_rows, pending_entries, track_coverage)
+            stats['insert_seconds'] += time.perf_counter() - insert_start
+        # Manifest lines are written only once their rows are committed
+        for entry in pending_entries:
+            manifest.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        manifest.flush()
+        pending_rows.clear()
+        pending_entries.clear()
+
+    tasks = [(post_id, snapshots.get(post_id, [])) for post_id in post_ids]
+    with open(manifest_path, 'a', encoding='utf-8') as manifest, \
+         ProcessPoolExecutor(max_workers=workers) as pool:
+        for done, result in enumerate(pool.map(_parse_post_star, tasks, chunksize=16), 1):
+            rows = result.pop('rows')
+            stats[result['status']] += 1
+            stats['comments'] += len(rows)
+            stats['bytes'] += result['bytes']
+            stats['parse_seconds'] += result.pop('seconds')
+            if result['status'] == 'error': logging.warning(f"Post {result['post_id']}: {result['error']}")
+            pending_rows.extend(rows)
+            pending_entries.append(result)
+            if len(pending_rows) >= INSERT_BATCH_SIZE or len(pending_entries) >= INSERT_BATCH_SIZE: flush(manifest)
+            if done % 1000 == 0:
+                elapsed = time.time() - start
+                logging.info(f"{done}/{len(tasks)} posts, {stats['comments']} comments "
+                             f"({done / elapsed:.0f} posts/s, {stats['bytes'] / (1024 * 1024) / elapsed:.1f} MB/s)")
+        flush(manifest)
+    stats['seconds'] = time.time() - start
+    return stats
+
+def print_stats(stats, dry_run):
+    elapsed = max(stats['seconds'], 1e-9)
+    print("\n" + "=" * 60)
+    print(f"Posts: {stats['posts']} (ok {stats['ok']}, no comments {stats['no_comments']}, "
+          f"no snapshot {stats['no_snapshot']}, errors {stats['error']})")
+    print(f"Comments {'found (dry run, nothing inserted)' if dry_run else 'inserted'}: {stats['comments']}")
+    print(f"Parsed {stats['bytes'] / (1024 * 1024):.1f} MB of HTML with '{HTML_PARSER}' in {elapsed:.1f}s: "
+          f"{stats['posts'] / elapsed:.0f} posts/s, {stats['comments'] / elapsed:.0f} comments/s, "
+          f"{stats['bytes'] / (1024 * 1024) / elapsed:.2f} MB/s")
+    print(f"Worker parse time {stats['parse_seconds']:.1f}s (summed), COPY + commit {stats['insert_seconds']:.1f}s")
+    print("=" * 60)
+
+# --- Main Execution ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-extract missing comments from saved Wayback HTML snapshots.")
+    parser.add_argument('--snapshots', default=SNAPSHOT_DIR, help="Directory of saved snapshots")
+    parser.add_argument('--ids', default=ID_FILE, help="File with one post id per line")
+    parser.add_argument('--manifest', default=MANIFEST_FILE, help="Per-id results (JSONL, appended)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4)
+    parser.add_argument('--limit', type=int, help="Only the first N ids")
+    parser.add_argument('--dry-run', action='store_true', help="Parse and report, insert nothing")
+    args = parser.parse_args()
+
+    if not DATABASE_URL:
+        print("Error: DATABASE_URL environment variable not set.")
+        sys.exit(1)
+    if not os.path.isdir(args.snapshots):
+        print(f"Error: snapshot directory '{args.snapshots}' not found.")
+        sys.exit(1)
+
+    post_ids = read_missing_ids(args.ids)
+    if args.limit: post_ids = post_ids[:args.limit]
+    snapshots = index_snapshots(args.snapshots)
+    logging.info(f"{len(post_ids)} ids in '{args.ids}', snapshots found for {len(snapshots)} posts "
+                 f"in '{args.snapshots}' (parser: {HTML_PARSER}).")
+
+    conn = None
+    stats = None
+    interrupted = False
+    try:
+        conn = psycopg2.connect(DATABASE_URL)
+        post_ids = still_missing(conn, post_ids)
+        logging.info(f"{len(post_ids)} of them still have no comments.")
+        stats = run(conn, post_ids, snapshots, args.workers, args.manifest, dry_run=args.dry_run)
+    except KeyboardInterrupt:
+        interrupted = True
+        logging.warning("Interrupted; committed batches are kept. Re-run to continue with the remaining ids.")
+    except psycopg2.Error as e:
+        logging.error(f"Database error: {e}")
+        if conn: conn.rollback()
+    finally:
+        if conn: conn.close()
+
+    if stats: print_stats(stats, args.dry_run)
+    if not args.dry_run and (interrupted or (stats and stats['comments'])):
+        bump_archive_version("re_extract_comments")
+        print("Rebuild derived tables with rebuild_user_threads.py / rebuild_thread_leaderboard.py "
+              "and the user stats (convert_chars.rebuild_user_stats).")
@@ -0,0 +1,78 @@
+# rebuild_thread_leaderboard.py
+# Rebuilds the 'thread_leaderboard' table (most discussed threads) from 'comments'.
+# The homepage reads this table instead of aggregating every comment on each request,
+# so re-run this script whenever comments are added, removed or re-assigned.
+import os
+import sys
+import time
+import psycopg2
+from dotenv import load_dotenv
+
+from archive_version import bump_archive_version
+
+# --- Configuration ---
+load_dotenv()
+DATABASE_URL = os.getenv('DATABASE_URL')
+
+# How many threads to keep. The homepage shows 25; keep some headroom.
+LEADERBOARD_SIZE = 100
+
+# --- Functions ---
+def rebuild_thread_leaderboard(conn, size=LEADERBOARD_SIZE):
+    """Builds the leaderboard into a staging table and swaps it in within one transaction."""
+    print(f"\n--- Rebuilding 'thread_leaderboard' table (top {size} threads) ---")
+    cursor = None
+    try:
+        cursor = conn.cursor()
+        print("Aggregating comment counts per post into staging table...")
+        cursor.execute("DROP TABLE IF EXISTS thread_leaderboard_new;")
+        cursor.execute('''
+            CREATE TABLE thread_leaderboard_new AS
+            SELECT (row_number() OVER (ORDER BY count(*) DESC, post_id))::integer AS rank,
+                   post_id,
+                   count(*)::integer AS comment_count
+            FROM comments
+            GROUP BY post_id
+            ORDER BY rank
+            LIMIT %s;
+        ''', (size,))
+        row_count = cursor.rowcount
+        cursor.execute("ALTER TABLE thread_leaderboard_new ADD PRIMARY KEY (rank);")
+
+        # Swap tables; readers see either the old or the new leaderboard, never an empty one.
+        print("Swapping in new leaderboard...")
+        cursor.execute("DROP TABLE IF EXISTS thread_leaderboard;")
+        cursor.execute("ALTER TABLE thread_leaderboard_new RENAME TO thread_leaderboard;")
+        cursor.execute("ALTER INDEX thread_leaderboard_new_pkey RENAME TO thread_leaderboard_pkey;")
+        conn.commit()
+        bump_archive_version("rebuild_thread_leaderboard")
+        print(f"Successfully rebuilt 'thread_leaderboard' with {row_count} rows.")
+        return True
+    except psycopg2.Error as e:
+        print(f"!!! Database error while rebuilding thread_leaderboard: {e}")
+        conn.rollback()
+        return False
+    finally:
+        if cursor: cursor.close()
+
+# --- Main Execution ---
+if __name__ == "__main__":
+    start_run_time = time.time()
+    if not DATABASE_URL:
+        print("Error: DATABASE_URL environment variable not set.")
+        sys.exit(1)
+
+    conn = None
+    try:
+        print("Connecting to database...")
+        conn = psycopg2.connect(DATABASE_URL)
+        print("Database connection successful.")
+        if not rebuild_thread_leaderboard(conn):
+            sys.exit(1)
+    except psycopg2.OperationalError as e:
+        print(f"!!! Database Connection Error: {e}")
+        sys.exit(1)
+    finally:
+        if conn: conn.close(); print("\nDatabase connection closed.")
+
+    print(f"\nScript finished in {time.time() - start_run_time:.2f} seconds.")
@@ -0,0 +1,72 @@
+# rebuild_user_threads.py
+# Rebuilds the 'user_threads' table (threads each user commented in, with counts)
+# from 'comments'. The profile page reads it when USE_USER_THREADS_TABLE is enabled,
+# so re-run this script whenever comments or their authors change.
+import os
+import sys
+import time
+import psycopg2
+from dotenv import load_dotenv
+
+from archive_version import bump_archive_version
+
+# --- Configuration ---
+load_dotenv()
+DATABASE_URL = os.getenv('DATABASE_URL')
+
+# --- Functions ---
+def rebuild_user_threads(conn):
+    """Builds the table into a staging table and swaps it in within one transaction."""
+    print("\n--- Rebuilding 'user_threads' table ---")
+    cursor = None
+    try:
+        cursor = conn.cursor()
+        print("Aggregating comments per (author, post) into staging table...")
+        cursor.execute("DROP TABLE IF EXISTS user_threads_new;")
+        cursor.execute('''
+            CREATE TABLE user_threads_new AS
+            SELECT author AS username, post_id, count(*)::integer AS comment_count
+            FROM comments
+            GROUP BY author, post_id;
+        ''')
+        row_count = cursor.rowcount
+        print(f"Aggregated {row_count} rows, adding primary key (username, post_id)...")
+        cursor.execute("ALTER TABLE user_threads_new ADD PRIMARY KEY (username, post_id);")
+
+        # Swap tables; profile pages see either the old or the new data, never an empty table.
+        print("Swapping in new table...")
+        cursor.execute("DROP TABLE IF EXISTS user_threads;")
+        cursor.execute("ALTER TABLE user_threads_new RENAME TO user_threads;")
+        cursor.execute("ALTER INDEX user_threads_new_pkey RENAME TO user_threads_pkey;")
+        conn.commit()
+        bump_archive_version("rebuild_user_threads")
+        print(f"Successfully rebuilt 'user_threads' with {row_count} rows.")
+        return True
+    except psycopg2.Error as e:
+        print(f"!!! Database error while rebuilding user_threads: {e}")
+        conn.rollback()
+        return False
+    finally:
+        if cursor: cursor.close()
+
+# --- Main Execution ---
+if __name__ == "__main__":
+    start_run_time = time.time()
+    if not DATABASE_URL:
+        print("Error: DATABASE_URL environment variable not set.")
+        sys.exit(1)
+
+    conn = None
+    try:
+        print("Connecting to database...")
+        conn = psycopg2.connect(DATABASE_URL)
+        print("Database connection successful.")
+        if not rebuild_user_threads(conn):
+            sys.exit(1)
+    except psycopg2.OperationalError as e:
+        print(f"!!! Database Connection Error: {e}")
+        sys.exit(1)
+    finally:
+        if conn: conn.close(); print("\nDatabase connection closed.")
+
+    print(f"\nScript finished in {time.time() - start_run_time:.2f} seconds.")
@@ -4,10 +4,22 @@ import sys
 import psycopg2
 from dotenv import load_dotenv
 
+from archive_version import bump_archive_version
+from change_journal import ChangeJournal
+from garble_flags import FLAG_REPLACEMENT_CHAR, candidate_where
+from repair_jobs import RepairJob
+
 # --- Configuration ---
 load_dotenv()
 DATABASE_URL = os.getenv('DATABASE_URL')
 TARGET_CHAR = '�' # The Unicode Replacement Character U+FFFD
+BATCH_SIZE = 5000 # Rows per committed, checkpointed batch
+
+# --- Functions ---
+def remove_target_char(rows):
+    """Batch fix for RepairJob: (id, content) rows -> changed (id, content) rows."""
+    return [(row_id, content.replace(TARGET_CHAR, '')) for row_id, content in rows
+            if content and TARGET_CHAR in content]
 
 # --- Main Execution ---
 if __name__ == "__main__":
@@ -24,32 +36,38 @@ if __name__ == "__main__":
         print("Confirmation incorrect. Operation cancelled.")
         sys.exit()
 
+    # The pass resumes from its checkpoint (repair_jobs.py); --restart starts it over
+    restart = '--restart' in sys.argv[1:]
+
     conn = None
-    cursor = None
+    result = None
     try:
         print(f"\nConnecting to database...")
         if not DATABASE_URL:
             raise ValueError("DATABASE_URL environment variable not set.")
 
         conn = psycopg2.connect(DATABASE_URL)
-        cursor = conn.cursor()
         print("Database connection successful.")
 
-        # --- Perform the UPDATE ---
-        sql_update = f"UPDATE comments SET content = REPLACE(content, %s, '') WHERE content LIKE %s;"
-        like_pattern = f'%{TARGET_CHAR}%'
-
-        print(f"Executing UPDATE to remove '{TARGET_CHAR}' from comments.content...")
-        # Pass TARGET_CHAR and the like pattern as parameters to avoid SQL injection issues
-        cursor.execute(sql_update, (TARGET_CHAR, like_pattern))
-        row_count = cursor.rowcount # Get the number of rows affected
-        conn.commit() # Commit the changes
+        # --- Perform the UPDATE in resumable batches ---
+        print(f"Removing '{TARGET_CHAR}' from comments.content in batches of {BATCH_SIZE}...")
+        # Candidates come from the garble_flags dirty set once classify_garble.py has run
+        where_sql, params = candidate_where(conn, 'comments', FLAG_REPLACEMENT_CHAR,
+                                            "content LIKE %s", [f'%{TARGET_CHAR}%'])
+        job = RepairJob(conn, "remove_question:comments.content", 'comments', 'id', ['content'],
+                        where_sql, params, batch_size=BATCH_SIZE)
+        # Removed characters are journaled, so 'change_journal.py undo' can put them back
+        with ChangeJournal.for_run(job.job_name, 'comments', 'id', ['content']) as journal:
+            result = job.run(remove_target_char, restart=restart, journal=journal)
+        print(journal.report())
 
-        print(f"\n--- UPDATE complete. ---")
-        print(f"--- Removed '{TARGET_CHAR}' from {row_count} rows in comments.content. ---")
+        print(f"\n--- UPDATE {result['status']}. ---")
+        print(f"--- Removed '{TARGET_CHAR}' from {result['updated']} rows in comments.content (this run). ---")
 
     except ValueError as e:
         print(f"!!! Configuration Error: {e}")
+    except KeyboardInterrupt:
+        print("\nStopped. Committed batches are kept; re-run the script to resume.")
     except psycopg2.Error as e: # Catch specific psycopg2 errors
         print(f"!!! Database Error occurred: {e}")
         if conn:
@@ -60,8 +78,9 @@ if __name__ == "__main__":
         if conn:
             conn.rollback()
     finally:
-        if cursor:
-            cursor.close()
+        # An interrupted run (no result) may have committed batches too
+        if conn and (result is None or result['updated']):
+            bump_archive_version("remove_question: comments.content")
         if conn:
             conn.close()
-            print("\nDatabase connection closed.")
\ No newline at end of file
+            print("\nDatabase connection closed.")
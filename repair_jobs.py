@@ -0,0 +1,209 @@
+# repair_jobs.py
+# Resumable, checkpointed repair passes for the encoding-fix scripts.
+#
+# A RepairJob walks one table in primary-key order (keyset batches, nothing is fetched
+# up front), hands each batch to a fix function, writes the changed rows with
+# BulkUpdater and records the batch in repair_checkpoints / repair_checkpoint_batches
+# IN THE SAME TRANSACTION. A batch is therefore either fully applied and checkpointed
+# or not at all: after a crash, a dropped connection or Ctrl-C, running the script
+# again continues after the last committed primary key.
+#
+# With a ChangeJournal (change_journal.py) each batch's edits are journaled and flushed
+# before the commit, so every committed change can be reverted with 'change_journal.py undo'.
+#
+# Fix functions must be idempotent (fixing already fixed text returns it unchanged),
+# which holds for the replacement maps used here, so re-running a batch is harmless.
+import time
+
+import psycopg2
+
+from bulk_writer import BulkUpdater
+
+CHECKPOINT_DDL = """
+    CREATE TABLE IF NOT EXISTS repair_checkpoints (
+        job_name      text PRIMARY KEY,
+        last_pk       bigint,
+        status        text NOT NULL DEFAULT 'running', -- running, interrupted, failed, done
+        rows_checked  bigint NOT NULL DEFAULT 0,
+        rows_updated  bigint NOT NULL DEFAULT 0,
+        batches       integer NOT NULL DEFAULT 0,
+        started_at    timestamptz NOT NULL DEFAULT now(),
+        updated_at    timestamptz NOT NULL DEFAULT now(),
+        finished_at   timestamptz
+    );
+    CREATE TABLE IF NOT EXISTS repair_checkpoint_batches (
+        job_name      text NOT NULL REFERENCES repair_checkpoints (job_name) ON DELETE CASCADE,
+        batch_no      integer NOT NULL,
+        first_pk      bigint NOT NULL,
+        last_pk       bigint NOT NULL,
+        rows_checked  integer NOT NULL,
+        rows_updated  integer NOT NULL,
+        seconds       double precision NOT NULL,
+        committed_at  timestamptz NOT NULL DEFAULT now(),
+        PRIMARY KEY (job_name, batch_no)
+    );
+"""
+
+def ensure_checkpoint_tables(conn):
+    with conn.cursor() as cursor:
+        cursor.execute(CHECKPOINT_DDL)
+    conn.commit()
+
+class RepairJob:
+    """One resumable pass over table_name, identified by job_name in the checkpoint table.
+
+    where_sql/where_params select candidate rows; id_range=(low, high) limits the pass to
+    low <= pk < high; such a job, once done, resumes when rows are added to its range
+    after its last id. Batches are read on read_conn (default: conn) and written on conn.
+    """
+
+    def __init__(self, conn, job_name, table_name, pk_column, columns, where_sql='TRUE', where_params=(),
+                 batch_size=1000, id_range=None, read_conn=None):
+        self.conn = conn
+        self.read_conn = read_conn or conn
+        self.job_name = job_name
+        self.table_name = table_name
+        self.pk_column = pk_column
+        self.columns = list(columns)
+        self.where_sql = where_sql
+        self.where_params = list(where_params)
+        self.batch_size = batch_size
+        self.id_range = id_range
+
+    def _start(self, restart):
+        """Creates or resets the checkpoint row; returns it as a dict."""
+        with self.conn.cursor() as cursor:
+            if restart:
+                cursor.execute("DELETE FROM repair_checkpoints WHERE job_name = %s", (self.job_name,))
+            cursor.execute("""
+                INSERT INTO repair_checkpoints (job_name) VALUES (%s)
+                ON CONFLICT (job_name) DO NOTHING
+            """, (self.job_name,))
+            cursor.execute("""
+                SELECT last_pk, status, rows_checked, rows_updated, batches
+                FROM repair_checkpoints WHERE job_name = %s
+            """, (self.job_name,))
+            last_pk, status, rows_checked, rows_updated, batches = cursor.fetchone()
+        self.conn.commit()
+        return {'last_pk': last_pk, 'status': status, 'rows_checked': rows_checked,
+                'rows_updated': rows_updated, 'batches': batches}
+
+    def _set_status(self, status):
+        with self.conn.cursor() as cursor:
+            cursor.execute("""
+                UPDATE repair_checkpoints
+                SET status = %s, updated_at = now(),
+                    finished_at = CASE WHEN %s = 'done' THEN now() END
+                WHERE job_name = %s
+            """, (status, status, self.job_name))
+        self.conn.commit()
+
+    def _fetch_batch(self, last_pk):
+        conditions = [f"({self.where_sql})"]
+        params = list(self.where_params)
+        if last_pk is not None:
+            conditions.append(f"{self.pk_column} > %s")
+            params.append(last_pk)
+        elif self.id_range:
+            conditions.append(f"{self.pk_column} >= %s")
+            params.append(self.id_range[0])
+        if self.id_range:
+            conditions.append(f"{self.pk_column} < %s")
+            params.append(self.id_range[1])
+        params.append(self.batch_size)
+        with self.read_conn.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT {self.pk_column}, {', '.join(self.columns)} FROM {self.table_name}
+                WHERE {' AND '.join(conditions)}
+                ORDER BY {self.pk_column} LIMIT %s
+            """, params)
+            rows = cursor.fetchall()
+        # Don't hold a snapshot open on a separate read connection between batches
+        if self.read_conn is not self.conn: self.read_conn.rollback()
+        return rows
+
+    def _record_batch(self, batch_no, rows, updated, seconds):
+        """Checkpoint writes; part of the batch's transaction, committed by the caller."""
+        with self.conn.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO repair_checkpoint_batches
+                    (job_name, batch_no, first_pk, last_pk, rows_checked, rows_updated, seconds)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """, (self.job_name, batch_no, rows[0][0], rows[-1][0], len(rows), updated, seconds))
+            cursor.execute("""
+                UPDATE repair_checkpoints
+                SET last_pk = %s, status = 'running', batches = %s, updated_at = now(),
+                    rows_checked = rows_checked + %s, rows_updated = rows_updated + %s
+                WHERE job_name = %s
+            """, (rows[-1][0], batch_no, len(rows), updated, self.job_name))
+
+    def run(self, fix_batch, restart=False, on_batch_committed=None, verbose=True, journal=None):
+        """Runs (or resumes) the pass.
+
+        fix_batch(rows) gets [(pk, col1, ...)] and returns the changed rows in the same
+        shape; on_batch_committed(rows, updates) is called after each commit. journal
+        (a ChangeJournal for this table and these columns) records every batch's changes.
+        Returns this run's {'status', 'checked', 'updated', 'batches', 'last_pk', 'error'}.
+        Ctrl-C is recorded as 'interrupted' and re-raised.
+        """
+        ensure_checkpoint_tables(self.conn)
+        checkpoint = self._start(restart)
+        result = {'status': checkpoint['status'], 'checked': 0, 'updated': 0, 'batches': 0,
+                  'last_pk': checkpoint['last_pk'], 'error': None}
+        if checkpoint['status'] == 'done':
+            # A finished id-range job is reopened when rows were added to its range after
+            # its last id (the top bucket of a table that has grown since)
+            if not self.id_range or not self._fetch_batch(checkpoint['last_pk']):
+                if verbose: print(f"Job '{self.job_name}' already completed (last id {checkpoint['last_pk']}); use --restart to run it again.")
+                return result
+            if verbose: print(f"Job '{self.job_name}' was completed, but its range has new rows after id {checkpoint['last_pk']}.")
+        if checkpoint['last_pk'] is not None and verbose:
+            print(f"Resuming job '{self.job_name}' after id {checkpoint['last_pk']} "
+                  f"({checkpoint['rows_checked']} rows checked, {checkpoint['rows_updated']} updated so far).")
+
+        writer = BulkUpdater(self.conn, self.table_name, self.pk_column, self.columns)
+        batch_no = checkpoint['batches']
+        last_pk = checkpoint['last_pk']
+        try:
+            while True:
+                start = time.perf_counter()
+                rows = self._fetch_batch(last_pk)
+                if not rows: break
+                updates = fix_batch(rows)
+                updated = writer.apply(updates) if updates else 0
+                if journal is not None: journal.record_batch(rows, updates)
+                batch_no += 1
+                self._record_batch(batch_no, rows, updated, time.perf_counter() - start)
+                self.conn.commit()
+
+                last_pk = rows[-1][0]
+                result['checked'] += len(rows)
+                result['updated'] += updated
+                result['batches'] += 1
+                result['last_pk'] = last_pk
+                if verbose:
+                    print(f"Batch {batch_no}: ids {rows[0][0]}..{last_pk}, {len(rows)} checked, {updated} updated "
+                          f"(this run: {result['checked']} checked, {result['updated']} updated)")
+                if on_batch_committed: on_batch_committed(rows, updates)
+            self._set_status('done')
+            result['status'] = 'done'
+            if verbose and writer.rows_written: print(writer.report())
+        except KeyboardInterrupt:
+            result['status'] = 'interrupted'
+            self._abort('interrupted', f"Interrupted; job '{self.job_name}' will resume after id {last_pk}.")
+            raise
+        except psycopg2.Error as e:
+            result['status'] = 'failed'
+            result['error'] = str(e).strip()
+            self._abort('failed', f"!!! Database error in job '{self.job_name}' (resumes after id {last_pk}): {result['error']}")
+        return result
+
+    def _abort(self, status, message):
+        """Rolls back the in-flight batch and records the status if the connection still works."""
+        print(message)
+        try:
+            self.conn.rollback()
+            if self.read_conn is not self.conn: self.read_conn.rollback()
+            self._set_status(status)
+        except psycopg2.Error:
+            pass # Connection is gone; the checkpoint still holds the last committed batch
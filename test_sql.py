@@ -5,6 +5,8 @@ import psycopg2 # <-- Added missing import
 from dotenv import load_dotenv
 import re
 
+from mojibake_repair import get_engine
+
 # --- Configuration ---
 load_dotenv()
 DATABASE_URL = os.getenv('DATABASE_URL') # <-- Moved assignment outside try block
@@ -115,15 +117,12 @@ REPLACEMENT_MAP_V7 = {
 
 # --- Functions ---
 def apply_fixes_py_v7(text, replacement_map):
-    """Applies replacements using the character/short-sequence map (V7)."""
+    """Applies replacements using the character/short-sequence map (V7).
+
+    Single pass, longest key wins at each position; the engine is compiled once per map.
+    """
     if text is None: return None
-    fixed_text = text
-    # Apply longer sequences first
-    sorted_keys = sorted(replacement_map.keys(), key=len, reverse=True)
-    for find in sorted_keys:
-        replace = replacement_map[find]
-        fixed_text = fixed_text.replace(find, replace)
-    return fixed_text
+    return get_engine(replacement_map).apply(text)
 
 
 # --- Main Execution Block (Use V7 Map and Function) ---
@@ -1,8 +1,11 @@
-import re
 import os
 import sys
 import time
 
+from change_journal import text_diff
+from garbled_dump import DumpWriter, iter_batches, iter_records
+from mojibake_repair import get_word_engine
+
 # --- Corrected High-Confidence Word Replacement Map (V3) ---
 # Keys use ACTUAL GARBLED characters. Values are correct lowercase Turkish.
 WORD_REPLACEMENT_MAP = {
@@ -72,44 +75,19 @@ WORD_REPLACEMENT_MAP = {
 }
 
 # --- Input/Output Files ---
-INPUT_FILE = 'comments_with_garbled_A_char.txt' # From extraction script
-OUTPUT_FILE = 'comments_only_word_fixed_v3.txt' # New output file name
+INPUT_FILE = 'garbled_rows.jsonl' # From extraction script (garbled_dump.py format)
+# Same format, changed comments only: {"id", "changes": {column: [[position, removed, inserted], ...]}}
+# against the input dump's text (change_journal.apply_diff rebuilds the fixed value)
+OUTPUT_FILE = 'comments_only_word_fixed_v3.jsonl'
+BATCH_SIZE = 2000 # Comments fixed per apply_many() call; bounds memory for any dump size
+SAMPLE_SIZE = 20
 
 # --- Functions ---
 
 def build_regex_and_replace_func(word_map):
-    """Builds a single regex for all keys and a case-preserving replace function."""
-    # *** Use \b word boundaries ***
-    pattern = r'\b(' + '|'.join(re.escape(key) for key in word_map.keys()) + r')\b'
-    # Compile with IGNORECASE
-    regex = re.compile(pattern, re.IGNORECASE | re.UNICODE)
-
-    def replace_func(match):
-        """Looks up the replacement and preserves original case."""
-        matched_word = match.group(1) # Group 1 contains the actual matched word
-
-        # --- Case-insensitive lookup ---
-        found_key = None
-        for key in word_map.keys():
-            if matched_word.lower() == key.lower(): # Compare lowercase versions
-                found_key = key
-                break
-
-        if found_key is None:
-            print(f"Warning: No map key found for matched word '{matched_word}'")
-            return matched_word
-
-        replacement = word_map[found_key]
-
-        # Preserve case based on the *original matched word*
-        if matched_word.istitle():
-            return replacement.title()
-        elif matched_word.isupper():
-            return replacement.upper()
-        else:
-             return replacement
-
-    return regex, replace_func
+    """Returns the trie regex and case-preserving replace function of the shared word engine."""
+    engine = get_word_engine(word_map)
+    return engine.regex, engine.replace_match
 
 def apply_word_fixes_optimized(text, regex, replace_func):
     """Applies replacements using pre-compiled regex and replace function."""
@@ -120,8 +98,18 @@ def apply_word_fixes_optimized(text, regex, replace_func):
         print(f"Warning: Regex substitution failed for text chunk: '{text[:50]}...'. Error: {e}")
         return text
 
+def read_comments(filename):
+    """Yields comment entries from a JSONL dump, or from the old text format (parsed up front)."""
+    if not os.path.exists(filename):
+        print(f"Error: Input file '{filename}' not found.")
+        sys.exit(1)
+    if filename.endswith('.jsonl'):
+        print(f"Streaming comments from '{filename}'...")
+        return iter_records(filename, kind='comment')
+    return iter(parse_input_file(filename))
+
 def parse_input_file(filename):
-    """Parses the input file into a list of dictionaries."""
+    """Parses the old 'Comment ID:/Author:/Content:/---' text format into a list of dictionaries."""
     # (Using the same robust parsing function as last time)
     data = []
     current_entry = None
@@ -189,76 +177,48 @@ def parse_input_file(filename):
 if __name__ == "__main__":
     start_run_time = time.time()
 
-    # Pre-compile regex and replacement function for efficiency
-    word_regex, word_replace_func = build_regex_and_replace_func(WORD_REPLACEMENT_MAP)
-
-    # Parse only comments from the input file
-    parsed_comments = parse_input_file(INPUT_FILE)
-
-    if not parsed_comments:
-        print("No comment data parsed from the input file. Exiting.")
-        sys.exit(0)
+    # Pre-compile the word repair engine (trie regex + folded lookup) once
+    word_engine = get_word_engine(WORD_REPLACEMENT_MAP)
 
-    print(f"\nApplying word-level fixes (V3 Map) to {len(parsed_comments)} comments...")
-    processed_comments = []
+    print(f"\nApplying word-level fixes (V3 Map) in batches of {BATCH_SIZE}, writing to '{OUTPUT_FILE}'...")
+    comment_count = 0
     fix_count = 0
-
-    for comment in parsed_comments:
-        processed_entry = comment.copy()
-        made_change = False
-
-        original_author = comment.get('author')
-        original_content = comment.get('content')
-
-        fixed_author = apply_word_fixes_optimized(original_author, word_regex, word_replace_func)
-        fixed_content = apply_word_fixes_optimized(original_content, word_regex, word_replace_func)
-
-        processed_entry['original_author'] = original_author
-        processed_entry['fixed_author'] = fixed_author
-        processed_entry['original_content'] = original_content
-        processed_entry['fixed_content'] = fixed_content
-
-        if original_author != fixed_author or original_content != fixed_content:
-            made_change = True
-            fix_count += 1
-
-        processed_comments.append(processed_entry)
-
-    print(f"Applied potential word fixes to {fix_count} comments.")
-
-    # --- Write Processed Comment Data to Output File ---
-    print(f"\nWriting word-fixed results to '{OUTPUT_FILE}'...")
+    sample = []
     try:
-        with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-            f.write(f"# Word-fixed comment data generated on: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write(f"# Applied high-confidence word replacements (V3 Map).\n\n")
-
-            for entry in processed_comments:
-                 f.write(f"Comment ID: {entry['id']}\n")
-                 # f.write(f"Original Author: {entry.get('original_author', 'N/A')}\n")
-                 # f.write(f"Word Fixed Author: {entry.get('fixed_author', 'N/A')}\n")
-                 f.write(f"Original Content: {entry.get('original_content', 'N/A')}\n")
-                 f.write(f"Word Fixed Content: {entry.get('fixed_content', 'N/A')}\n")
-                 f.write("---\n")
-
-            print(f"Successfully saved word-fixed comment data to '{OUTPUT_FILE}'.")
-
-    except IOError as e:
+        with DumpWriter(OUTPUT_FILE, source=INPUT_FILE, applied="high-confidence word replacements (V3 Map)") as writer:
+            for batch in iter_batches(read_comments(INPUT_FILE), BATCH_SIZE):
+                fixed_authors = word_engine.apply_many(comment.get('author') for comment in batch)
+                fixed_contents = word_engine.apply_many(comment.get('content') for comment in batch)
+
+                for comment, fixed_author, fixed_content in zip(batch, fixed_authors, fixed_contents):
+                    original_author = comment.get('author')
+                    original_content = comment.get('content')
+                    made_change = original_author != fixed_author or original_content != fixed_content
+                    if made_change:
+                        fix_count += 1
+                        changes = {column: text_diff(original, fixed)
+                                   for column, original, fixed in (('author', original_author, fixed_author),
+                                                                   ('content', original_content, fixed_content))
+                                   if original != fixed}
+                        writer.write('comment', comment['id'], changes=changes)
+                    if len(sample) < SAMPLE_SIZE:
+                        sample.append((comment['id'], original_content, fixed_content, made_change))
+                comment_count += len(batch)
+        print(f"Applied potential word fixes to {fix_count} of {comment_count} comments.")
+        print(f"Successfully saved word-fixed comment data to '{OUTPUT_FILE}'.")
+
+    except OSError as e:
         print(f"Error writing to file '{OUTPUT_FILE}': {e}")
-    except Exception as e:
-        print(f"An unexpected error occurred during file writing: {e}")
 
     end_run_time = time.time()
     print(f"\nScript finished in {end_run_time - start_run_time:.2f} seconds.")
 
     # --- Optional: Print a sample comparison ---
-    if processed_comments:
+    if sample:
         print("\n--- Sample Comparison (First few comments) ---")
-        for i, entry in enumerate(processed_comments[:20]): # Show first 5
-             print(f"\nComment ID: {entry['id']}")
-             # print(f"Original Author:  {entry['original_author']}") # Uncomment to see author changes
-             # print(f"Word Fixed Author:{entry['fixed_author']}")
-             print(f"Original Content: {entry['original_content']}")
-             print(f"Word Fixed Content:{entry['fixed_content']}")
-             if entry['original_content'] != entry['fixed_content'] or entry.get('original_author') != entry.get('fixed_author'):
-                 print(" ^^^ Changes Applied ^^^")
\ No newline at end of file
+        for comment_id, original_content, fixed_content, made_change in sample:
+             print(f"\nComment ID: {comment_id}")
+             print(f"Original Content: {original_content}")
+             print(f"Word Fixed Content:{fixed_content}")
+             if made_change:
+                 print(" ^^^ Changes Applied ^^^")
@@ -0,0 +1,80 @@
+# turkish_dates.py
+# Parses the free-text dates scraped from the forum ("12 Mart 2008", "12.03.2008 14:32",
+# "Şubat 3, 2009 - 9:15 pm", ...) into timezone-aware datetimes.
+# Used by backfill_timestamps.py and any script that inserts comments or posts.
+import re
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+# The forum was Turkish; naive source times are Istanbul local time.
+SOURCE_TIMEZONE = ZoneInfo('Europe/Istanbul')
+
+# Month names are matched on their first three folded letters, which covers full
+# names, abbreviations and the English month names WordPress sometimes printed.
+MONTH_PREFIXES = {
+    'oca': 1, 'jan': 1,
+    'sub': 2, 'feb': 2,
+    'mar': 3,
+    'nis': 4, 'apr': 4,
+    'may': 5,
+    'haz': 6, 'jun': 6,
+    'tem': 7, 'jul': 7,
+    'agu': 8, 'aug': 8,
+    'eyl': 9, 'sep': 9,
+    'eki': 10, 'oct': 10,
+    'kas': 11, 'nov': 11,
+    'ara': 12, 'dec': 12,
+}
+_FOLD_TABLE = str.maketrans('İIıŞşĞğÜüÖöÇç', 'iiissgguuoocc')
+
+_NUMERIC_DATE_RE = re.compile(r'\b(\d{1,2})[./-](\d{1,2})[./-](\d{4})\b')
+_ISO_DATE_RE = re.compile(r'\b(\d{4})-(\d{1,2})-(\d{1,2})\b')
+_DAY_MONTH_YEAR_RE = re.compile(r'\b(\d{1,2})\.?\s+([a-z]+)\.?,?\s+(\d{4})\b')
+_MONTH_DAY_YEAR_RE = re.compile(r'\b([a-z]+)\.?\s+(\d{1,2})(?:st|nd|rd|th)?,?\s+(\d{4})\b')
+_TIME_RE = re.compile(r'\b(\d{1,2})[:.](\d{2})(?:[:.](\d{2}))?\s*(am|pm|öö|ös|oo|os)?\b')
+
+def _month_number(name):
+    return MONTH_PREFIXES.get(name[:3])
+
+def _parse_date_part(text):
+    """Returns (year, month, day, span) for the first recognisable date in folded text."""
+    match = _ISO_DATE_RE.search(text)
+    if match:
+        return int(match.group(1)), int(match.group(2)), int(match.group(3)), match.span()
+    match = _NUMERIC_DATE_RE.search(text)
+    if match:
+        return int(match.group(3)), int(match.group(2)), int(match.group(1)), match.span()
+    for match in _DAY_MONTH_YEAR_RE.finditer(text):
+        month = _month_number(match.group(2))
+        if month: return int(match.group(3)), month, int(match.group(1)), match.span()
+    for match in _MONTH_DAY_YEAR_RE.finditer(text):
+        month = _month_number(match.group(1))
+        if month: return int(match.group(3)), month, int(match.group(2)), match.span()
+    return None
+
+def _parse_time_part(text):
+    """Returns (hour, minute, second) for the first time in the text, or midnight."""
+    match = _TIME_RE.search(text)
+    if not match: return 0, 0, 0
+    hour, minute, second = int(match.group(1)), int(match.group(2)), int(match.group(3) or 0)
+    suffix = match.group(4)
+    # Turkish ÖÖ/ÖS (öğleden önce/sonra) fold to oo/os when they come from the date string
+    if suffix in ('pm', 'ös', 'os') and hour < 12: hour += 12
+    elif suffix in ('am', 'öö', 'oo') and hour == 12: hour = 0
+    return hour, minute, second
+
+def parse_turkish_datetime(date_text, time_text=None):
+    """Parses a source date (and optional separate time) string; returns None if unparseable."""
+    if not date_text: return None
+    text = date_text.translate(_FOLD_TABLE).lower()
+    date_part = _parse_date_part(text)
+    if date_part is None: return None
+    year, month, day, (start, end) = date_part
+
+    # Time comes from the separate column when given, else from the rest of the date string
+    time_source = time_text.lower() if time_text else text[:start] + ' ' + text[end:]
+    hour, minute, second = _parse_time_part(time_source)
+    try:
+        return datetime(year, month, day, hour, minute, second, tzinfo=SOURCE_TIMEZONE)
+    except ValueError:
+        return None
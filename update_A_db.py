@@ -1,9 +1,15 @@
-import re
 import os
 import sys
 import psycopg2 # Ensure this is installed: pip install psycopg2-binary
 from dotenv import load_dotenv
 import time
+import traceback
+
+from archive_version import bump_archive_version
+from change_journal import ChangeJournal
+from garble_flags import candidate_where, garble_flags_of
+from repair_jobs import RepairJob
+from mojibake_repair import RoundTripRepairer, get_word_engine, train_model_from_db
 
 # --- Load Environment Variables ---
 load_dotenv()
@@ -46,8 +52,11 @@ WORD_REPLACEMENT_MAP = {
     # --- Add more pairs using the GARBLED characters as keys ---
 }
 
-# --- Optional: Log file for changes ---
-LOG_FILE = 'db_comment_update_log.txt'
+# Rows per keyset batch (one COPY + UPDATE ... FROM and one checkpoint per batch)
+WRITE_BATCH_SIZE = 5000
+
+# Changed spans are journaled to repair_journals/ (change_journal.py); revert a run with
+#   python change_journal.py undo <journal>
 
 # --- Functions ---
 
@@ -67,68 +76,39 @@ def connect_db():
         print(f"Database connection failed with an unexpected error: {e}")
         return None # Return None
 
-def fetch_comments_to_fix(conn):
-    """Fetches comments containing the GARBLED_CHAR in author or content."""
-    results = []
-    cursor = None
-    print(f"Searching for comments with garbled character '{GARBLED_CHAR}'...")
+def comment_candidate_where(conn):
+    """(SQL condition, params) for comments containing the GARBLED_CHAR in author or content.
+
+    Uses the garble_flags dirty set once classify_garble.py has run, LIKE scans until then.
+    """
     like_pattern = f'%{GARBLED_CHAR}%'
+    return candidate_where(conn, COMMENTS_TABLE, garble_flags_of(GARBLED_CHAR),
+                           f"{COMMENT_AUTHOR_COLUMN} LIKE %s OR {COMMENT_CONTENT_COLUMN} LIKE %s",
+                           [like_pattern, like_pattern])
 
+def count_comments_to_fix(conn):
+    """Counts candidate comments (rows are streamed in batches later, not fetched here)."""
+    print(f"Searching for comments with garbled character '{GARBLED_CHAR}'...")
+    where_sql, params = comment_candidate_where(conn)
     try:
-        cursor = conn.cursor()
-        # Fetch ID, Author, Content for potential candidates
-        comment_query = f"""
-            SELECT {COMMENT_ID_COLUMN}, {COMMENT_AUTHOR_COLUMN}, {COMMENT_CONTENT_COLUMN}
-            FROM {COMMENTS_TABLE}
-            WHERE {COMMENT_AUTHOR_COLUMN} LIKE %s OR {COMMENT_CONTENT_COLUMN} LIKE %s
-            ORDER BY {COMMENT_ID_COLUMN};
-        """
-        cursor.execute(comment_query, (like_pattern, like_pattern))
-        results = cursor.fetchall() # Fetch all matching rows
-        if results:
-             print(f"Found {len(results)} potentially corrupted comments to process.")
+        with conn.cursor() as cursor:
+            cursor.execute(f"SELECT count(*) FROM {COMMENTS_TABLE} WHERE {where_sql}", params)
+            count = cursor.fetchone()[0]
+        conn.commit()
+        if count:
+            print(f"Found {count} potentially corrupted comments to process.")
         else:
             print("No potentially corrupted comments found matching the criteria.")
-        return results
-
+        return count
     except psycopg2.Error as e:
         print(f"Database query failed: {e}")
+        conn.rollback()
         return None # Indicate failure
-    except Exception as e:
-        print(f"An unexpected error occurred during query execution: {e}")
-        return None
-    finally:
-        if cursor:
-            cursor.close()
 
 def build_regex_and_replace_func(word_map):
-    """Builds regex and case-preserving replace function (from your script)."""
-    # Use \b word boundaries for safer replacement
-    pattern = r'\b(' + '|'.join(re.escape(key) for key in word_map.keys()) + r')\b'
-    regex = re.compile(pattern, re.IGNORECASE | re.UNICODE)
-
-    def replace_func(match):
-        matched_word = match.group(1)
-        found_key = None
-        # Case-insensitive lookup in the map
-        for key in word_map.keys():
-            if matched_word.lower() == key.lower():
-                found_key = key
-                break
-        if found_key is None:
-            # print(f"Debug: No map key found for matched word '{matched_word}'") # Optional debug
-            return matched_word # Return original if no key matches (e.g., substring match prevented by \b)
-
-        replacement = word_map[found_key]
-
-        # Preserve case
-        if matched_word.istitle():
-            return replacement.title()
-        elif matched_word.isupper():
-            return replacement.upper()
-        else:
-             return replacement
-    return regex, replace_func
+    """Returns the trie regex and case-preserving replace function of the shared word engine."""
+    engine = get_word_engine(word_map)
+    return engine.regex, engine.replace_match
 
 def apply_word_fixes_optimized(text, regex, replace_func):
     """Applies replacements using pre-compiled regex and function."""
@@ -142,59 +122,46 @@ def apply_word_fixes_optimized(text, regex, replace_func):
 # --- Main Execution Block ---
 if __name__ == "__main__":
     start_run_time = time.time()
-
-    # Pre-compile regex and replacement function for efficiency
-    word_regex, word_replace_func = build_regex_and_replace_func(WORD_REPLACEMENT_MAP)
+    # The pass resumes from its checkpoint (repair_jobs.py); --restart starts it over
+    restart = '--restart' in sys.argv[1:]
+    # Round-trip repair runs first and the word map handles the rest; --maps-only skips it
+    maps_only = '--maps-only' in sys.argv[1:]
+
+    # Pre-compile the word repair engine (trie regex + folded lookup) once
+    word_engine = get_word_engine(WORD_REPLACEMENT_MAP)
+    repairer = None # RoundTripRepairer with the word engine as fallback, built once connected
+
+    def fix_batch(rows):
+        """Returns (id, fixed_author, fixed_content) for the rows that changed."""
+        fix_texts = repairer.repair_many if repairer is not None else word_engine.apply_many
+        fixed_authors = fix_texts(row[1] for row in rows)
+        fixed_contents = fix_texts(row[2] for row in rows)
+        return [(comment_id, fixed_author, fixed_content)
+                for (comment_id, original_author, original_content), fixed_author, fixed_content
+                in zip(rows, fixed_authors, fixed_contents)
+                if original_author != fixed_author or original_content != fixed_content]
 
     conn = None
-    processed_log = [] # To store details for the log file
-
+    job_started = False
+    result = None
     try:
         conn = connect_db()
         if not conn:
             sys.exit(1) # Exit if connection failed
 
-        comments_to_process = fetch_comments_to_fix(conn)
-
-        if not comments_to_process:
+        candidate_count = count_comments_to_fix(conn)
+        if not candidate_count:
             print("No comments requiring fixes were found.")
             sys.exit(0)
-
-        # --- Prepare for Updates ---
-        updates_to_make = [] # Store tuples of (id, fixed_author, fixed_content)
-        potential_fix_count = 0
-
-        print("\nApplying word fixes in memory...")
-        for comment_id, original_author, original_content in comments_to_process:
-            fixed_author = apply_word_fixes_optimized(original_author, word_regex, word_replace_func)
-            fixed_content = apply_word_fixes_optimized(original_content, word_regex, word_replace_func)
-
-            log_entry = {
-                'id': comment_id,
-                'original_author': original_author, 'fixed_author': fixed_author,
-                'original_content': original_content, 'fixed_content': fixed_content,
-                'change_made': False
-            }
-
-            # Check if any actual change was made
-            if original_author != fixed_author or original_content != fixed_content:
-                updates_to_make.append((comment_id, fixed_author, fixed_content))
-                log_entry['change_made'] = True
-                potential_fix_count += 1
-
-            processed_log.append(log_entry)
-
-        print(f"Identified {potential_fix_count} comments with potential changes to apply.")
-
-        if not updates_to_make:
-            print("No actual changes needed after applying fixes.")
-            sys.exit(0)
+        if not maps_only:
+            repairer = RoundTripRepairer(train_model_from_db(conn), fallback=word_engine)
 
         # --- User Confirmation ---
         print("\n" + "="*30)
         print("      !!! WARNING !!!")
         print("This script will modify your database.")
-        print(f"Attempting to UPDATE {potential_fix_count} rows in the '{COMMENTS_TABLE}' table.")
+        print(f"Checking up to {candidate_count} rows of the '{COMMENTS_TABLE}' table and updating those that change.")
+        print("Each batch is committed as it completes; re-run the script to resume after an interruption.")
         print("MAKE SURE YOU HAVE A DATABASE BACKUP!")
         print("="*30 + "\n")
         proceed = input("Proceed with database update? (yes/no): ").strip().lower()
@@ -205,64 +172,29 @@ if __name__ == "__main__":
 
         # --- Perform Database Updates ---
         print("\n--- Starting Database Update ---")
-        cursor = None
-        updated_count = 0
-        failed_count = 0
-        try:
-            cursor = conn.cursor()
-            # Prepare SQL Statement (Uses %s for psycopg2 placeholders)
-            sql_update = f"""
-                UPDATE {COMMENTS_TABLE}
-                SET {COMMENT_AUTHOR_COLUMN} = %s,
-                    {COMMENT_CONTENT_COLUMN} = %s
-                WHERE {COMMENT_ID_COLUMN} = %s
-            """
-            print(f"Executing UPDATE statements...")
-
-            for comment_id, fixed_author, fixed_content in updates_to_make:
-                try:
-                    # Order of params must match SET columns, then WHERE column
-                    params = (fixed_author, fixed_content, comment_id)
-                    cursor.execute(sql_update, params)
-                    # Check if the update affected a row
-                    if cursor.rowcount > 0:
-                        updated_count += 1
-                        # print(f"  Successfully updated comment ID: {comment_id}") # Verbose logging
-                    else:
-                         print(f"  Warning: Update for comment ID {comment_id} affected 0 rows (ID might not exist?).")
-                         failed_count += 1
-                except psycopg2.Error as db_error:
-                    print(f"  Error updating comment ID {comment_id}: {db_error}")
-                    conn.rollback() # Rollback immediately on error within the loop
-                    failed_count += 1
-                    print("Rolled back transaction due to error.")
-                    break # Stop processing further updates on error
-                except Exception as e:
-                    print(f"  Unexpected error updating comment ID {comment_id}: {e}")
-                    conn.rollback() # Rollback immediately
-                    failed_count += 1
-                    print("Rolled back transaction due to unexpected error.")
-                    break # Stop processing
-
-            # Commit only if the loop completed without breaking due to errors
-            if failed_count == 0:
-                print("\nAttempting to commit changes...")
-                conn.commit()
-                print("Database changes committed successfully.")
-            else:
-                print(f"\nDatabase update finished with {failed_count} errors. Changes were rolled back.")
-
-        except Exception as e:
-            print(f"\nAn overall error occurred during database update phase: {e}")
-            if conn:
-                print("Rolling back any potential partial changes.")
-                conn.rollback()
-        finally:
-            if cursor:
-                cursor.close()
+        where_sql, params = comment_candidate_where(conn)
+        # Author and content are written together (COPY + UPDATE ... FROM, bulk_writer.py)
+        job = RepairJob(conn, f"update_A_db:{COMMENTS_TABLE}", COMMENTS_TABLE, COMMENT_ID_COLUMN,
+                        [COMMENT_AUTHOR_COLUMN, COMMENT_CONTENT_COLUMN], where_sql, params,
+                        batch_size=WRITE_BATCH_SIZE)
+        journal = ChangeJournal.for_run(job.job_name, COMMENTS_TABLE, COMMENT_ID_COLUMN,
+                                        [COMMENT_AUTHOR_COLUMN, COMMENT_CONTENT_COLUMN])
+        print(f"Journaling changes to '{journal.path}' as batches commit...")
+        with journal:
+            job_started = True
+            result = job.run(fix_batch, restart=restart, journal=journal)
+
+        if repairer is not None: print(repairer.report())
+        print(journal.report())
+        if result['status'] == 'done':
+            print("Database changes committed successfully.")
+        else:
+            print(f"\nDatabase update stopped ({result['status']}); committed batches are kept. Re-run to resume.")
 
+    except KeyboardInterrupt:
+        print("\nStopped. Committed batches are kept; re-run the script to resume.")
     except Exception as e:
-        # Catch errors during connection, fetching, or processing phases
+        # Catch errors during connection, counting, or processing phases
         print(f"\nAn unexpected error occurred: {e}")
         traceback.print_exc() # Print full traceback for debugging
         if conn: # Attempt rollback if connection existed
@@ -273,30 +205,11 @@ if __name__ == "__main__":
             conn.close()
             print("\nDatabase connection closed.")
 
-    # --- Write Log File ---
-    print(f"\nWriting processing log to '{LOG_FILE}'...")
-    try:
-        with open(LOG_FILE, 'w', encoding='utf-8') as f:
-            f.write(f"# Comment Update Log - {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write(f"# Searched for comments containing: '{GARBLED_CHAR}'\n")
-            f.write(f"# Database Update Summary: Attempted={potential_fix_count}, Succeeded={updated_count}, Failed/RolledBack={failed_count}\n\n")
-
-            for entry in processed_log:
-                 f.write(f"Comment ID: {entry['id']}\n")
-                 f.write(f"Change Applied: {'Yes' if entry['change_made'] else 'No'}\n")
-                 f.write(f"Original Author : {entry.get('original_author', 'N/A')}\n")
-                 if entry['change_made']:
-                     f.write(f"Fixed Author    : {entry.get('fixed_author', 'N/A')}\n")
-                 f.write(f"Original Content: {entry.get('original_content', 'N/A')}\n")
-                 if entry['change_made']:
-                    f.write(f"Fixed Content   : {entry.get('fixed_content', 'N/A')}\n")
-                 f.write("---\n")
-            print(f"Successfully saved processing log to '{LOG_FILE}'.")
-    except IOError as e:
-        print(f"Error writing log file '{LOG_FILE}': {e}")
-    except Exception as e:
-        print(f"An unexpected error occurred during log file writing: {e}")
-
+    # A run that was interrupted (no result) may have committed batches too
+    if job_started and (result is None or result['updated']):
+        bump_archive_version("update_A_db: comments.author/content")
+    if result:
+        print(f"Database Update Summary (this run): Checked={result['checked']}, Updated={result['updated']}, Batches={result['batches']}")
 
     end_run_time = time.time()
-    print(f"\nScript finished in {end_run_time - start_run_time:.2f} seconds.")
\ No newline at end of file
+    print(f"\nScript finished in {end_run_time - start_run_time:.2f} seconds.")
@@ -0,0 +1,289 @@
+# wayback_fetch.py
+# Downloads the Wayback Machine snapshots (posts.wayback_url) that re_extract_comments.py
+# parses, concurrently and politely, into a local cache.
+#   python wayback_fetch.py [--ids missing_comment_post_ids.txt] [--concurrency 8] [--rate 2]
+#   python wayback_fetch.py --where "comment_count = 0"
+#   python wayback_fetch.py --url-template "http://127.0.0.1:8000/{post_id}"   (no database; see wayback_stub_server.py)
+#
+# 1. One httpx.AsyncClient keeps the connections alive; a semaphore bounds the requests
+#    in flight and a per-host limiter spaces their starts (--rate requests/s per host).
+#    429, 5xx, timeouts and connection errors are retried with exponential backoff
+#    (Retry-After is honoured up to BACKOFF_MAX); other 4xx answers are final, and so are
+#    errors a retry cannot fix (unsupported scheme, bad URL, too many redirects).
+# 2. Bodies are stored gzip-compressed under <cache>/objects/<sha256 of body>, so identical
+#    pages are stored once; <cache>/urls/<sha256 of url>.json maps each URL to its body
+#    and records final failures. Both are written to a temp file and renamed into place.
+# 3. Each post gets <snapshot dir>/<post id>.html.gz, a hard link to its cached body,
+#    which is the layout re_extract_comments.py reads.
+# Re-runs answer every cached URL (and every final 404) from disk without a request.
+import os
+import sys
+import json
+import gzip
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+from urllib.parse import urlsplit
+
+import httpx
+from dotenv import load_dotenv
+
+# --- Configuration ---
+load_dotenv()
+DATABASE_URL = os.getenv('DATABASE_URL')
+CACHE_DIR = os.getenv('WAYBACK_CACHE_DIR', 'wayback_cache')
+SNAPSHOT_DIR = os.getenv('WAYBACK_SNAPSHOT_DIR', 'wayback_snapshots') # Same default as re_extract_comments.py
+ID_FILE = 'missing_comment_post_ids.txt'
+USER_AGENT = 'forum-archive-restore/1.0 (snapshot re-fetch)'
+MAX_RETRIES = 5
+BACKOFF_BASE = 2.0  # Seconds; doubled per attempt, plus jitter
+BACKOFF_MAX = 120.0
+TIMEOUT = 60.0
+RETRY_STATUSES = {429, 500, 502, 503, 504, 520, 521, 522, 523, 524}
+# Transport failures worth another attempt; UnsupportedProtocol, LocalProtocolError etc. are not
+RETRY_ERRORS = (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError)
+
+# --- Cache ---
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+class SnapshotCache:
+    """Content-addressed, gzip-compressed store of fetched pages, keyed by URL."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def _url_path(self, url):
+        digest = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.root, 'urls', digest[:2], digest + '.json')
+
+    def object_path(self, digest):
+        return os.path.join(self.root, 'objects', digest[:2], digest + '.html.gz')
+
+    def lookup(self, url):
+        """The URL's cache entry ({'url', 'status', 'digest', ...}) or None."""
+        try:
+            with open(self._url_path(url), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        if entry.get('digest') and not os.path.exists(self.object_path(entry['digest'])):
+            return None # Body was removed; fetch again
+        return entry
+
+    def store(self, url, status, body=None, content_type=None):
+        """Saves a body (once per distinct content) and the URL's entry; returns the entry."""
+        entry = {'url': url, 'status': status, 'fetched_at': time.strftime('%Y-%m-%d %H:%M:%S')}
+        if body is not None:
+            digest = hashlib.sha256(body).hexdigest()
+            path = self.object_path(digest)
+            if not os.path.exists(path):
+                _write_atomic(path, gzip.compress(body, compresslevel=6, mtime=0))
+            entry.update(digest=digest, bytes=len(body), content_type=content_type)
+        _write_atomic(self._url_path(url), json.dumps(entry, ensure_ascii=False).encode('utf-8'))
+        return entry
+
+    def read(self, entry):
+        with open(self.object_path(entry['digest']), 'rb') as f:
+            return gzip.decompress(f.read())
+
+def link_snapshot(cache, entry, snapshot_dir, post_id):
+    """Makes <snapshot_dir>/<post_id>.html.gz point at the cached body (hard link, else copy)."""
+    target = os.path.join(snapshot_dir, f"{post_id}.html.gz")
+    source = cache.object_path(entry['digest'])
+    if os.path.exists(target):
+        if os.path.samefile(source, target): return
+        os.remove(target) # Older snapshot of this post
+    os.makedirs(snapshot_dir, exist_ok=True)
+    try:
+        os.link(source, target)
+    except OSError: # Other filesystem, or no hard links
+        with open(source, 'rb') as f:
+            _write_atomic(target, f.read())
+
+# --- Fetching ---
+class HostRateLimiter:
+    """Spaces request starts to at most `rate` per second for each host."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_start = {}
+        self._locks = {}
+
+    async def wait(self, host):
+        if not self.interval: return
+        lock = self._locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            now = time.monotonic()
+            start = max(now, self._next_start.get(host, now))
+            self._next_start[host] = start + self.interval
+        if start > now: await asyncio.sleep(start - now)
+
+    def slow_down(self, host, seconds):
+        """Pushes the host's next start back (after a 429 / Retry-After)."""
+        self._next_start[host] = max(self._next_start.get(host, 0.0), time.monotonic() + seconds)
+
+def _retry_after(response):
+    """Retry-After in seconds, capped at BACKOFF_MAX so one answer cannot stall the run."""
+    value = response.headers.get('retry-after', '')
+    return min(float(value), BACKOFF_MAX) if value.isdigit() else None
+
+def _backoff(attempt):
+    return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * (0.5 + random.random() / 2)
+
+class Fetcher:
+    def __init__(self, client, cache, concurrency, rate, max_retries=MAX_RETRIES):
+        self.client = client
+        self.cache = cache
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.limiter = HostRateLimiter(rate)
+        self.max_retries = max_retries
+        self.stats = {'cached': 0, 'fetched': 0, 'not_found': 0, 'failed': 0,
+                      'requests': 0, 'retries': 0, 'bytes': 0}
+
+    async def fetch(self, url, refetch_missing=False):
+        """Cache entry for the URL, from disk if possible; None if it could not be fetched."""
+        entry = self.cache.lookup(url)
+        if entry is not None and (entry.get('digest') or not refetch_missing):
+            self.stats['cached' if entry.get('digest') else 'not_found'] += 1
+            return entry
+
+        host = urlsplit(url).hostname or ''
+        async with self.semaphore:
+            for attempt in range(self.max_retries + 1):
+                await self.limiter.wait(host)
+                self.stats['requests'] += 1
+                delay = None
+                try:
+                    response = await self.client.get(url)
+                except RETRY_ERRORS as e:
+                    error = f"{type(e).__name__}: {e}"
+                except (httpx.HTTPError, httpx.InvalidURL) as e:
+                    self.stats['failed'] += 1
+                    print(f"  Giving up on {url} ({type(e).__name__}: {e})")
+                    return None
+                else:
+                    if response.status_code == 200:
+                        self.stats['fetched'] += 1
+                        self.stats['bytes'] += len(response.content)
+                        return self.cache.store(url, 200, response.content, response.headers.get('content-type'))
+                    if response.status_code not in RETRY_STATUSES:
+                        # Final answer (404 etc.): cached so re-runs do not ask again
+                        self.stats['not_found'] += 1
+                        return self.cache.store(url, response.status_code)
+                    error = f"HTTP {response.status_code}"
+                    delay = _retry_after(response)
+                    if response.status_code == 429:
+                        self.limiter.slow_down(host, delay or _backoff(attempt))
+                if attempt < self.max_retries:
+                    self.stats['retries'] += 1
+                    await asyncio.sleep(delay if delay is not None else _backoff(attempt))
+        self.stats['failed'] += 1
+        print(f"  Giving up on {url} after {self.max_retries + 1} attempts ({error})")
+        return None
+
+async def fetch_all(targets, cache, snapshot_dir, concurrency, rate, refetch_missing=False):
+    """Fetches (post_id, url) targets; links each fetched post into snapshot_dir."""
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    headers = {'User-Agent': USER_AGENT}
+    start = time.time()
+    async with httpx.AsyncClient(limits=limits, headers=headers, timeout=TIMEOUT, follow_redirects=True) as client:
+        fetcher = Fetcher(client, cache, concurrency, rate)
+
+        async def fetch_one(post_id, url):
+            # One post's disk error (full cache disk, unwritable snapshot dir) must not
+            # cancel the rest of the window
+            try:
+                entry = await fetcher.fetch(url, refetch_missing)
+                if entry and entry.get('digest'):
+                    link_snapshot(cache, entry, snapshot_dir, post_id)
+                return entry
+            except OSError as e:
+                fetcher.stats['failed'] += 1
+                print(f"  Post {post_id}: could not store {url} ({e})")
+                return None
+
+        # Tasks are created in windows so a huge id list does not sit in memory as coroutines
+        window = max(concurrency * 50, 100)
+        done = 0
+        for offset in range(0, len(targets), window):
+            batch = targets[offset:offset + window]
+            results = await asyncio.gather(*(fetch_one(post_id, url) for post_id, url in batch), return_exceptions=True)
+            for (post_id, url), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    fetcher.stats['failed'] += 1
+                    print(f"  Post {post_id}: {url} failed ({type(result).__name__}: {result})")
+            done += len(batch)
+            elapsed = time.time() - start
+            print(f"  {done}/{len(targets)} posts ({fetcher.stats['fetched']} fetched, {fetcher.stats['cached']} cached, "
+                  f"{fetcher.stats['failed']} failed; {fetcher.stats['requests'] / max(elapsed, 1e-9):.1f} requests/s)")
+    fetcher.stats['seconds'] = time.time() - start
+    return fetcher.stats
+
+# --- Targets ---
+def read_ids(filename):
+    with open(filename, 'r', encoding='utf-8') as f:
+        return [int(line) for line in (line.strip() for line in f) if line.isdigit()]
+
+def targets_from_db(post_ids=None, where=None):
+    """(post_id, wayback_url) pairs for the given ids, or for the posts matching a WHERE clause."""
+    import psycopg2
+    conn = psycopg2.connect(DATABASE_URL)
+    try:
+        with conn.cursor() as cursor:
+            if where:
+                cursor.execute(f"SELECT id, wayback_url FROM posts WHERE wayback_url IS NOT NULL AND ({where}) ORDER BY id")
+            else:
+                cursor.execute("SELECT id, wayback_url FROM posts WHERE wayback_url IS NOT NULL AND id = ANY(%s) ORDER BY id",
+                               (post_ids,))
+            return [(post_id, url.strip()) for post_id, url in cursor.fetchall() if url.strip()]
+    finally:
+        conn.close()
+
+# --- Main Execution ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fetch Wayback snapshots of posts into a local compressed cache.")
+    parser.add_argument('--ids', default=ID_FILE, help="File with one post id per line")
+    parser.add_argument('--where', help="SQL condition on posts selecting the posts to fetch, instead of --ids")
+    parser.add_argument('--url-template', help="Build URLs as TEMPLATE.format(post_id=...) instead of reading posts.wayback_url")
+    parser.add_argument('--cache', default=CACHE_DIR)
+    parser.add_argument('--snapshots', default=SNAPSHOT_DIR, help="Where <post id>.html.gz links are made")
+    parser.add_argument('--concurrency', type=int, default=8, help="Requests in flight")
+    parser.add_argument('--rate', type=float, default=2.0, help="Request starts per second per host (0: unlimited)")
+    parser.add_argument('--refetch-missing', action='store_true', help="Ask again for URLs that answered 404/410 before")
+    parser.add_argument('--limit', type=int, help="Only the first N posts")
+    args = parser.parse_args()
+
+    if args.url_template:
+        targets = [(post_id, args.url_template.format(post_id=post_id)) for post_id in read_ids(args.ids)]
+    else:
+        if not DATABASE_URL:
+            print("Error: DATABASE_URL environment variable not set.")
+            sys.exit(1)
+        targets = targets_from_db(where=args.where) if args.where else targets_from_db(post_ids=read_ids(args.ids))
+    if args.limit: targets = targets[:args.limit]
+    print(f"{len(targets)} posts to fetch into '{args.cache}' (snapshots in '{args.snapshots}'), "
+          f"{args.concurrency} concurrent, {args.rate} requests/s per host.")
+
+    stats = None
+    try:
+        stats = asyncio.run(fetch_all(targets, SnapshotCache(args.cache), args.snapshots,
+                                      args.concurrency, args.rate, args.refetch_missing))
+    except KeyboardInterrupt:
+        print("\nInterrupted; everything fetched so far is cached. Re-run to continue.")
+
+    if stats:
+        elapsed = max(stats['seconds'], 1e-9)
+        print("\n" + "=" * 60)
+        print(f"Fetched {stats['fetched']} ({stats['bytes'] / (1024 * 1024):.1f} MB), from cache {stats['cached']}, "
+              f"not found {stats['not_found']}, failed {stats['failed']}")
+        print(f"{stats['requests']} requests ({stats['retries']} retries) in {elapsed:.1f}s: "
+              f"{stats['requests'] / elapsed:.1f} requests/s, {len(targets) / elapsed:.0f} posts/s")
+        print("=" * 60)
+        if stats['failed']: print("Re-run to retry the failed URLs.")
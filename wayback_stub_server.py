@@ -0,0 +1,97 @@
+# wayback_stub_server.py
+# Local stand-in for the Wayback Machine, to exercise wayback_fetch.py (retries, backoff,
+# final failures, the cache and its deduplication) without network access or a database.
+#   python wayback_stub_server.py [--port 8000] [--retry-after 2]
+#   python wayback_fetch.py --ids missing_comment_post_ids.txt --rate 0 \
+#       --url-template "http://127.0.0.1:8000/{post_id}" --cache /tmp/wb_cache --snapshots /tmp/wb_snapshots
+#
+# GET /<post id> answers by the id's last digit; every behaviour is per id, so a re-run
+# of wayback_fetch.py must answer all of them from its cache without a request:
+#   0     404 Not Found (final, cached as not found)
+#   1     503 on the first request, then the page (retried with backoff)
+#   2     429 with Retry-After: --retry-after on the first request, then the page
+#   3     a page identical for every id ending in 3 (stored once in the cache)
+#   4     the connection is closed without an answer on the first request (transport error)
+#   5-9   the page
+# Pages use the WordPress comment markup re_extract_comments.py parses, so the fetched
+# snapshots can be fed to it as well. Request counts are printed on Ctrl-C.
+import sys
+import argparse
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Post {post_id}</title></head>
+<body><h1>Post {post_id}</h1>
+<ol class="commentlist">
+<li class="comment" id="li-comment-{comment_id}">
+  <div id="div-comment-{comment_id}">
+    <div class="comment-author"><cite class="fn">stub_user</cite></div>
+    <div class="comment-meta">12 Mart 2008 at 14:32</div>
+    <p>Post {post_id} i&ccedil;in deneme yorumu.</p>
+  </div>
+</li>
+</ol>
+</body></html>
+"""
+SHARED_POST_ID = 3 # Ids ending in 3 all get this post's page
+
+class StubHandler(BaseHTTPRequestHandler):
+    requests_seen = Counter() # path -> requests so far
+    lock = threading.Lock()
+    retry_after = 2
+
+    def do_GET(self):
+        post_id = self.path.strip('/')
+        if not post_id.isdigit():
+            self.send_error(400, "Expected /<post id>")
+            return
+        with self.lock:
+            self.requests_seen[self.path] += 1
+            first = self.requests_seen[self.path] == 1
+        kind = int(post_id) % 10
+        if kind == 0:
+            self.send_error(404)
+        elif kind == 1 and first:
+            self.send_error(503)
+        elif kind == 2 and first:
+            self.send_response(429)
+            self.send_header('Retry-After', str(self.retry_after))
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        elif kind == 4 and first:
+            self.close_connection = True # No status line at all
+        else:
+            page_id = SHARED_POST_ID if kind == 3 else int(post_id)
+            body = PAGE_TEMPLATE.format(post_id=page_id, comment_id=page_id * 10).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # The summary on exit is enough
+
+# --- Main Execution ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve fake Wayback snapshots for testing wayback_fetch.py.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--retry-after', type=int, default=2, help="Retry-After seconds sent with the 429s")
+    args = parser.parse_args()
+
+    StubHandler.retry_after = args.retry_after
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    print(f"Stub Wayback server on http://{args.host}:{args.port}/<post id> (Ctrl-C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        seen = StubHandler.requests_seen
+        print(f"\n{sum(seen.values())} requests for {len(seen)} paths; "
+              f"{sum(1 for count in seen.values() if count > 1)} paths were asked more than once.")
+    sys.exit(0)